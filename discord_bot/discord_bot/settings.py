@@ -39,6 +39,52 @@ MUSIC_CHANNEL = env.int("MUSIC_CHANNEL")
 HALLOWEEN_CHANNEL = env.str("HALLOWEEN_CHANNEL")
 YT_API_KEY = env.str("YT_API_KEY")
 DISCORD_TOKEN = env.str("DISCORD_TOKEN")
+# Sharding of shard_launcher.py, unset asks Discord for the shard count and starts a process per CPU.
+BOT_SHARD_COUNT = env.int("BOT_SHARD_COUNT", None)
+BOT_SHARD_PROCESSES = env.int("BOT_SHARD_PROCESSES", None)
+
+# Music bot tuning, every value has a sane default so they are optional in the .env
+# Resolved audio urls expire a few hours after extraction, the margin is in seconds.
+YT_STREAM_CACHE_SIZE = env.int("YT_STREAM_CACHE_SIZE", 256)
+YT_STREAM_CACHE_MARGIN = env.int("YT_STREAM_CACHE_MARGIN", 600)
+# Seconds a text search keeps resolving to the same video before Youtube is searched again.
+YT_SEARCH_CACHE_TTL = env.int("YT_SEARCH_CACHE_TTL", 30 * 24 * 3600)
+# How many queued songs get their audio source resolved ahead of playback.
+MUSIC_PREFETCH_LOOKAHEAD = env.int("MUSIC_PREFETCH_LOOKAHEAD", 2)
+MUSIC_PREFETCH_CONCURRENCY = env.int("MUSIC_PREFETCH_CONCURRENCY", 2)
+# Songs whose title and duration are fetched with yt-dlp at the same time for the queue command.
+MUSIC_HYDRATION_CONCURRENCY = env.int("MUSIC_HYDRATION_CONCURRENCY", 4)
+# Songs of a playlist loaded at a time, the rest is loaded as playback gets close to it.
+MUSIC_PLAYLIST_WINDOW = env.int("MUSIC_PLAYLIST_WINDOW", 200)
+# Seed of the shuffle command, unset for a different order every time.
+MUSIC_SHUFFLE_SEED = env.int("MUSIC_SHUFFLE_SEED", None)
+# Music text channel of each guild as "guild_id=channel_id,...", the guilds missing here use MUSIC_CHANNEL.
+MUSIC_CHANNELS = env.dict("MUSIC_CHANNELS", {}, subcast_keys=int, subcast_values=int)
+# Seconds a guild goes without commands or playback before its player is dropped.
+MUSIC_PLAYER_IDLE_TIMEOUT = env.int("MUSIC_PLAYER_IDLE_TIMEOUT", 15 * 60)
+# Seconds between the writes of the changed queues to the database, 0 turns the queue snapshots off.
+MUSIC_QUEUE_SNAPSHOT_INTERVAL = env.float("MUSIC_QUEUE_SNAPSHOT_INTERVAL", 5.0)
+# 0 runs yt-dlp in threads, a positive number runs it in that many worker processes.
+YTDL_PROCESS_WORKERS = env.int("YTDL_PROCESS_WORKERS", 0)
+YTDL_EXTRACTION_TIMEOUT = env.float("YTDL_EXTRACTION_TIMEOUT", 60.0)
+# Seconds a song may take to resolve across every attempt and retry.
+YTDL_EXTRACTION_DEADLINE = env.float("YTDL_EXTRACTION_DEADLINE", 90.0)
+# Start a second attempt when an extraction is slower than this latency percentile, 0 disables it.
+YTDL_HEDGE_PERCENTILE = env.float("YTDL_HEDGE_PERCENTILE", 95.0)
+# Stop extracting for a cooldown once this share of the recent extractions failed.
+YTDL_BREAKER_ERROR_RATE = env.float("YTDL_BREAKER_ERROR_RATE", 0.5)
+YTDL_BREAKER_MIN_CALLS = env.int("YTDL_BREAKER_MIN_CALLS", 10)
+YTDL_BREAKER_COOLDOWN = env.float("YTDL_BREAKER_COOLDOWN", 60.0)
+# Seconds and retries of every request to the Youtube Data API.
+YT_API_TIMEOUT = env.float("YT_API_TIMEOUT", 10.0)
+YT_API_RETRIES = env.int("YT_API_RETRIES", 3)
+# videos.list requests of 50 ids sent at the same time when loading a playlist.
+YT_API_CONCURRENCY = env.int("YT_API_CONCURRENCY", 4)
+# Seconds a cached playlist is used without asking the Data API if it changed.
+YT_PLAYLIST_CACHE_FRESHNESS = env.int("YT_PLAYLIST_CACHE_FRESHNESS", 3600)
+# How playlists are loaded: "api" (Data API), "ytdlp" (yt-dlp, no API key needed) or "auto" (Data API,
+# then yt-dlp once the API quota runs out).
+YT_PLAYLIST_BACKEND = env.str("YT_PLAYLIST_BACKEND", "auto")
 
 # Application definition
 
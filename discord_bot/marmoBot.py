@@ -1,5 +1,8 @@
+import argparse
+import asyncio
 import logging
 import os
+import signal
 
 import discord
 import django
@@ -7,7 +10,7 @@ from discord.ext import commands
 
 logger = logging.getLogger(__name__)
 
-from discord_bot.settings import BOT_NAME, DISCORD_TOKEN, MUSIC_CHANNEL
+from discord_bot.settings import BOT_NAME, DISCORD_TOKEN, MUSIC_CHANNEL, MUSIC_CHANNELS
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "discord_bot.settings")
 django.setup()
@@ -15,38 +18,84 @@ django.setup()
 from halloween_bot.halloween_cog import HalloweenCog
 from music_bot.music_cog import MusicCog
 
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix="", intents=intents)
 
-
-async def main():
+def create_bot(sharded: bool = False, shard_ids=None, shard_count=None):
+    """
+    Create the bot client and register its events.
+    Params:
+        * (Boolean) sharded: Use an AutoShardedBot, Discord recommends the shard count if it isn't given.
+        * (List) shard_ids: The shards this process runs, the rest run in other processes (see shard_launcher.py).
+        * (Integer) shard_count: The total number of shards across every process.
+    Returns:
+        * (commands.Bot) The bot, not started yet.
+    """
+    intents = discord.Intents.default()
+    intents.message_content = True
+    if sharded or shard_ids or shard_count:
+        # Every process keeps the GuildPlayers of the guilds of its own shards only.
+        bot = commands.AutoShardedBot(
+            command_prefix="",
+            intents=intents,
+            shard_ids=shard_ids,
+            shard_count=shard_count,
+        )
+    else:
+        bot = commands.Bot(command_prefix="", intents=intents)
+
+    @bot.event
+    async def on_ready():
+        message = BOT_NAME + " ha despertado!"
+        logger.info(message)
+
+        # The music channel of every guild the bot serves, a sharded process only sees the ones of its shards.
+        for music_channel in {MUSIC_CHANNEL, *MUSIC_CHANNELS.values()}:
+            channel = bot.get_channel(music_channel)
+            if channel:
+                await channel.send(message)
+
+    return bot
+
+
+async def main(sharded: bool = False, shard_ids=None, shard_count=None):
+    bot = create_bot(sharded=sharded, shard_ids=shard_ids, shard_count=shard_count)
     await bot.add_cog(MusicCog(bot))
     await bot.add_cog(HalloweenCog(bot))
 
+    # Deploys stop the bot with SIGTERM, closing it unloads the cogs so the music queues get saved.
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, lambda: asyncio.create_task(bot.close())
+    )
+
     try:
         async with bot:
             await bot.start(DISCORD_TOKEN)
     except Exception as e:
         logger.error("Bot Error: %s", e)
-
-
-@bot.event
-async def on_ready():
-    message = BOT_NAME + " ha despertado!"
-    logger.info(message)
-
-    music_channel = MUSIC_CHANNEL
-
-    if not isinstance(music_channel, int):
-        music_channel = int(music_channel)
-
-    channel = bot.get_channel(music_channel)
-    if channel:
-        await channel.send(message)
+        # A non-zero exit code lets the shard launcher restart this process.
+        raise
 
 
 if __name__ == "__main__":
-    import asyncio
-
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description=f"Start {BOT_NAME}.")
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        help="Run every shard in this process with an AutoShardedBot.",
+    )
+    parser.add_argument(
+        "--shard-ids", nargs="+", type=int, help="The shards this process runs."
+    )
+    parser.add_argument(
+        "--shard-count", type=int, help="The total number of shards of the bot."
+    )
+    args = parser.parse_args()
+    if args.shard_ids and not args.shard_count:
+        parser.error("--shard-ids needs --shard-count")
+
+    asyncio.run(
+        main(
+            sharded=args.sharded,
+            shard_ids=args.shard_ids,
+            shard_count=args.shard_count,
+        )
+    )
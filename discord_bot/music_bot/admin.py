@@ -1,5 +1,8 @@
 from django.contrib import admin
 
-from .models import SongLog
+from .models import PlaylistLog, QueueSnapshot, SearchQueryLog, SongLog
 
 admin.site.register(SongLog)
+admin.site.register(SearchQueryLog)
+admin.site.register(PlaylistLog)
+admin.site.register(QueueSnapshot)
@@ -17,3 +17,43 @@ class SongInfoDTO:
     source: str = ""
     thumbnail: Optional[str] = None
     format_id: Optional[str] = None
+    # Set once complete_queue_songs found the song, so a live stream without duration isn't looked up again
+    info_completed: bool = field(default=False, compare=False, repr=False)
+
+
+@dataclass
+class LazyPlaylist:
+    """
+    Music queue entry standing for the songs of a Youtube playlist that haven't been loaded yet.
+    It is expanded into SongInfoDTOs a window at a time as playback gets close to it, so the memory
+    and API requests of a huge playlist grow with the window instead of the playlist.
+    """
+
+    playlist_id: str
+    author: str
+    # "api" or "ytdlp", the playlist backend the next window is loaded with
+    backend: str
+    page_token: Optional[str] = None  # Data API cursor of the next page to load
+    # Videos of the playlist already loaded or skipped as unavailable
+    loaded_videos: int = 0
+    total_videos: int = 0  # Estimated size of the whole playlist
+    loaded_duration: float = 0.0  # Seconds of the songs loaded so far
+
+    @property
+    def url(self) -> str:
+        return f"https://www.youtube.com/playlist?list={self.playlist_id}"
+
+    @property
+    def remaining_videos(self) -> int:
+        return max(self.total_videos - self.loaded_videos, 0)
+
+    @property
+    def estimated_duration(self) -> float:
+        """
+        Duration of the songs left to load, estimated with the average duration of the loaded ones.
+        Returns:
+            * (Float) The estimated seconds.
+        """
+        if not self.loaded_videos:
+            return 0.0
+        return self.remaining_videos * self.loaded_duration / self.loaded_videos
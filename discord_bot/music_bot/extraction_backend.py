@@ -0,0 +1,108 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionBackend:
+    """
+    Runs the blocking yt-dlp extractions outside of the event loop.
+    With workers=0 the default thread executor is used. yt-dlp's parsing holds the GIL though, so with
+    workers>0 the extractions run in a pool of worker processes. A pool whose worker crashes or hangs is
+    retired: the next jobs start a fresh pool, and the old one is terminated once the jobs it is still
+    running are over, so a timeout doesn't kill the extractions of other songs.
+    """
+
+    def __init__(self, workers: int = 0, timeout: float = 60.0):
+        self.workers = workers
+        self.timeout = timeout  # Seconds an extraction job may take, 0 disables it
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._running: dict[ProcessPoolExecutor, int] = (
+            {}
+        )  # Jobs in flight in each pool
+        self._retired: set[ProcessPoolExecutor] = set()
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.workers > 0
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.uses_processes and self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _retire(self, executor: ProcessPoolExecutor, reason: str):
+        """
+        Stop sending jobs to a pool, its workers are terminated once it has no jobs in flight.
+        Params:
+            * (ProcessPoolExecutor) executor: The pool to retire.
+            * (String) reason: Why the pool is being retired, used for logging.
+        """
+        if self._executor is executor:
+            logger.warning("Restarting the extraction process pool: %s", reason)
+            self._executor = None
+        self._retired.add(executor)
+
+    def _terminate(self, executor: ProcessPoolExecutor):
+        self._retired.discard(executor)
+        executor.terminate_workers()
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """
+        Run a blocking function in the backend and wait for its result.
+        Params:
+            * (Callable) func: The function to run, it must be picklable when using worker processes.
+            * args: The arguments of the function.
+        Returns:
+            * The result of the function.
+        Raises:
+            * asyncio.TimeoutError: If the job takes longer than the configured timeout.
+        """
+        try:
+            return await self._run_once(func, *args)
+        except BrokenProcessPool:
+            # A worker died (OOM, segfault in a native lib...), retry once in a new pool.
+            return await self._run_once(func, *args)
+
+    async def _run_once(self, func: Callable[..., Any], *args) -> Any:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        job = loop.run_in_executor(executor, functools.partial(func, *args))
+        if executor is None:
+            # Threads can't be killed, a job that timed out is left to finish on its own.
+            if not self.timeout:
+                return await job
+            return await asyncio.wait_for(job, timeout=self.timeout)
+
+        self._running[executor] = self._running.get(executor, 0) + 1
+        try:
+            if not self.timeout:
+                return await job
+            return await asyncio.wait_for(job, timeout=self.timeout)
+        except BrokenProcessPool:
+            self._retire(executor, "a worker process crashed")
+            raise
+        except asyncio.TimeoutError:
+            # The hung worker would keep its slot forever.
+            self._retire(executor, "an extraction timed out")
+            raise
+        finally:
+            self._running[executor] -= 1
+            if not self._running[executor]:
+                del self._running[executor]
+                if executor in self._retired:
+                    self._terminate(executor)
+
+    def shutdown(self):
+        """
+        Stop the worker processes, used when the music cog is unloaded.
+        """
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        for retired in list(self._retired):
+            self._terminate(retired)
@@ -0,0 +1,240 @@
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JsRuntimePolicy:
+    """
+    Learns which extractions need yt-dlp's js_runtimes option so they go straight to it instead of paying
+    for a plain extraction first. It remembers the videos that needed it, and while most recent plain
+    extractions end up needing it (ex: Youtube rolled out a player change) unknown videos use it too.
+    The global signal decays after `window` seconds so the plain path gets tried again.
+    """
+
+    def __init__(
+        self,
+        max_videos: int = 2048,
+        video_ttl: float = 24 * 3600.0,
+        window: float = 900.0,
+        threshold: float = 0.5,
+        min_samples: int = 5,
+    ):
+        self.max_videos = max_videos
+        # Seconds a video is remembered as needing js_runtimes
+        self.video_ttl = video_ttl
+        # Seconds of plain extraction outcomes used for the global decision
+        self.window = window
+        # Share of the recent plain extractions needing js_runtimes to use it for every video
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.hits = 0  # The option set chosen first was the one that worked
+        self.misses = 0  # The option set chosen first failed and the other one worked
+        self._videos: "OrderedDict[str, float]" = OrderedDict()  # video_id -> time
+        self._outcomes: "deque[tuple[float, bool]]" = deque()  # (time, needed js)
+
+    def _expire_outcomes(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def global_js_rate(self) -> float:
+        """
+        Share of the recent plain extractions that needed js_runtimes.
+        Returns:
+            * (Float) A value between 0 and 1, 0 if there aren't enough recent samples.
+        """
+        self._expire_outcomes(time.monotonic())
+        if len(self._outcomes) < self.min_samples:
+            return 0.0
+        needed_js_count = sum(1 for _, needed_js in self._outcomes if needed_js)
+        return needed_js_count / len(self._outcomes)
+
+    def needs_js(self, video_id: Optional[str]) -> bool:
+        """
+        Decide if an extraction should start with js_runtimes enabled.
+        Params:
+            * (String | None) video_id: The video about to be extracted, None for text searches.
+        Returns:
+            * (Boolean)
+        """
+        learned_at = self._videos.get(video_id) if video_id else None
+        if learned_at is not None:
+            if time.monotonic() - learned_at < self.video_ttl:
+                self._videos.move_to_end(video_id)
+                return True
+            del self._videos[video_id]
+        return self.global_js_rate() >= self.threshold
+
+    def record(self, video_id: Optional[str], started_with_js: bool, needed_js: bool):
+        """
+        Learn from the outcome of an extraction.
+        Params:
+            * (String | None) video_id: The video that was extracted.
+            * (Boolean) started_with_js: If the first attempt used js_runtimes.
+            * (Boolean) needed_js: If the attempt that worked used js_runtimes.
+        """
+        now = time.monotonic()
+        if started_with_js == needed_js:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        if not started_with_js:
+            # Only plain attempts tell us if js_runtimes is needed, otherwise the policy would feed itself.
+            self._outcomes.append((now, needed_js))
+            self._expire_outcomes(now)
+
+        if not video_id:
+            return
+        if needed_js:
+            self._videos[video_id] = now
+            self._videos.move_to_end(video_id)
+            while len(self._videos) > self.max_videos:
+                self._videos.popitem(last=False)
+        else:
+            self._videos.pop(video_id, None)
+
+    def stats(self) -> dict:
+        """
+        Counters of the learned policy, useful for logs and benchmarks.
+        Returns:
+            * (Dict) hits, misses, learned videos and the current global js_runtimes rate.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "learned_videos": len(self._videos),
+            "global_js_rate": round(self.global_js_rate(), 3),
+        }
+
+
+class ExtractionUnavailableError(Exception):
+    """
+    Raised when the circuit breaker is open and extractions fail fast instead of reaching Youtube.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Extractions are paused for {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+
+class LatencyTracker:
+    """
+    Keeps the latency of the recent successful extractions to know when one is taking unusually long,
+    which is when a hedged second attempt is worth its cost.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        min_samples: int = 20,
+        max_samples: int = 200,
+        min_delay: float = 1.0,
+    ):
+        self.percentile = percentile  # 0 disables hedging
+        self.min_samples = min_samples
+        self.min_delay = min_delay  # Never hedge before this many seconds
+        self._samples: "deque[float]" = deque(maxlen=max_samples)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds to wait for an extraction before starting a hedged attempt.
+        Returns:
+            * (Float | None) The configured latency percentile, or None if hedging is disabled or there aren't enough samples.
+        """
+        if self.percentile <= 0 or len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+        return max(ordered[rank], self.min_delay)
+
+
+class CircuitBreaker:
+    """
+    Stops sending extractions to Youtube once too many of the recent ones failed (ex: it is throttling us),
+    so commands fail fast instead of piling up threads. After `cooldown` seconds a single trial extraction
+    is let through, closing the breaker if it works or opening it again if it doesn't.
+    """
+
+    def __init__(
+        self,
+        error_rate: float = 0.5,
+        min_calls: int = 10,
+        window: float = 120.0,
+        cooldown: float = 60.0,
+    ):
+        self.error_rate = error_rate  # Share of failed extractions that opens it
+        self.min_calls = min_calls
+        self.window = window  # Seconds of extraction outcomes considered
+        self.cooldown = cooldown  # Seconds the breaker stays open before a trial
+        self._calls: "deque[tuple[float, bool]]" = deque()  # (time, succeeded)
+        self._opened_at: Optional[float] = None
+        self._trial_in_progress = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def check(self):
+        """
+        Make sure a new extraction can be started.
+        Raises:
+            * ExtractionUnavailableError: If the breaker is open, or half open with a trial already running.
+        """
+        if self._opened_at is None:
+            return
+
+        remaining = self._opened_at + self.cooldown - time.monotonic()
+        if remaining > 0:
+            raise ExtractionUnavailableError(retry_after=remaining)
+        if self._trial_in_progress:
+            raise ExtractionUnavailableError(retry_after=self.cooldown)
+        self._trial_in_progress = True
+
+    def release_trial(self):
+        """
+        Forget the trial extraction without an outcome, ex: it was cancelled, so the next check starts another.
+        """
+        self._trial_in_progress = False
+
+    def record(self, succeeded: bool):
+        """
+        Register the outcome of an extraction.
+        Params:
+            * (Boolean) succeeded: False if the extraction raised or missed its deadline, a video that isn't
+            available is still a success.
+        """
+        now = time.monotonic()
+        if self._opened_at is not None:
+            if not self._trial_in_progress:
+                # An extraction started before the breaker opened, it says nothing about the trial
+                return
+            self._trial_in_progress = False
+            if succeeded:
+                logger.info("Extraction circuit breaker closed")
+                self._opened_at = None
+                self._calls.clear()
+            else:
+                self._opened_at = now
+            return
+
+        self._calls.append((now, succeeded))
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+        failures = sum(1 for _, call_succeeded in self._calls if not call_succeeded)
+        if (
+            len(self._calls) >= self.min_calls
+            and failures / len(self._calls) >= self.error_rate
+        ):
+            logger.warning(
+                "Extraction circuit breaker opened, %d of the last %d extractions failed",
+                failures,
+                len(self._calls),
+            )
+            self._opened_at = now
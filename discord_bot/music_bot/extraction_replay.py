@@ -0,0 +1,110 @@
+import copy
+import hashlib
+import json
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from yt_dlp import YoutubeDL
+
+# Recorded urls expire a few hours after being recorded, replays move them to the future
+# so the stream cache treats them as fresh.
+EXPIRE_PATTERN = re.compile(r"(expire[=/])\d+")
+REPLAY_URL_LIFETIME = 6 * 3600
+
+
+def record_fixture(url: str, fixtures_dir: Path, opts: Dict[str, Any]) -> Path:
+    """
+    Extract a Youtube url with a real YoutubeDL and save its info dict as a replay fixture.
+    Params:
+        * (String) url: The complete url of the Youtube video to record.
+        * (Path) fixtures_dir: The directory where the fixture is written.
+        * (Dict) opts: The options to pass to yt-dlp.
+    Returns:
+        * (Path) The path of the written fixture.
+    """
+    with YoutubeDL(dict(opts)) as ydl:
+        info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+
+    fixtures_dir.mkdir(parents=True, exist_ok=True)
+    path = fixtures_dir / f"{info['id']}.json"
+    path.write_text(json.dumps(info))
+    return path
+
+
+def load_fixtures(fixtures_dir: Path) -> Dict[str, Dict[str, Any]]:
+    """
+    Load every recorded info dict of a directory.
+    Params:
+        * (Path) fixtures_dir: The directory with the fixtures written by record_fixture.
+    Returns:
+        * (Dict) The info dicts keyed by video id.
+    """
+    fixtures = {}
+    for path in sorted(fixtures_dir.glob("*.json")):
+        info = json.loads(path.read_text())
+        fixtures[info["id"]] = info
+    return fixtures
+
+
+class ReplayYoutubeDL:
+    """
+    Stand-in for YoutubeDL that answers extract_info with recorded info dicts after a simulated
+    network latency, so the extraction path can be benchmarked without reaching Youtube.
+    With js_miss_rate, that share of the videos come back without audio formats unless the
+    js_runtimes option is set, which drives the retry of YouTubeExtractorService.
+    """
+
+    def __init__(
+        self,
+        params: Dict[str, Any],
+        fixtures: Dict[str, Dict[str, Any]],
+        latency: float = 0.3,
+        jitter: float = 0.5,
+        js_miss_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.params = params
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter  # Latencies are spread by +/- this share of `latency`
+        self.js_miss_rate = js_miss_rate
+        self._random = random.Random(seed)
+        self._video_ids = sorted(fixtures)
+
+    def _fixture_for(self, url: str) -> Dict[str, Any]:
+        if url.startswith("ytsearch:"):
+            # Text searches map to a stable fixture so repeated queries hit the same video.
+            digest = hashlib.sha1(url.encode()).digest()
+            return self.fixtures[self._video_ids[digest[0] % len(self._video_ids)]]
+
+        for video_id, info in self.fixtures.items():
+            if video_id in url:
+                return info
+        raise ValueError(f"No recorded fixture for {url}")
+
+    def _needs_js(self, video_id: str) -> bool:
+        digest = hashlib.sha1(video_id.encode()).digest()
+        return digest[0] / 256 < self.js_miss_rate
+
+    def extract_info(self, url: str, download: bool = False) -> Dict[str, Any]:
+        spread = self.latency * self.jitter
+        time.sleep(max(self._random.uniform(-spread, spread) + self.latency, 0))
+
+        info = copy.deepcopy(self._fixture_for(url))
+        expire_at = str(int(time.time()) + REPLAY_URL_LIFETIME)
+        for f in info.get("formats") or []:
+            if f.get("url"):
+                f["url"] = EXPIRE_PATTERN.sub(rf"\g<1>{expire_at}", f["url"])
+        if self._needs_js(info["id"]) and "js_runtimes" not in self.params:
+            info["formats"] = [
+                f
+                for f in info.get("formats") or []
+                if f.get("acodec") in (None, "none")
+            ]
+        return info
+
+    def close(self):
+        pass
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Iterator, Optional
+
+from discord_bot.settings import (
+    MUSIC_PREFETCH_CONCURRENCY,
+    MUSIC_PREFETCH_LOOKAHEAD,
+    MUSIC_SHUFFLE_SEED,
+)
+
+from .music_queue import MusicQueue
+from .music_service import MusicService
+from .prefetcher import QueuePrefetcher
+from .queue_pages import QueuePageRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class GuildPlayer:
+    """
+    The music bot of one guild: its queue, the song playing and its voice client. MusicService and
+    QueuePrefetcher work on a player, so the guilds only share the extractor, the HTTP client and the
+    database through the cog.
+    """
+
+    def __init__(self, cog, guild_id: int):
+        self.cog = cog  # The MusicCog, it owns the resources shared by every guild
+        self.guild_id = guild_id
+
+        self.is_playing = False  # To know when the bot is playing music
+        self.is_paused = False  # To know when the bot is paused
+
+        self.music_queue = MusicQueue()  # The music queue of songs to play
+        # A fixed MUSIC_SHUFFLE_SEED makes the shuffled order repeatable.
+        self.shuffle_random = random.Random(MUSIC_SHUFFLE_SEED)
+        self.now_playing = []  # [song] To display the info of the current song playing
+        # time.monotonic() when the current song started playing
+        self.song_started_at = None
+        self.song_paused_at = None  # time.monotonic() when the current song was paused
+        self.current_voice_channel = None  # The voice client of the bot in this guild
+
+        # Serializes starting the playback, so two play commands at once don't both start the queue.
+        self.lock = asyncio.Lock()
+        self.last_active = time.monotonic()  # For the idle eviction
+
+        self.music_service = MusicService(self)
+        self.queue_pages = QueuePageRenderer(self.music_service)
+        self.queue_completion_tasks = set()  # Tasks completing the songs shown by queue
+        self.prefetcher = QueuePrefetcher(
+            self,
+            lookahead=MUSIC_PREFETCH_LOOKAHEAD,
+            concurrency=MUSIC_PREFETCH_CONCURRENCY,
+        )
+
+    # Resources shared by every guild
+
+    @property
+    def bot(self):
+        return self.cog.bot
+
+    @property
+    def youtube_extractor(self):
+        return self.cog.youtube_extractor
+
+    @property
+    def http_client(self):
+        return self.cog.http_client
+
+    @property
+    def youtube_api_key(self) -> str:
+        return self.cog.youtube_api_key
+
+    @property
+    def FFMPEG_OPTIONS(self) -> dict:
+        return self.cog.FFMPEG_OPTIONS
+
+    def touch(self):
+        """
+        Mark the player as used now, it is only evicted after being idle for a while.
+        """
+        self.last_active = time.monotonic()
+
+    def is_idle(self, idle_timeout: float, now: Optional[float] = None) -> bool:
+        """
+        Params:
+            * (Float) idle_timeout: Seconds without commands or playback before a player is idle.
+            * (Float) now: The time.monotonic() to compare against, the current one by default.
+        Returns:
+            * (Boolean) True if nothing is playing, paused or being completed and the player wasn't used lately.
+        """
+        now = time.monotonic() if now is None else now
+        return (
+            not self.is_playing
+            and not self.is_paused
+            and not self.lock.locked()
+            and not self.queue_completion_tasks
+            and now - self.last_active >= idle_timeout
+        )
+
+    async def start_playing(self, voice_channel):
+        """
+        Connect to a voice channel and start playing the queue, unless it is playing or paused already.
+        Params:
+            * voice_channel: The voice channel of the user that added the songs.
+        """
+        async with self.lock:
+            if self.is_playing is False and self.is_paused is False:
+                # Try to connect to a voice channel if you are not already connected
+                await self.music_service.try_to_connect(
+                    voice_channel_to_connect=voice_channel
+                )
+                await self.music_service.reproduce_next_song_in_queue()
+
+    async def close(self):
+        """
+        Stop the background work of the player and leave its voice channel, used when it is evicted or
+        the cog is unloaded.
+        """
+        self.prefetcher.cancel_all()
+        for task in self.queue_completion_tasks:
+            task.cancel()
+        voice_client = self.current_voice_channel
+        self.current_voice_channel = None
+        self.is_playing = False
+        self.is_paused = False
+        self.music_queue.clear()
+        self.now_playing = []
+        self.song_started_at = None
+        if voice_client is not None and voice_client.is_connected():
+            try:
+                await voice_client.disconnect()
+            except Exception as e:
+                logger.error(
+                    "Could not disconnect the player of guild %s: %s",
+                    self.guild_id,
+                    e,
+                )
+
+
+class GuildPlayerRegistry:
+    """
+    The GuildPlayer and the music text channel of every guild the bot is used in. A player is created on
+    the first command of its guild and evicted once it has been idle for `idle_timeout` seconds, so the guilds that stopped
+    listening don't keep their queue, tasks or voice connection around.
+    """
+
+    def __init__(
+        self,
+        cog,
+        music_channels: dict[int, int],
+        default_music_channel: Optional[int],
+        idle_timeout: float,
+    ):
+        self.cog = cog
+        self.music_channels = music_channels  # guild id -> id of its music text channel
+        # For the guilds missing in music_channels
+        self.default_music_channel = default_music_channel
+        self.idle_timeout = idle_timeout
+        self._players: dict[int, GuildPlayer] = {}
+
+    def __len__(self) -> int:
+        return len(self._players)
+
+    def __contains__(self, guild_id: int) -> bool:
+        return guild_id in self._players
+
+    def __iter__(self) -> Iterator[GuildPlayer]:
+        return iter(list(self._players.values()))
+
+    def music_channel(self, guild) -> Optional[int]:
+        """
+        Params:
+            * guild: The discord guild of a command, None for direct messages.
+        Returns:
+            * (Integer | None) The id of the text channel that accepts the music commands of the guild.
+        """
+        if guild is None:
+            return None
+        return self.music_channels.get(guild.id, self.default_music_channel)
+
+    def get(self, guild) -> GuildPlayer:
+        """
+        Get the player of a guild, creating it on its first command.
+        Params:
+            * guild: The discord guild of the command.
+        Returns:
+            * (GuildPlayer) The player of the guild, marked as used now.
+        """
+        player = self._players.get(guild.id)
+        if player is None:
+            player = GuildPlayer(self.cog, guild.id)
+            self._players[guild.id] = player
+        player.touch()
+        return player
+
+    async def evict_idle(self) -> int:
+        """
+        Close and forget the players that have been idle for longer than the idle timeout.
+        Returns:
+            * (Integer) The number of players evicted.
+        """
+        now = time.monotonic()
+        idle = [
+            player
+            for player in self._players.values()
+            if player.is_idle(self.idle_timeout, now)
+        ]
+        evicted = 0
+        for player in idle:
+            # A command may have used the player while the previous ones were closing.
+            if self._players.get(player.guild_id) is player and player.is_idle(
+                self.idle_timeout
+            ):
+                del self._players[player.guild_id]
+                await player.close()
+                evicted += 1
+                logger.info("Evicted the idle player of guild %s", player.guild_id)
+        return evicted
+
+    async def close_all(self):
+        """
+        Close every player, used when the cog is unloaded.
+        """
+        players = list(self._players.values())
+        self._players.clear()
+        for player in players:
+            await player.close()
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying, the request may work if it's sent again a bit later.
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HttpClientError(Exception):
+    """
+    Raised when a request couldn't get a response after every retry.
+    """
+
+
+@dataclass
+class HttpResponse:
+    status: int
+    data: Dict[str, Any]
+    headers: Dict[str, str]
+
+
+class HttpClient:
+    """
+    Shared aiohttp session for the JSON APIs the bot calls (ex: the Youtube Data API). Connections are kept
+    alive between requests, every request has a timeout, and network errors or throttling responses are
+    retried with an exponential backoff so the event loop is never blocked waiting on them.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_connections: int = 20,
+    ):
+        self.timeout = timeout  # Seconds a single request may take
+        self.retries = retries  # Attempts after the first one
+        self.backoff = backoff  # Seconds before the first retry, doubled on every retry
+        self.max_connections = max_connections
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # The session is bound to the running loop, so it is created on the first request.
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections, keepalive_timeout=60
+                ),
+            )
+        return self._session
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        delay = self.backoff * 2**attempt
+        return delay + random.uniform(0, delay / 2)
+
+    async def get_json(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> HttpResponse:
+        """
+        Send a GET request and decode its JSON body, retrying network errors and throttling responses.
+        Params:
+            * (String) url: The url of the request.
+            * (Dict) params: The query string parameters.
+            * (Dict) headers: Extra headers of the request.
+        Returns:
+            * (HttpResponse) The status, decoded body (empty if it isn't JSON) and headers of the last response.
+        Raises:
+            * HttpClientError: If no response was received after every retry.
+        """
+        session = self._get_session()
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            try:
+                async with session.get(url, params=params, headers=headers) as response:
+                    if (
+                        response.status not in RETRYABLE_STATUSES
+                        or attempt == self.retries
+                    ):
+                        try:
+                            data = await response.json(content_type=None)
+                        except ValueError:
+                            data = {}
+                        return HttpResponse(
+                            status=response.status,
+                            data=data or {},
+                            headers=dict(response.headers),
+                        )
+                    retry_after = response.headers.get("Retry-After")
+                    logger.warning("GET %s returned %s, retrying", url, response.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise HttpClientError(f"GET {url} failed: {e}") from e
+                logger.warning("GET %s failed, retrying: %s", url, e)
+
+            await asyncio.sleep(self._retry_delay(attempt, retry_after))
+
+    async def close(self):
+        """
+        Close the pooled connections, used when the music cog is unloaded.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,127 @@
+import pickle
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from yt_dlp import YoutubeDL
+
+from ...ydl_pool import YoutubeDLPool
+from ...youtube_extractor import PROFILE_OPTIONS, slim_info
+
+BENCHMARK_YDL_OPTIONS = {"quiet": True, "no_warnings": True}
+
+
+def percentile(samples: list[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of a list of samples.
+    Params:
+        * (List) samples: The measured values.
+        * (Float) percent: The percentile wanted, from 0 to 100.
+    Returns:
+        * (Float) The value under which the given percent of the samples fall.
+    """
+    ordered = sorted(samples)
+    rank = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the yt-dlp extraction path used by YouTubeExtractorService."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=30)
+        parser.add_argument(
+            "--url",
+            default=None,
+            help="Also time full extractions of this Youtube url, it needs network access.",
+        )
+
+    def report(self, name: str, samples: list[float]):
+        self.stdout.write(
+            f"{name:<28} mean={statistics.mean(samples) * 1000:8.2f}ms "
+            f"p50={percentile(samples, 50) * 1000:8.2f}ms "
+            f"p95={percentile(samples, 95) * 1000:8.2f}ms"
+        )
+
+    def time_calls(self, iterations: int, call) -> list[float]:
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            call()
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        url = options["url"]
+        pool = YoutubeDLPool()
+
+        def fresh_instance(run):
+            with YoutubeDL(dict(BENCHMARK_YDL_OPTIONS)) as ydl:
+                run(ydl)
+
+        def pooled_instance(run):
+            with pool.acquire(BENCHMARK_YDL_OPTIONS) as ydl:
+                run(ydl)
+
+        # Resolving the Youtube extractor is the setup every extraction pays before any request.
+        def setup_only(ydl):
+            ydl.get_info_extractor("Youtube")
+
+        self.report(
+            "fresh YoutubeDL setup",
+            self.time_calls(iterations, lambda: fresh_instance(setup_only)),
+        )
+        self.report(
+            "pooled YoutubeDL setup",
+            self.time_calls(iterations, lambda: pooled_instance(setup_only)),
+        )
+
+        if url:
+
+            def extract(ydl):
+                ydl.extract_info(url, download=False)
+
+            self.report(
+                "fresh YoutubeDL extraction",
+                self.time_calls(iterations, lambda: fresh_instance(extract)),
+            )
+            self.report(
+                "pooled YoutubeDL extraction",
+                self.time_calls(iterations, lambda: pooled_instance(extract)),
+            )
+            self.compare_profiles(pool, url, iterations)
+
+        self.stdout.write(
+            f"pool created {pool.created} instances and reused them {pool.reused} times"
+        )
+        pool.clear()
+
+    def compare_profiles(self, pool: YoutubeDLPool, url: str, iterations: int):
+        """
+        Time the extraction profiles of YouTubeExtractorService against the default options,
+        along with the size of the info dict each one hands back to the bot.
+        Params:
+            * (YoutubeDLPool) pool: The pool the YoutubeDL instances are taken from.
+            * (String) url: The Youtube url to extract.
+            * (Integer) iterations: How many extractions to time per profile.
+        """
+        scenarios = [("default", BENCHMARK_YDL_OPTIONS, False)] + [
+            (name, {**options, **BENCHMARK_YDL_OPTIONS}, True)
+            for name, options in PROFILE_OPTIONS.items()
+        ]
+        for name, opts, slimmed in scenarios:
+            info = {}
+
+            def extract():
+                nonlocal info
+                with pool.acquire(opts) as ydl:
+                    info = ydl.extract_info(url, download=False)
+                if slimmed:
+                    info = slim_info(info)
+
+            self.report(f"{name} profile", self.time_calls(iterations, extract))
+            self.stdout.write(
+                f"{'':<28} info size={len(pickle.dumps(info)) / 1024:8.1f}KB "
+                f"formats={len(info.get('formats') or [])}"
+            )
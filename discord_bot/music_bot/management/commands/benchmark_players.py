@@ -0,0 +1,209 @@
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from ...dto import SongInfoDTO
+from ...music_cog import MusicCog
+
+
+class BenchmarkVoiceClient:
+    """
+    Stand-in for the voice client of a guild, it accepts the playback calls without playing anything.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def is_connected(self) -> bool:
+        return True
+
+    def is_playing(self) -> bool:
+        return True
+
+    def pause(self):
+        pass
+
+    def resume(self):
+        pass
+
+    def stop(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+
+class BenchmarkVoiceChannel:
+    def __init__(self, name: str):
+        self.name = name
+
+    async def connect(self):
+        return BenchmarkVoiceClient(self)
+
+
+class BenchmarkMessage:
+    async def edit(self, **kwargs):
+        pass
+
+    async def delete(self):
+        pass
+
+    async def add_reaction(self, emoji):
+        pass
+
+    async def remove_reaction(self, emoji, member):
+        pass
+
+
+class BenchmarkContext:
+    """
+    Stand-in for the context of a command sent in the music channel of a guild.
+    """
+
+    def __init__(self, cog, guild_id: int, voice_channel: BenchmarkVoiceChannel):
+        self.cog = cog
+        self.guild = SimpleNamespace(id=guild_id)
+        self.author = SimpleNamespace(
+            name=f"user-{guild_id}",
+            nick=None,
+            voice=SimpleNamespace(channel=voice_channel),
+        )
+        self.message = SimpleNamespace(
+            channel=SimpleNamespace(id=guild_id), clean_content=""
+        )
+
+    async def send(self, *args, **kwargs):
+        return BenchmarkMessage()
+
+
+class BenchmarkExtractor:
+    """
+    Stand-in for the YouTubeExtractorService, every search takes the same time and finds a song.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def search(self, url: str, author: str) -> SongInfoDTO:
+        await asyncio.sleep(self.latency)
+        return SongInfoDTO(
+            url=url,
+            title=f"Song {url[-11:]}",
+            duration=180,
+            author=author,
+            source=f"{url}&audio",
+        )
+
+    def normalize_query(self, query: str) -> str:
+        return query
+
+    def get_video_id(self, url: str) -> str:
+        return url[-11:]
+
+    def close(self):
+        pass
+
+
+async def reject_reactions(*args, **kwargs):
+    # Nobody reacts to the queue messages, so they are deleted right away.
+    raise asyncio.TimeoutError
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test of the music cog with many guilds at once. Every guild plays its own queue and sends "
+        "a round of commands concurrently with the others, the command latency is reported per guild "
+        "count to check that a guild isn't slowed down by the rest."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--guilds", nargs="+", type=int, default=[1, 10, 50, 100])
+        parser.add_argument("--rounds", type=int, default=20)
+        parser.add_argument(
+            "--search-latency",
+            type=float,
+            default=0.05,
+            help="Seconds the stand-in extractor takes per search.",
+        )
+
+    async def run_guild(self, cog, guild_id: int, rounds: int) -> dict:
+        voice_channel = BenchmarkVoiceChannel(f"voice-{guild_id}")
+        context = BenchmarkContext(cog, guild_id, voice_channel)
+
+        player = cog.players.get(context.guild)
+        player.current_voice_channel = await voice_channel.connect()
+        player.is_playing = True
+        player.now_playing = [
+            SongInfoDTO(
+                url="https://youtu.be/playing",
+                title="Playing",
+                duration=180,
+                author="benchmark",
+            )
+        ]
+        player.song_started_at = time.monotonic()
+
+        commands = [
+            (cog.play, [f"https://www.youtube.com/watch?v={guild_id:05d}"]),
+            (cog.queue, []),
+            (cog.when, ["1"]),
+            (cog.move, ["1", "2"]),
+            (cog.shuffle, []),
+            (cog.now_playing, []),
+        ]
+        latencies = {command.name: [] for command, _ in commands}
+        for round_number in range(rounds):
+            for command, args in commands:
+                if command is cog.play:
+                    args = [f"{args[0]}{round_number:06d}"]
+                start = time.perf_counter()
+                if await MusicCog._check_if_valid(context):
+                    # The cog isn't added to a bot, so the command is called unbound.
+                    await command.callback(cog, context, *args)
+                latencies[command.name].append(time.perf_counter() - start)
+
+        # Each guild only sees its own songs.
+        assert len(player.music_queue) == rounds
+        assert all(entry.channel is voice_channel for entry in player.music_queue)
+        return latencies
+
+    async def run(self, options):
+        bot = SimpleNamespace(
+            loop=asyncio.get_running_loop(), wait_for=reject_reactions
+        )
+        for guilds in options["guilds"]:
+            cog = MusicCog(bot)
+            cog.youtube_extractor.close()
+            cog.youtube_extractor = BenchmarkExtractor(options["search_latency"])
+            # The music channel of each guild has the id of the guild.
+            cog.players.music_channels = {
+                guild_id: guild_id for guild_id in range(1, guilds + 1)
+            }
+            try:
+                start = time.perf_counter()
+                results = await asyncio.gather(
+                    *(
+                        self.run_guild(cog, guild_id, options["rounds"])
+                        for guild_id in range(1, guilds + 1)
+                    )
+                )
+                elapsed = time.perf_counter() - start
+            finally:
+                await cog.cog_unload()
+
+            self.stdout.write(f"{guilds} guilds, total={elapsed:.2f}s")
+            for name in results[0]:
+                latencies = [latency for result in results for latency in result[name]]
+                # The slowest guild, to catch a guild waiting on the others.
+                worst_guild = max(statistics.median(result[name]) for result in results)
+                self.stdout.write(
+                    f"  {name:<12} p50={statistics.median(latencies) * 1000:8.2f}ms "
+                    f"p95={statistics.quantiles(latencies, n=20)[18] * 1000:8.2f}ms "
+                    f"worst guild p50={worst_guild * 1000:8.2f}ms"
+                )
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options))
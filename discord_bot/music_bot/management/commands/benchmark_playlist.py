@@ -0,0 +1,125 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from discord_bot.settings import YT_API_KEY
+
+from ...dto import LazyPlaylist
+from ...http_client import HttpClient
+from ...models import PlaylistLog
+from ...music_service import PLAYLIST_BACKEND_API, PLAYLIST_BACKEND_YTDLP, MusicService
+from ...youtube_extractor import YouTubeExtractorService
+
+
+class BenchmarkContext:
+    """
+    Stand-in for the context of a command, it keeps the messages instead of sending them to Discord.
+    """
+
+    def __init__(self):
+        self.author = SimpleNamespace(nick="benchmark")
+        self.messages = []
+
+    async def send(self, message: str):
+        self.messages.append(message)
+
+
+class CountingHttpClient(HttpClient):
+    """
+    HttpClient that counts the Data API requests, each one costs quota.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests = 0
+
+    async def get_json(self, url, params=None, headers=None):
+        self.requests += 1
+        return await super().get_json(url, params=params, headers=headers)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks loading Youtube playlists with the Data API against yt-dlp's flat extraction. "
+        "It needs network access, and a Data API key for the api backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "urls", nargs="+", help="Youtube playlist urls, ex: of 100 and 1000 songs."
+        )
+        parser.add_argument(
+            "--backends",
+            nargs="+",
+            default=[PLAYLIST_BACKEND_API, PLAYLIST_BACKEND_YTDLP],
+            choices=[PLAYLIST_BACKEND_API, PLAYLIST_BACKEND_YTDLP],
+        )
+        parser.add_argument("--iterations", type=int, default=3)
+        parser.add_argument(
+            "--warm",
+            action="store_true",
+            help="Keep the cached playlist pages between runs instead of loading them from the API every time.",
+        )
+
+    async def load_playlist(self, url: str, backend: str, warm: bool) -> dict:
+        http_client = CountingHttpClient()
+        player = SimpleNamespace(
+            youtube_api_key=YT_API_KEY,
+            http_client=http_client,
+            youtube_extractor=YouTubeExtractorService(),
+        )
+        music_service = MusicService(player)
+        context = BenchmarkContext()
+        if not warm:
+            playlist_id = url.split("list=")[1]
+            await asyncio.to_thread(
+                PlaylistLog.objects.filter(playlist_id=playlist_id).delete
+            )
+
+        start = time.perf_counter()
+        first_page = None
+        songs = 0
+        lazy_playlist = None
+        try:
+            async for page in music_service.stream_youtube_playlist(
+                url=url, context=context, backend=backend
+            ):
+                first_page = first_page or time.perf_counter() - start
+                for song in page:
+                    if isinstance(song, LazyPlaylist):
+                        lazy_playlist = song
+                    else:
+                        songs += 1
+            # Load the windows the queue would load while the playlist plays.
+            while lazy_playlist and lazy_playlist.remaining_videos:
+                songs += len(await music_service.expand_lazy_playlist(lazy_playlist))
+        finally:
+            await http_client.close()
+            player.youtube_extractor.close()
+        return {
+            "total": time.perf_counter() - start,
+            "first_page": first_page or 0.0,
+            "songs": songs,
+            "requests": http_client.requests,
+            "messages": context.messages,
+        }
+
+    async def run(self, options):
+        for url in options["urls"]:
+            self.stdout.write(url)
+            for backend in options["backends"]:
+                for _ in range(options["iterations"]):
+                    result = await self.load_playlist(url, backend, options["warm"])
+                    self.stdout.write(
+                        f"  {backend:<6} songs={result['songs']:5d} "
+                        f"first page={result['first_page'] * 1000:9.1f}ms "
+                        f"total={result['total'] * 1000:9.1f}ms "
+                        f"api requests={result['requests']}"
+                    )
+                    for message in result["messages"]:
+                        self.stdout.write(f"    {message}")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options))
@@ -0,0 +1,170 @@
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from ...dto import SongInfoDTO
+from ...music_queue import MusicQueue
+
+
+def build_song(index: int) -> SongInfoDTO:
+    return SongInfoDTO(
+        url=f"https://www.youtube.com/watch?v={index:011d}",
+        title=f"Song {index}",
+        duration=180,
+        author="benchmark",
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the MusicQueue against the list of [song, channel] lists it replaced, "
+        "with the operations the music commands do on a large queue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", nargs="+", type=int, default=[10_000, 50_000, 100_000]
+        )
+        parser.add_argument("--operations", type=int, default=1_000)
+        parser.add_argument("--iterations", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def measure_shuffle(self, shuffle, build, iterations: int) -> tuple[float, int]:
+        elapsed = self.time_scenario(shuffle, build, iterations)
+        # Tracing slows everything down, so the memory is measured in a separate run.
+        queue = build()
+        tracemalloc.start()
+        shuffle(queue)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed, peak
+
+    def report_shuffles(self, build_list, build_queue, options: dict):
+        rng = random.Random(options["seed"])
+        shuffles = {
+            "MusicQueue.shuffle": (
+                lambda queue: queue.shuffle(rng=rng),
+                build_queue,
+            ),
+            "MusicQueue fair": (
+                lambda queue: queue.shuffle(
+                    rng=rng, fair_by=lambda entry: entry.song.url[-1]
+                ),
+                build_queue,
+            ),
+        }
+        try:
+            import numpy as np
+        except ImportError:
+            self.stdout.write("  (numpy isn't installed, the old shuffle is skipped)")
+        else:
+
+            def numpy_shuffle(queue):
+                # The shuffle command before MusicQueue, it kept the copy until the next song.
+                numpy_array = np.array(queue)
+                np.random.shuffle(numpy_array)
+                return numpy_array.tolist()
+
+            shuffles = {"numpy round trip": (numpy_shuffle, build_list), **shuffles}
+
+        for name, (shuffle, build) in shuffles.items():
+            elapsed, peak = self.measure_shuffle(shuffle, build, options["iterations"])
+            self.stdout.write(
+                f"  {name:<20} time={elapsed * 1000:9.2f}ms "
+                f"peak memory={peak / 1024:9.1f}KiB"
+            )
+
+    def time_scenario(self, scenario, build, iterations: int) -> float:
+        samples = []
+        for _ in range(iterations):
+            queue = build()
+            start = time.perf_counter()
+            scenario(queue)
+            samples.append(time.perf_counter() - start)
+        return statistics.median(samples)
+
+    def handle(self, *args, **options):
+        operations = options["operations"]
+        rng = random.Random(options["seed"])
+
+        for size in options["sizes"]:
+            songs = [build_song(i) for i in range(size)]
+            positions = [
+                (rng.randrange(size - 1), rng.randrange(size - 1))
+                for _ in range(operations)
+            ]
+
+            def build_list():
+                return [[song, None] for song in songs]
+
+            def build_queue():
+                queue = MusicQueue()
+                for song in songs:
+                    queue.append(song, None)
+                return queue
+
+            # Each scenario is the same sequence of operations written for each structure.
+            scenarios = {
+                "pop head": (
+                    lambda queue: [queue.pop(0) for _ in range(operations)],
+                    lambda queue: [queue.popleft() for _ in range(operations)],
+                ),
+                "play next": (
+                    lambda queue: [
+                        queue.insert(0, [songs[0], None]) for _ in range(operations)
+                    ],
+                    lambda queue: [
+                        queue.insert(0, songs[0], None) for _ in range(operations)
+                    ],
+                ),
+                "move": (
+                    lambda queue: [
+                        queue.insert(target, queue.pop(source))
+                        for source, target in positions
+                    ],
+                    lambda queue: [
+                        queue.move(source, target) for source, target in positions
+                    ],
+                ),
+                "prefetch window": (
+                    lambda queue: [queue[:5] for _ in range(operations)],
+                    lambda queue: [queue.upcoming(5) for _ in range(operations)],
+                ),
+                "time until played": (
+                    lambda queue: [
+                        sum(entry[0].duration for entry in queue[:source])
+                        for source, _ in positions
+                    ],
+                    lambda queue: [
+                        queue.duration_before(source) for source, _ in positions
+                    ],
+                ),
+                "pop head + total": (
+                    lambda queue: [
+                        (queue.pop(0), sum(entry[0].duration for entry in queue))
+                        for _ in range(operations)
+                    ],
+                    lambda queue: [
+                        (queue.popleft(), queue.total_duration())
+                        for _ in range(operations)
+                    ],
+                ),
+            }
+
+            self.stdout.write(f"{size} songs, {operations} operations per sample")
+            for name, (list_scenario, queue_scenario) in scenarios.items():
+                list_time = self.time_scenario(
+                    list_scenario, build_list, options["iterations"]
+                )
+                queue_time = self.time_scenario(
+                    queue_scenario, build_queue, options["iterations"]
+                )
+                self.stdout.write(
+                    f"  {name:<18} list={list_time * 1000:9.2f}ms "
+                    f"MusicQueue={queue_time * 1000:9.2f}ms "
+                    f"speedup={list_time / queue_time:6.1f}x"
+                )
+            self.report_shuffles(build_list, build_queue, options)
@@ -0,0 +1,151 @@
+import asyncio
+import functools
+import statistics
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...extraction_replay import ReplayYoutubeDL, load_fixtures, record_fixture
+from ...ydl_pool import YoutubeDLPool
+from ...youtube_extractor import (
+    AUDIO_PROFILE,
+    PROFILE_OPTIONS,
+    YouTubeExtractorService,
+    slim_info,
+)
+from .benchmark_extractor import BENCHMARK_YDL_OPTIONS, percentile
+
+DEFAULT_FIXTURES_DIR = Path(__file__).resolve().parents[2] / "benchmark_fixtures"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks YouTubeExtractorService offline, replaying recorded extract_info results "
+        "through a stand-in YoutubeDL with a simulated latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--record",
+            nargs="+",
+            metavar="URL",
+            help="Record the info dicts of these Youtube urls instead of benchmarking, it needs network access.",
+        )
+        parser.add_argument("--fixtures-dir", type=Path, default=DEFAULT_FIXTURES_DIR)
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--burst", type=int, default=50)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.3,
+            help="Seconds every replayed extraction takes.",
+        )
+        parser.add_argument("--jitter", type=float, default=0.5)
+        parser.add_argument(
+            "--js-miss-rate",
+            type=float,
+            default=0.0,
+            help="Share of the videos that only return audio formats with js_runtimes.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def report(self, name: str, samples: list[float], elapsed: float = None):
+        line = (
+            f"{name:<28} mean={statistics.mean(samples) * 1000:8.2f}ms "
+            f"p50={percentile(samples, 50) * 1000:8.2f}ms "
+            f"p95={percentile(samples, 95) * 1000:8.2f}ms"
+        )
+        if elapsed:
+            line += f" throughput={len(samples) / elapsed:7.1f}/s"
+        self.stdout.write(line)
+
+    def build_service(self, fixtures: dict, options: dict) -> YouTubeExtractorService:
+        factory = functools.partial(
+            ReplayYoutubeDL,
+            fixtures=fixtures,
+            latency=options["latency"],
+            jitter=options["jitter"],
+            js_miss_rate=options["js_miss_rate"],
+            seed=options["seed"],
+        )
+        # The stand-in YoutubeDL only exists in this process, so the thread backend is used.
+        return YouTubeExtractorService(ydl_pool=YoutubeDLPool(factory=factory))
+
+    async def timed_search(
+        self, service: YouTubeExtractorService, query: str, samples: list[float]
+    ):
+        start = time.perf_counter()
+        song = await service.search(url=query, author="benchmark")
+        samples.append(time.perf_counter() - start)
+        if song is None or not song.source:
+            raise CommandError(f"The replayed extraction of {query} returned no source")
+
+    async def run_scenarios(self, fixtures: dict, options: dict):
+        urls = [f"https://www.youtube.com/watch?v={video_id}" for video_id in fixtures]
+        iterations = options["iterations"]
+
+        samples = []
+        for i in range(iterations):
+            service = self.build_service(fixtures, options)
+            await self.timed_search(service, urls[i % len(urls)], samples)
+            service.close()
+        self.report("single song", samples)
+
+        service = self.build_service(fixtures, options)
+        cold_samples, warm_samples = [], []
+        start = time.perf_counter()
+        for url in urls:
+            await self.timed_search(service, url, cold_samples)
+        self.report("cold cache", cold_samples, time.perf_counter() - start)
+        start = time.perf_counter()
+        for url in urls:
+            await self.timed_search(service, url, warm_samples)
+        self.report("warm cache", warm_samples, time.perf_counter() - start)
+        service.close()
+
+        # A mix of urls and text searches with repeats, like a channel queueing a playlist at once.
+        service = self.build_service(fixtures, options)
+        queries = [
+            urls[i % len(urls)] if i % 2 else f"benchmark query {i % 10}"
+            for i in range(options["burst"])
+        ]
+        samples = []
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(self.timed_search(service, query, samples) for query in queries)
+        )
+        self.report(f"burst of {len(queries)}", samples, time.perf_counter() - start)
+        self.stdout.write(
+            f"js_runtimes policy: {service.js_policy.stats()} "
+            f"pool: created={service.ydl_pool.created} reused={service.ydl_pool.reused}"
+        )
+        service.close()
+
+    def handle(self, *args, **options):
+        fixtures_dir = options["fixtures_dir"]
+        if options["record"]:
+            opts = {**PROFILE_OPTIONS[AUDIO_PROFILE], **BENCHMARK_YDL_OPTIONS}
+            for url in options["record"]:
+                path = record_fixture(url, fixtures_dir, opts)
+                self.stdout.write(f"Recorded {url} to {path}")
+            return
+
+        fixtures = load_fixtures(fixtures_dir)
+        if not fixtures:
+            raise CommandError(
+                f"No fixtures in {fixtures_dir}, record some first with --record URL"
+            )
+
+        service = YouTubeExtractorService()
+        formats = [slim_info(info)["formats"] for info in fixtures.values()]
+        samples = []
+        # A single selection is a few microseconds, so every sample times a batch of them.
+        for _ in range(options["iterations"]):
+            start = time.perf_counter()
+            for i in range(100):
+                service._select_best_audio_source(formats[i % len(formats)])
+            samples.append(time.perf_counter() - start)
+        self.report("select best audio source x100", samples)
+
+        asyncio.run(self.run_scenarios(fixtures, options))
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.28 on 2026-10-17 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("music_bot", "0003_alter_songlog_thumbnail"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchQueryLog",
+            fields=[
+                (
+                    "query",
+                    models.CharField(max_length=500, primary_key=True, serialize=False),
+                ),
+                ("video_id", models.CharField(max_length=32)),
+                ("hit_count", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
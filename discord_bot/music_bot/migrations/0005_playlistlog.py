@@ -0,0 +1,25 @@
+# Generated by Django 4.2.28 on 2026-10-17 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("music_bot", "0004_searchquerylog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlaylistLog",
+            fields=[
+                (
+                    "playlist_id",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("pages", models.JSONField(default=list)),
+                ("hit_count", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
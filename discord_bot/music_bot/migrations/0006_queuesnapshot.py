@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("music_bot", "0005_playlistlog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueueSnapshot",
+            fields=[
+                ("guild_id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("entries", models.JSONField(default=list)),
+                ("playing", models.BooleanField(default=False)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
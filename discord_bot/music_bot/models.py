@@ -9,3 +9,42 @@ class SongLog(models.Model):
 
     def __str__(self):
         return self.title
+
+
+class SearchQueryLog(models.Model):
+    query = models.CharField(primary_key=True, max_length=500)
+    video_id = models.CharField(max_length=32)
+    hit_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.query
+
+
+class PlaylistLog(models.Model):
+    playlist_id = models.CharField(primary_key=True, max_length=64)
+    # [{"token", "next_token", "etag", "video_ids"}] for every page, in playlist order
+    pages = models.JSONField(default=list)
+    hit_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def video_ids(self) -> list:
+        return [video_id for page in self.pages for video_id in page["video_ids"]]
+
+    def __str__(self):
+        return self.playlist_id
+
+
+class QueueSnapshot(models.Model):
+    guild_id = models.BigIntegerField(primary_key=True)
+    # The queue entries in order, starting with the song that was playing if there was one:
+    # {"url", "title", "duration", "thumbnail", "author", "channel"} for songs and
+    # {"playlist": {LazyPlaylist fields}, "channel"} for the playlists that aren't loaded yet.
+    entries = models.JSONField(default=list)
+    # The first entry was playing or paused when the snapshot was taken
+    playing = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return str(self.guild_id)
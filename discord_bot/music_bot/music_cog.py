@@ -1,13 +1,40 @@
 import asyncio
 import logging
+import time
 
 import discord
-import numpy as np
 from discord.ext import commands
-from googleapiclient.discovery import build
 
-from discord_bot.settings import BOT_NAME, DEBUG, MUSIC_CHANNEL, YT_API_KEY
+from discord_bot.settings import (
+    BOT_NAME,
+    DEBUG,
+    MUSIC_CHANNEL,
+    MUSIC_CHANNELS,
+    MUSIC_PLAYER_IDLE_TIMEOUT,
+    MUSIC_QUEUE_SNAPSHOT_INTERVAL,
+    YT_API_KEY,
+    YT_API_RETRIES,
+    YT_API_TIMEOUT,
+    YT_STREAM_CACHE_MARGIN,
+    YT_STREAM_CACHE_SIZE,
+    YTDL_BREAKER_COOLDOWN,
+    YTDL_BREAKER_ERROR_RATE,
+    YTDL_BREAKER_MIN_CALLS,
+    YTDL_EXTRACTION_DEADLINE,
+    YTDL_EXTRACTION_TIMEOUT,
+    YTDL_HEDGE_PERCENTILE,
+    YTDL_PROCESS_WORKERS,
+)
 
+from .dto import LazyPlaylist
+from .extraction_backend import ExtractionBackend
+from .extraction_policy import (
+    CircuitBreaker,
+    ExtractionUnavailableError,
+    LatencyTracker,
+)
+from .guild_player import GuildPlayerRegistry
+from .http_client import HttpClient
 from .music_commands import (
     DISCONNECT_COMMAND_ALIASES,
     HELP_COMMAND_ALIASES,
@@ -20,31 +47,30 @@ from .music_commands import (
     QUEUE_COMMAND_ALIASES,
     RESUME_COMMAND_ALIASES,
     SHUFFLE_COMMAND_ALIASES,
+    SHUFFLE_FAIR_ARGUMENTS,
     SKIP_COMMAND_ALIASES,
+    WHEN_COMMAND_ALIASES,
 )
-from .music_service import MusicService
+from .music_queue import entry_title
+from .queue_snapshots import QueueSnapshotWriter
 from .youtube_extractor import YouTubeExtractorService
 
 logger = logging.getLogger(__name__)
 
+# Seconds between edits of the playlist progress message
+PLAYLIST_PROGRESS_INTERVAL = 3.0
+# Seconds between edits of the queue message while its songs are being completed
+QUEUE_REFRESH_INTERVAL = 2.0
+# Seconds between the checks for idle guild players
+PLAYER_EVICTION_INTERVAL = 60.0
+
 
 class MusicCog(commands.Cog, name="Music Cog"):
     def __init__(self, bot):
         self.bot = bot  # Bot instance
 
-        self.is_playing = False  # To know when the bot is playing music
-        self.is_queue_shuffled = False  # To know when the queue has been shuffled
-        self.is_paused = False  # To know when the bot is paused
-
-        self.music_queue = []  # [song, channel] The main music queue of songs to play
-        self.shuffled_music_queue = (
-            []
-        )  # [song, channel] used to store temporarily the shuffled queue, this avoids problems when a song is playing
-        self.now_playing = []  # [song] To display the info of the current song playing
-        self.embeded_queue = []  # The embed info of the queue embed messages
-
         self.youtube_api_key = YT_API_KEY
-        self.youtube = build("youtube", "v3", developerKey=self.youtube_api_key)
+        self.http_client = HttpClient(timeout=YT_API_TIMEOUT, retries=YT_API_RETRIES)
 
         self.FFMPEG_OPTIONS = {
             "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5",
@@ -58,31 +84,135 @@ class MusicCog(commands.Cog, name="Music Cog"):
         self.youtube_extractor = YouTubeExtractorService(
             ydl_options=self.YDL_OPTIONS,
             test_mode=self.test_mode,
+            stream_cache_size=YT_STREAM_CACHE_SIZE,
+            stream_cache_margin=YT_STREAM_CACHE_MARGIN,
+            backend=ExtractionBackend(
+                workers=YTDL_PROCESS_WORKERS, timeout=YTDL_EXTRACTION_TIMEOUT
+            ),
+            deadline=YTDL_EXTRACTION_DEADLINE,
+            latency_tracker=LatencyTracker(percentile=YTDL_HEDGE_PERCENTILE),
+            circuit_breaker=CircuitBreaker(
+                error_rate=YTDL_BREAKER_ERROR_RATE,
+                min_calls=YTDL_BREAKER_MIN_CALLS,
+                cooldown=YTDL_BREAKER_COOLDOWN,
+            ),
         )
-        self.music_service = MusicService(self)
-
-        self.current_voice_channel = (
-            None  # Stores current channel the bot is connected to
+        # The queue and playback state of every guild, created on its first command.
+        self.players = GuildPlayerRegistry(
+            self,
+            music_channels=MUSIC_CHANNELS,
+            default_music_channel=MUSIC_CHANNEL,
+            idle_timeout=MUSIC_PLAYER_IDLE_TIMEOUT,
         )
+        self.eviction_task = None  # Task evicting the idle players
+        # Saves the changed queues every MUSIC_QUEUE_SNAPSHOT_INTERVAL seconds, they are restored on startup.
+        self.queue_snapshots = QueueSnapshotWriter(self.players)
+        self.snapshot_task = None  # Task restoring the queues and then saving them
 
         # The endpoint in which the django web page documentation of music commands is running.
         self.help_commands_url = ""
         if self.test_mode is True:
             self.help_commands_url = "http://127.0.0.1:8000/marbotest/commands_help/"
 
+    async def cog_load(self):
+        """
+        Discord.py hook called when the cog is added to the bot, starts the idle player eviction.
+        """
+        self.eviction_task = asyncio.create_task(self._evict_idle_players())
+
+    async def cog_unload(self):
+        """
+        Discord.py hook called when the cog is removed, stops the background work and releases resources.
+        """
+        if self.eviction_task:
+            self.eviction_task.cancel()
+        if self.snapshot_task:
+            self.snapshot_task.cancel()
+            try:
+                # The queues changed since the last flush, ex: on a deploy.
+                await self.queue_snapshots.flush()
+            except Exception as e:
+                logger.error("Error saving the queues: %s", e)
+        await self.players.close_all()
+        self.youtube_extractor.close()
+        await self.http_client.close()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """
+        Discord.py event called when the bot is connected, restores the saved queues the first time.
+        """
+        if MUSIC_QUEUE_SNAPSHOT_INTERVAL > 0 and self.snapshot_task is None:
+            self.snapshot_task = asyncio.create_task(self._snapshot_queues())
+
+    async def cog_command_error(self, context, error):
+        """
+        Discord.py hook called when a command of this cog raises an error.
+        Params:
+            * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
+            * error: The error raised, wrapped by discord.py in a CommandInvokeError
+        """
+        original_error = getattr(error, "original", error)
+        if isinstance(original_error, ExtractionUnavailableError):
+            # The extraction circuit breaker is open, Youtube is failing or throttling us.
+            await context.send(
+                f"Mae Youtube no está respondiendo, espere unos {int(original_error.retry_after) + 1} segundos e intente de nuevo."
+            )
+        else:
+            # Same as discord.py's default handler, which is skipped when a cog defines this hook.
+            logger.error(
+                "Ignoring exception in command %s", context.command, exc_info=error
+            )
+
     # UTIL METHODS
 
+    async def _evict_idle_players(self):
+        """
+        Util method that periodically drops the players of the guilds that stopped using the bot.
+        """
+        while True:
+            await asyncio.sleep(PLAYER_EVICTION_INTERVAL)
+            try:
+                await self.players.evict_idle()
+            except Exception as e:
+                logger.error("Error evicting the idle players: %s", e)
+
+    async def _snapshot_queues(self):
+        """
+        Util method that restores the saved queues, resumes the ones that were playing if someone is still in
+        their voice channel, and then periodically saves the queues that changed.
+        """
+        try:
+            resumable = await self.queue_snapshots.restore(self.bot.guilds)
+        except Exception as e:
+            logger.error("Error restoring the queues: %s", e)
+            resumable = []
+
+        listening = [
+            player.start_playing(voice_channel)
+            for player, voice_channel in resumable
+            if any(not member.bot for member in voice_channel.members)
+        ]
+        await asyncio.gather(*listening, return_exceptions=True)
+
+        while True:
+            await asyncio.sleep(MUSIC_QUEUE_SNAPSHOT_INTERVAL)
+            try:
+                await self.queue_snapshots.flush()
+            except Exception as e:
+                logger.error("Error saving the queues: %s", e)
+
     async def _check_if_valid(context):
         """
         Util method used with the @commands.check so it only enables the use of the musicCog commands if:
-            - The command was issued in the correct music text channel.
+            - The command was issued in the music text channel of its guild.
             - The author that sent the command is present in a voice channel.
         Params:
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
         Returns:
             * (Boolean)
         """
-        accepted_channel = MUSIC_CHANNEL
+        accepted_channel = context.cog.players.music_channel(context.guild)
         if context.message.channel.id != accepted_channel:
             await context.send("Este canal no está aceptando comandos.")
             return False
@@ -91,24 +221,25 @@ class MusicCog(commands.Cog, name="Music Cog"):
             return False
         return True
 
-    async def _check_self_bot(self, context):
+    async def _check_self_bot(self, context, player):
         """
         Util method used to only enable the use of the musicCog commands if:
             - The author that send the command is in the same voice channel as the bot.
             - The bot is playing audio in a voice channel.
         Params:
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
+            * (GuildPlayer) player: The player of the guild of the command
         Returns:
             * (Boolean)
         """
         # This means that the user is in a voice channel
         if context.author.voice:
             # This means the bot is currently playing a song
-            if self.is_playing:
+            if player.is_playing:
                 # This means that the user is not in the same channel as the bot
                 if (
                     context.author.voice.channel.name
-                    != self.current_voice_channel.channel.name
+                    != player.current_voice_channel.channel.name
                 ):
                     await context.send(
                         f"Mae no estás en el mismo canal de voz que {BOT_NAME}."
@@ -124,11 +255,57 @@ class MusicCog(commands.Cog, name="Music Cog"):
         acepted_commands.extend(PLAY_COMMAND_ALIASES)
         acepted_commands.extend(DISCONNECT_COMMAND_ALIASES)
         acepted_commands.extend(PLAY_NEXT_COMMAND_ALIASES)
-        if not self.current_voice_channel and command not in acepted_commands:
+        if not player.current_voice_channel and command not in acepted_commands:
             await context.send(f"Mae el {BOT_NAME} no esta en ningun canal de voz.")
             return False
         return True
 
+    async def _enqueue_playlist(self, context, player, url: str, voice_channel):
+        """
+        Util method that adds the songs of a Youtube playlist to the queue page by page, starting to play
+        as soon as the first page is ready and keeping a progress message updated.
+        Params:
+            * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
+            * (GuildPlayer) player: The player of the guild of the command
+            * url: The complete url of a Youtube playlist
+            * voice_channel: The voice channel of the user that requested the playlist
+        """
+        progress_message = await context.send("Procesando la playlist...")
+        songs_added = 0
+        songs_pending = 0  # Songs of a LazyPlaylist that are loaded later
+        last_progress_edit = time.monotonic()
+
+        async for songs in player.music_service.stream_youtube_playlist(
+            url=url, context=context
+        ):
+            for song in songs:
+                player.music_queue.append(song, voice_channel)
+                if isinstance(song, LazyPlaylist):
+                    songs_pending += song.remaining_videos
+                else:
+                    songs_added += 1
+
+            player.prefetcher.schedule()
+            await player.start_playing(voice_channel)
+
+            # Discord rate limits message edits, so the progress is updated every few seconds.
+            if time.monotonic() - last_progress_edit >= PLAYLIST_PROGRESS_INTERVAL:
+                await progress_message.edit(
+                    content=f"Procesando la playlist... {songs_added} canciones añadidas"
+                )
+                last_progress_edit = time.monotonic()
+
+        if songs_pending:
+            await progress_message.edit(
+                content=f"{songs_added} canciones añadidas a la colaヾ(•ω•`)o, las otras ~{songs_pending} se cargan conforme suene la playlist."
+            )
+        elif songs_added:
+            await progress_message.edit(
+                content=f"{songs_added} canciones añadidas a la colaヾ(•ω•`)o"
+            )
+        else:
+            await progress_message.edit(content="Mae no se pudo poner la playlist!")
+
     # COMMANDS METHODS
 
     @commands.command(aliases=PLAY_COMMAND_ALIASES)
@@ -144,41 +321,25 @@ class MusicCog(commands.Cog, name="Music Cog"):
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
             * args: The link of the Youtube video or Youtube search text
         """
-        if await self._check_self_bot(context):
+        player = self.players.get(context.guild)
+        if await self._check_self_bot(context, player):
             youtube_query = " ".join(args)
             voice_channel = context.author.voice.channel
             author_of_command = context.author.name
 
-            youtube_query = self.music_service.sanitize_youtube_query(
+            youtube_query = player.music_service.sanitize_youtube_query(
                 youtube_query=youtube_query
             )
-            is_playlist = self.music_service.is_youtube_playlist(
+            is_playlist = player.music_service.is_youtube_playlist(
                 youtube_query=youtube_query
             )
 
             if is_playlist:
-                await context.send("Procesando la playlist...")
-                playlist_info = await self.music_service.search_youtube_playlist(
-                    url=youtube_query, context=context
+                await self._enqueue_playlist(
+                    context, player, url=youtube_query, voice_channel=voice_channel
                 )
-                if not playlist_info:
-                    await context.send("Mae no se pudo poner la playlist!")
-                else:
-                    for songs_added, video in enumerate(playlist_info):
-                        self.music_queue.append([video, voice_channel])
-                        if songs_added == 1:
-                            if self.is_playing is False and self.is_paused is False:
-                                # Try to connect to a voice channel if you are not already connected
-                                await self.music_service.try_to_connect(
-                                    voice_channel_to_connect=voice_channel
-                                )
-                                await self.music_service.reproduce_next_song_in_queue()
-
-                    await context.send(
-                        f"{songs_added} canciones añadidas a la colaヾ(•ω•`)o"
-                    )
             else:
-                song_info = await self.music_service.search_youtube_url(
+                song_info = await player.music_service.search_youtube_url(
                     url=youtube_query, author=author_of_command
                 )
                 if not song_info:
@@ -186,21 +347,17 @@ class MusicCog(commands.Cog, name="Music Cog"):
                     # reproduce a playlist or livestream. Search later if this can be avoided.
                     await context.send("Mae no se pudo descargar la canción.")
                 else:
-                    await self.music_service.save_song(
+                    await player.music_service.save_song(
                         url=song_info.url,
                         title=song_info.title,
                         duration=song_info.duration,
                         thumbnail=song_info.thumbnail,
                     )
-                    self.music_queue.append([song_info, voice_channel])
+                    player.music_queue.append(song_info, voice_channel)
                     await context.send("Canción añadida a la colaヾ(•ω•`)o")
 
-            if self.is_playing is False and self.is_paused is False:
-                # Try to connect to a voice channel if you are not already connected
-                await self.music_service.try_to_connect(
-                    voice_channel_to_connect=voice_channel
-                )
-                await self.music_service.reproduce_next_song_in_queue()
+            player.prefetcher.schedule()
+            await player.start_playing(voice_channel)
 
     @commands.command(aliases=QUEUE_COMMAND_ALIASES)
     @commands.check(_check_if_valid)
@@ -210,129 +367,35 @@ class MusicCog(commands.Cog, name="Music Cog"):
         Params:
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
         """
-        if await self._check_self_bot(context):
-            if len(self.music_queue) > 0:
-                current = 0  # Current embed being displayed
-                queue_display_msg = ""  # Message added to field of embed object.
-                embed_songs = 0  # Each time a song is added to the embed queue.
-                queue_display_list = (
-                    []
-                )  # Local list so when a song leaves the queue doesn't generate an index error.
-                self.embeded_queue = (
-                    []
-                )  # We reset the embeded queue if multiple calls of queue command are done.
-                queue_duration = 0  # Total duration of all the songs in queue.
-
-                if self.is_queue_shuffled is True:
-                    # We want to show the user the queue shuffled if he calls this command
-                    # after shuffling the queue.
-                    queue_display_list = self.shuffled_music_queue
-
+        player = self.players.get(context.guild)
+        if await self._check_self_bot(context, player):
+            embed = player.queue_pages.page(player.music_queue, 0)
+            if embed:
+                # The page being displayed, shared with the task that completes the songs.
+                view = {"page": 0, "embed": embed}
+                needs_info = player.music_service.queue_needs_info(player.music_queue)
+                # Completing the songs can add pages, so the buttons are needed in that case too.
+                if (
+                    player.queue_pages.page_count(player.music_queue) == 1
+                    and not needs_info
+                ):
+                    await context.send(embed=embed, delete_after=60.0)
                 else:
-                    queue_display_list = self.music_queue
-
-                while embed_songs < len(queue_display_list):
-                    next_song_info = ""
-                    song_info = queue_display_list[embed_songs][0]
-                    if song_info.title == "" or song_info.duration == 0.0:
-                        # This means Youtube Data API couldn't or hasn't retrieved the information
-                        # for the song. So we need to fetch it to be able to display it in the queue
-                        next_song_info = await self.music_service.retrieve_song(
-                            url=self.music_queue[embed_songs][0].url
-                        )
-                        if not next_song_info:
-                            # If retriving the info from our db didn't work
-                            next_song_info = (
-                                await self.music_service.search_youtube_url(
-                                    url=self.music_queue[embed_songs][0].url,
-                                    author=self.music_queue[embed_songs][0].author,
-                                )
-                            )
-
-                        if next_song_info:
-                            # If retriving the info from our db worked
-                            self.music_queue[embed_songs][0] = next_song_info
-                            queue_display_list[embed_songs][0] = next_song_info
-                            title = next_song_info.title
-                            url = next_song_info.url
-                            duration = next_song_info.duration
-                            author = next_song_info.author
-                        else:
-                            # We exhausted our possibilities so we can't play it and
-                            # should remove it from the queue
-                            self.music_queue.pop(embed_songs)
-
-                    else:
-                        # This means we have the information of the song so let's just add it
-                        title = queue_display_list[embed_songs][0].title
-                        url = queue_display_list[embed_songs][0].url
-                        duration = queue_display_list[embed_songs][0].duration
-                        author = queue_display_list[embed_songs][0].author
-
-                    embed_message = f"`{queue_display_msg}{str(embed_songs + 1)} -` [{title}]({url})|`{self.music_service.convert_seconds(duration)} ({author})`\n"
-
-                    if len(embed_message) < 1024:
-                        # This means we reached the maximun that an embed field can handle.
-                        if embed_songs < len(queue_display_list):
-                            # If we haven't reached the end of the music_queue
-                            queue_display_msg += f"`{str(embed_songs + 1)} -` [{title}]({url})|`{self.music_service.convert_seconds(duration)} ({author})`\n"
-                            queue_duration += duration
-                            embed_songs += 1
-
-                        if embed_songs == len(queue_display_list):
-                            # This means we add the last embed necessary to the
-                            # queue.
-                            self.music_service.add_embed_in_queue(queue_display_msg)
-                    else:
-                        # So we add that embed to the queue of usable embeds and reset the message
-                        # to fill as many other embeds as needed to show all songs in queue.
-                        self.music_service.add_embed_in_queue(queue_display_msg)
-                        queue_display_msg = ""
-
-                if len(self.embeded_queue) == 1:
-                    embeded_queue_item = self.embeded_queue[current]
-                    if len(queue_display_list) == 1:
-                        embeded_queue_item.add_field(
-                            name="\u200b",
-                            value=f"**{len(queue_display_list)} song in queue | {self.music_service.convert_seconds(queue_duration)} queue duration**",
-                            inline=False,
-                        )
-                    else:
-                        embeded_queue_item.add_field(
-                            name="\u200b",
-                            value=f"**{len(queue_display_list)} songs in queue | {self.music_service.convert_seconds(queue_duration)} queue duration**",
-                            inline=False,
-                        )
-
-                    embeded_queue_item.set_footer(
-                        text="Page 1/1",
-                        icon_url="https://cdn-icons-png.flaticon.com/512/1384/1384061.png",
-                    )
-                    msg = await context.send(
-                        embed=embeded_queue_item, delete_after=60.0
-                    )
-
-                elif len(self.embeded_queue) > 1:
                     buttons = [
                         "\u23ea",
                         "\u2b05",
                         "\u27a1",
                         "\u23e9",
                     ]  # Skip to start, left, right, skip to end buttons.
-                    # We only need the pagination functionality if there are multiple embed queue pages.
-
-                    embeded_queue_item = self.embeded_queue[current]
-                    embeded_queue_item.add_field(
-                        name="\u200b",
-                        value=f"**{len(queue_display_list)} songs in queue | {self.music_service.convert_seconds(queue_duration)} queue duration**",
-                        inline=False,
-                    )
-                    embeded_queue_item.set_footer(
-                        text=f"Page {current + 1}/{len(self.embeded_queue)}",
-                        icon_url="https://cdn-icons-png.flaticon.com/512/1384/1384061.png",
-                    )
+                    # We only need the pagination functionality if there are multiple queue pages.
 
-                    msg = await context.send(embed=self.embeded_queue[current])
+                    msg = await context.send(embed=embed)
+                    if needs_info:
+                        task = asyncio.create_task(
+                            self._complete_queue_message(player, msg, view)
+                        )
+                        player.queue_completion_tasks.add(task)
+                        task.add_done_callback(player.queue_completion_tasks.discard)
                     for button in buttons:
                         await msg.add_reaction(button)
 
@@ -351,52 +414,79 @@ class MusicCog(commands.Cog, name="Music Cog"):
                             return
 
                         else:
-                            previous_page = current
+                            # The queue may have changed since the last page was shown.
+                            last_page = (
+                                player.queue_pages.page_count(player.music_queue) - 1
+                            )
                             if reaction.emoji == "\u23ea":  # Skip to Start
-                                current = 0
+                                view["page"] = 0
 
                             elif reaction.emoji == "\u2b05":  # Previous queue page
-                                if current > 0:
-                                    current -= 1
+                                view["page"] = max(view["page"] - 1, 0)
 
                             elif reaction.emoji == "\u27a1":  # Next queue page
-                                if current < len(self.embeded_queue) - 1:
-                                    current += 1
+                                view["page"] = min(view["page"] + 1, last_page)
 
                             elif reaction.emoji == "\u23e9":  # Last queue page
-                                current = len(self.embeded_queue) - 1
+                                view["page"] = last_page
 
                             for button in buttons:
                                 await msg.remove_reaction(button, context.author)
 
-                            if current != previous_page:
-                                embeded_queue_item = self.embeded_queue[current]
-
-                                if (
-                                    len(embeded_queue_item.fields) > 1
-                                ):  # If the info field was already added just modify it instead of re adding it.
-                                    embeded_queue_item.set_field_at(
-                                        index=1,
-                                        name="\u200b",
-                                        value=f"**{len(queue_display_list)} songs in queue | {self.music_service.convert_seconds(queue_duration)} queue duration**",
-                                        inline=False,
-                                    )
-                                else:
-                                    embeded_queue_item.add_field(
-                                        name="\u200b",
-                                        value=f"**{len(queue_display_list)} songs in queue | {self.music_service.convert_seconds(queue_duration)} queue duration**",
-                                        inline=False,
-                                    )
-
-                                embeded_queue_item.set_footer(
-                                    text=f"Page {current + 1}/{len(self.embeded_queue)}",
-                                    icon_url="https://cdn-icons-png.flaticon.com/512/1384/1384061.png",
-                                )
-                                await msg.edit(embed=embeded_queue_item)
+                            if not await self._show_queue_page(player, msg, view):
+                                await msg.delete()
+                                return
 
             else:
                 await context.send("Actualmente no hay música en la cola 💔")
 
+    async def _show_queue_page(self, player, message, view: dict) -> bool:
+        """
+        Util method that edits a queue message if the page it displays changed.
+        Params:
+            * (GuildPlayer) player: The player whose queue the message displays.
+            * message: The discord message of the queue command.
+            * (Dict) view: The page number and embed the message is displaying.
+        Returns:
+            * (Boolean) False if the queue is empty and there's nothing to display.
+        """
+        embed = player.queue_pages.page(player.music_queue, view["page"])
+        if embed is None:
+            return False
+        if embed is not view["embed"]:
+            # Either another page or the same one after the queue changed.
+            view["embed"] = embed
+            await message.edit(embed=embed)
+        return True
+
+    async def _complete_queue_message(self, player, message, view: dict):
+        """
+        Util method that completes the info of the queued songs in the background and edits the queue
+        message as it arrives, at most once every QUEUE_REFRESH_INTERVAL seconds.
+        Params:
+            * (GuildPlayer) player: The player whose queue the message displays.
+            * message: The discord message of the queue command.
+            * (Dict) view: The page number and embed the message is displaying.
+        """
+        last_edit = time.monotonic()
+        pending_edit = False
+        async for _ in player.music_service.complete_queue_songs(player.music_queue):
+            pending_edit = True
+            if message and time.monotonic() - last_edit >= QUEUE_REFRESH_INTERVAL:
+                message = await self._edit_queue_message(player, message, view)
+                last_edit = time.monotonic()
+                pending_edit = False
+        if message and pending_edit:
+            await self._edit_queue_message(player, message, view)
+
+    async def _edit_queue_message(self, player, message, view: dict):
+        try:
+            await self._show_queue_page(player, message, view)
+            return message
+        except discord.HTTPException:
+            # The message was deleted, the songs are still completed for the next queue command.
+            return None
+
     @commands.command(aliases=SKIP_COMMAND_ALIASES)
     @commands.check(_check_if_valid)
     async def skip(self, context):
@@ -405,11 +495,12 @@ class MusicCog(commands.Cog, name="Music Cog"):
         Params:
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
         """
-        if await self._check_self_bot(context):
-            if self.current_voice_channel:
-                if self.current_voice_channel.is_playing():
+        player = self.players.get(context.guild)
+        if await self._check_self_bot(context, player):
+            if player.current_voice_channel:
+                if player.current_voice_channel.is_playing():
                     # This will trigger the lambda e function from MusicService.reproduce_next_song_in_queue method to jump to the next song in queue
-                    self.current_voice_channel.stop()
+                    player.current_voice_channel.stop()
                 else:
                     await context.send(f"{BOT_NAME} no esta tocando ninguna canción.")
             else:
@@ -419,18 +510,22 @@ class MusicCog(commands.Cog, name="Music Cog"):
 
     @commands.command(aliases=SHUFFLE_COMMAND_ALIASES)
     @commands.check(_check_if_valid)
-    async def shuffle(self, context):
+    async def shuffle(self, context, *args):
         """
         Command that shuffles the order of the current songs on the music queue if any.
         Params:
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
+            * args: Optionally "justo", to spread the songs of each person evenly along the queue.
         """
-        if await self._check_self_bot(context):
-            if len(self.music_queue) > 0:
-                numpy_array = np.array(self.music_queue)
-                np.random.shuffle(numpy_array)
-                self.shuffled_music_queue = numpy_array.tolist()
-                self.is_queue_shuffled = True
+        player = self.players.get(context.guild)
+        if await self._check_self_bot(context, player):
+            if len(player.music_queue) > 0:
+                fair = bool(args) and args[0].lower() in SHUFFLE_FAIR_ARGUMENTS
+                player.music_queue.shuffle(
+                    rng=player.shuffle_random,
+                    fair_by=(lambda entry: entry.song.author) if fair else None,
+                )
+                player.prefetcher.schedule()
                 await context.send("Le hiciste brrrr a esa cola c:")
             else:
                 await context.send("La cola no tiene canciones actualmente :c")
@@ -443,12 +538,13 @@ class MusicCog(commands.Cog, name="Music Cog"):
         Params:
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
         """
-        if await self._check_self_bot(context):
-            if self.is_playing:
-                title = self.now_playing[0].title
-                url = self.now_playing[0].url
-                author = self.now_playing[0].author
-                duration = self.now_playing[0].duration
+        player = self.players.get(context.guild)
+        if await self._check_self_bot(context, player):
+            if player.is_playing:
+                title = player.now_playing[0].title
+                url = player.now_playing[0].url
+                author = player.now_playing[0].author
+                duration = player.now_playing[0].duration
 
                 # [{title}]({url})
                 await context.send(
@@ -456,15 +552,68 @@ class MusicCog(commands.Cog, name="Music Cog"):
                     .add_field(name="Canción Actual", value=f"[{title}]({url})")
                     .add_field(
                         name="Duración",
-                        value=self.music_service.convert_seconds(duration),
+                        value=player.music_service.convert_seconds(duration),
                     )
                     .add_field(name="Added by", value=author)
-                    .set_thumbnail(url=self.now_playing[0].thumbnail),
+                    .set_thumbnail(url=player.now_playing[0].thumbnail),
                     delete_after=60.0,
                 )
             else:
                 await context.send("Actualmente no se está tocando ninguna canción.")
 
+    @commands.command(aliases=WHEN_COMMAND_ALIASES)
+    @commands.check(_check_if_valid)
+    async def when(self, context, *args):
+        """
+        Command that shows how long until a song of the queue plays.
+        Params:
+            * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
+            * args: The position of the song in the queue, without it the next song of the user is used.
+        """
+        player = self.players.get(context.guild)
+        if await self._check_self_bot(context, player):
+            if len(player.music_queue) == 0:
+                await context.send("La cola no tiene canciones actualmente :c")
+                return
+
+            if args:
+                if not args[0].isdigit() or not (
+                    0 < int(args[0]) <= len(player.music_queue)
+                ):
+                    await context.send(
+                        f"La posición debe ser un número entre 1 y {len(player.music_queue)}."
+                    )
+                    return
+                position = int(args[0]) - 1
+            else:
+                requester = {context.author.name, context.author.nick}
+                position = next(
+                    (
+                        index
+                        for index, entry in enumerate(player.music_queue)
+                        if entry.song.author in requester
+                    ),
+                    None,
+                )
+                if position is None:
+                    await context.send("No tenés canciones en la cola.")
+                    return
+
+            song = player.music_queue[position].song
+            title = entry_title(song)
+            wait = player.music_service.current_song_remaining()
+            wait += player.music_queue.duration_before(position)
+
+            await context.send(
+                embed=discord.Embed(color=discord.Color.blurple())
+                .add_field(name="Canción", value=f"[{title}]({song.url})")
+                .add_field(name="Posición", value=str(position + 1))
+                .add_field(
+                    name="Suena en", value=player.music_service.convert_seconds(wait)
+                ),
+                delete_after=60.0,
+            )
+
     @commands.command(aliases=JOIN_COMMAND_ALIASES)
     @commands.check(_check_if_valid)
     async def join(self, context):
@@ -473,7 +622,8 @@ class MusicCog(commands.Cog, name="Music Cog"):
         Params:
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
         """
-        await self.music_service.try_to_connect(context.author.voice.channel)
+        player = self.players.get(context.guild)
+        await player.music_service.try_to_connect(context.author.voice.channel)
 
     @commands.command(aliases=PAUSE_COMMAND_ALIASES)
     @commands.check(_check_if_valid)
@@ -483,11 +633,13 @@ class MusicCog(commands.Cog, name="Music Cog"):
         Params:
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
         """
-        if await self._check_self_bot(context):
-            if self.is_playing and self.current_voice_channel:
-                self.current_voice_channel.pause()
-                self.is_paused = True
-                self.is_playing = False
+        player = self.players.get(context.guild)
+        if await self._check_self_bot(context, player):
+            if player.is_playing and player.current_voice_channel:
+                player.current_voice_channel.pause()
+                player.song_paused_at = time.monotonic()
+                player.is_paused = True
+                player.is_playing = False
                 await context.send(f"Al {BOT_NAME} se le paró... la canción (╹ڡ╹ )")
 
     @commands.command(aliases=RESUME_COMMAND_ALIASES)
@@ -498,11 +650,19 @@ class MusicCog(commands.Cog, name="Music Cog"):
         Params:
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
         """
-        if await self._check_self_bot(context):
-            if self.is_paused and self.current_voice_channel:
-                self.current_voice_channel.resume()
-                self.is_paused = False
-                self.is_playing = True
+        player = self.players.get(context.guild)
+        if await self._check_self_bot(context, player):
+            if player.is_paused and player.current_voice_channel:
+                player.current_voice_channel.resume()
+                if (
+                    player.song_started_at is not None
+                    and player.song_paused_at is not None
+                ):
+                    # The paused time doesn't count as played.
+                    player.song_started_at += time.monotonic() - player.song_paused_at
+                player.song_paused_at = None
+                player.is_paused = False
+                player.is_playing = True
                 await context.send(
                     f"El {BOT_NAME} te seguirá tocando... la canción ♪(´▽｀)"
                 )
@@ -516,8 +676,9 @@ class MusicCog(commands.Cog, name="Music Cog"):
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
             * args: The numerical position to move in the queue.
         """
-        if await self._check_self_bot(context):
-            if len(self.music_queue) > 0:
+        player = self.players.get(context.guild)
+        if await self._check_self_bot(context, player):
+            if len(player.music_queue) > 0:
                 positions = " ".join(args).split(" ")
                 if len(positions) < 3 and positions[0] != "":
                     # This command only works for 1 or 2 parameters.
@@ -528,20 +689,22 @@ class MusicCog(commands.Cog, name="Music Cog"):
                         position_two = int(positions[1]) - 1
 
                         if position_one >= 0 or position_two >= 0:
-                            insert_this_item = self.music_queue.pop(position_one)
-                            self.music_queue.insert(position_two, insert_this_item)
+                            insert_this_item = player.music_queue.move(
+                                position_one, position_two
+                            )
+                            player.prefetcher.schedule()
                             await context.send(
-                                f"{insert_this_item[0].title} reprogramada a la posición {position_two + 1}! ✪ ω ✪"
+                                f"{entry_title(insert_this_item.song)} reprogramada a la posición {position_two + 1}! ✪ ω ✪"
                             )
                         else:
                             await context.send("Los parámetros deben ser mayores a 0!")
                     else:  # Logic when only 1 paramater move X = move X -> 1
                         position_one = int(positions[0]) - 1
                         if position_one >= 0:
-                            insert_this_item = self.music_queue.pop(position_one)
-                            self.music_queue.insert(0, insert_this_item)
+                            insert_this_item = player.music_queue.move(position_one, 0)
+                            player.prefetcher.schedule()
                             await context.send(
-                                f"{insert_this_item[0].title} reprogramada a la posición 1! ✪ ω ✪"
+                                f"{entry_title(insert_this_item.song)} reprogramada a la posición 1! ✪ ω ✪"
                             )
                 else:
                     await context.send(
@@ -557,7 +720,7 @@ class MusicCog(commands.Cog, name="Music Cog"):
         Params:
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
         """
-        accepted_channel = MUSIC_CHANNEL
+        accepted_channel = self.players.music_channel(context.guild)
         if context.message.channel.id != accepted_channel:
             await context.send("Este canal no está aceptando comandos.")
         else:
@@ -578,15 +741,19 @@ class MusicCog(commands.Cog, name="Music Cog"):
         Params:
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
         """
-        if await self._check_self_bot(context):
-            if self.current_voice_channel:
-                if self.current_voice_channel.is_connected():
+        player = self.players.get(context.guild)
+        if await self._check_self_bot(context, player):
+            if player.current_voice_channel:
+                if player.current_voice_channel.is_connected():
                     voice_client = context.guild.voice_client
                     await voice_client.disconnect()
-                    self.current_voice_channel = None
-                    self.is_playing = False
-                    self.music_queue = []
-                    self.now_playing = []
+                    player.current_voice_channel = None
+                    player.is_playing = False
+                    player.is_paused = False
+                    player.music_queue.clear()
+                    player.now_playing = []
+                    player.song_started_at = None
+                    player.prefetcher.cancel_all()
             else:
                 await context.send(
                     f"El {BOT_NAME} no está conectado a un canal de voz."
@@ -601,21 +768,22 @@ class MusicCog(commands.Cog, name="Music Cog"):
             * context: This class contains a lot of meta data an represents the context in which a command is being invoked under
             * args: The link of the Youtube video or Youtube search text
         """
-        if await self._check_self_bot(context):
-            if len(self.music_queue) > 0:
+        player = self.players.get(context.guild)
+        if await self._check_self_bot(context, player):
+            if len(player.music_queue) > 0:
                 youtube_query = " ".join(args)
                 voice_channel = context.author.voice.channel
                 author_of_command = context.author.name
 
-                youtube_query = self.music_service.sanitize_youtube_query(
+                youtube_query = player.music_service.sanitize_youtube_query(
                     youtube_query=youtube_query
                 )
-                is_playlist = self.music_service.is_youtube_playlist(
+                is_playlist = player.music_service.is_youtube_playlist(
                     youtube_query=youtube_query
                 )
 
                 if not is_playlist:
-                    song_info = await self.music_service.search_youtube_url(
+                    song_info = await player.music_service.search_youtube_url(
                         url=youtube_query, author=author_of_command
                     )
                     if not song_info:
@@ -623,13 +791,14 @@ class MusicCog(commands.Cog, name="Music Cog"):
                         # reproduce a playlist or livestream. Search later if this can be avoided.
                         await context.send("Mae no se pudo descargar la canción.")
                     else:
-                        await self.music_service.save_song(
+                        await player.music_service.save_song(
                             url=song_info.url,
                             title=song_info.title,
                             duration=song_info.duration,
                             thumbnail=song_info.thumbnail,
                         )
-                        self.music_queue.insert(0, [song_info, voice_channel])
+                        player.music_queue.insert(0, song_info, voice_channel)
+                        player.prefetcher.schedule()
                         await context.send(
                             "Canción añadida al inicio de la colaヾ(•ω•`)o"
                         )
@@ -9,6 +9,8 @@ SKIP_COMMAND_ALIASES = ["saltela", "s", "siguiente"]
 
 # Shuffle Command
 SHUFFLE_COMMAND_ALIASES = ["barajela", "b"]
+# Arguments of the shuffle command that spread the songs of each person evenly
+SHUFFLE_FAIR_ARGUMENTS = ["justo", "fair"]
 
 # Now Playing Command
 NOW_PLAYING_COMMAND_ALIASES = ["np", "cual", "cual suena", "zelda", "z", "ls"]
@@ -33,3 +35,6 @@ DISCONNECT_COMMAND_ALIASES = ["jale", "desconectar", "apagar"]
 
 # Play Next Command
 PLAY_NEXT_COMMAND_ALIASES = ["pn", "n"]
+
+# When Command
+WHEN_COMMAND_ALIASES = ["cuando", "eta", "w"]
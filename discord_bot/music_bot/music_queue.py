@@ -0,0 +1,533 @@
+import random
+from bisect import bisect_right
+from itertools import accumulate, batched, chain, islice
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Hashable, Iterable, Iterator, Optional, Union
+
+from .dto import LazyPlaylist, SongInfoDTO
+
+# Entries of a block of the MusicQueue, it is split once it doubles and merged into a neighbour under a quarter
+BLOCK_SIZE = 2048
+ENTRY_SECONDS = attrgetter("seconds")
+
+
+class QueueEntry:
+    """
+    A song of the music queue and the voice channel it was requested from.
+    """
+
+    __slots__ = ("song", "channel", "seconds", "block")
+
+    def __init__(self, song: Union[SongInfoDTO, LazyPlaylist], channel: Any):
+        self.song = song
+        self.channel = channel
+        # The duration counted for the song and the block holding the entry, both kept by the MusicQueue
+        self.seconds = entry_duration(song)
+        self.block: Optional["QueueBlock"] = None
+
+    def __repr__(self):
+        return f"QueueEntry({self.song!r}, {self.channel!r})"
+
+
+def spread_by_key(
+    entries: list[QueueEntry],
+    key: Callable[[QueueEntry], Hashable],
+    rng: random.Random,
+) -> list[QueueEntry]:
+    """
+    Shuffle entries so the ones that share a key (ex: the same requester) are spread evenly instead of
+    clumping together. Every group is shuffled and its entries get evenly spaced slots in [0, 1) with a
+    random offset and a small jitter, then all the slots are merged in order.
+    Params:
+        * (List) entries: The entries to shuffle.
+        * (Callable) key: Returns the group of an entry.
+        * (Random) rng: The random number generator to use.
+    Returns:
+        * (List) The same entries in their new order.
+    """
+    groups: dict[Hashable, list[QueueEntry]] = {}
+    for entry in entries:
+        groups.setdefault(key(entry), []).append(entry)
+
+    slots = []
+    for group in groups.values():
+        rng.shuffle(group)
+        step = 1 / len(group)
+        offset = rng.random() * step
+        for index, entry in enumerate(group):
+            jitter = rng.uniform(-0.1, 0.1) * step
+            slots.append((offset + index * step + jitter, entry))
+    slots.sort(key=itemgetter(0))
+    return [entry for _, entry in slots]
+
+
+def entry_duration(song: Union[SongInfoDTO, LazyPlaylist]) -> float:
+    """
+    The seconds a queue entry adds to the queue, estimated for the playlists that aren't loaded yet.
+    """
+    if isinstance(song, LazyPlaylist):
+        return song.estimated_duration
+    return song.duration or 0.0
+
+
+def entry_title(song: Union[SongInfoDTO, LazyPlaylist]) -> str:
+    """
+    The name a queue entry is shown with, the playlists that aren't loaded yet show the songs they have left.
+    """
+    if isinstance(song, LazyPlaylist):
+        return f"Playlist: ~{song.remaining_videos} canciones más"
+    return song.title or song.url
+
+
+class QueueBlock(list):
+    """
+    A block of consecutive entries of a MusicQueue and the seconds they add up to.
+    """
+
+    __slots__ = ("seconds",)
+
+    def __init__(self, entries: Iterable[QueueEntry] = ()):
+        super().__init__(entries)
+        self.seconds = sum(map(ENTRY_SECONDS, self))
+        for entry in self:
+            entry.block = self
+
+    def add(self, entries: list[QueueEntry]):
+        """
+        Count entries that were put in the block, ex: the ones of a merged block.
+        """
+        for entry in entries:
+            entry.block = self
+            self.seconds += entry.seconds
+
+    def seconds_before(self, offset: int) -> float:
+        """
+        Params:
+            * (Integer) offset: A position in the block, from 0 to its length.
+        Returns:
+            * (Float) The seconds of the entries before it, summed from the closest end of the block.
+        """
+        if offset <= len(self) // 2:
+            return sum(map(ENTRY_SECONDS, islice(self, offset)))
+        return self.seconds - sum(map(ENTRY_SECONDS, islice(self, offset, None)))
+
+
+def split_blocks(entries: list[QueueEntry]) -> list[QueueBlock]:
+    """
+    Cut the entries of a MusicQueue in blocks of BLOCK_SIZE, the last one can be shorter.
+    """
+    return [QueueBlock(block) for block in batched(entries, BLOCK_SIZE)]
+
+
+class MusicQueue:
+    """
+    The queue of songs to play, kept in blocks of about BLOCK_SIZE entries. `_starts` has the position of
+    the first entry of every block, so the block of a position is found with a bisection, and the entries
+    only shift inside their block: taking the next song, play_next, moves and removals anywhere in the queue
+    copy at most 2 * BLOCK_SIZE references instead of the whole queue. The starts are counted from `_base`,
+    so a block that gains or loses an entry only updates the starts of the blocks on its shorter side.
+    Every change increments `version`, so readers can tell if something they computed from the
+    queue (ex: a rendered page) is still valid.
+    Every block keeps the seconds of its entries up to date, so the total duration sums the blocks and the
+    time before a position sums the blocks before it plus part of its block. `_songs` finds the entry of a
+    song, so the songs completed outside of the queue only update their block. A song object is queued once,
+    like index_of and remove expect.
+    """
+
+    __slots__ = (
+        "_blocks",
+        "_starts",
+        "_base",
+        "_length",
+        "_songs",
+        "version",
+    )
+
+    def __init__(self, entries: Iterable[QueueEntry] = ()):
+        self.version = 0
+        entries = list(entries)
+        self._songs = {id(entry.song): entry for entry in entries}
+        self._set_entries(entries)
+
+    def _set_entries(self, entries: list[QueueEntry]):
+        # There is always at least one block, it is only empty when the queue is.
+        self._blocks = split_blocks(entries) or [QueueBlock()]
+        self._length = len(entries)
+        self._index_blocks()
+
+    def _forget(self, entry: QueueEntry):
+        # Called for the entries that leave the queue
+        entry.block.seconds -= entry.seconds
+        if self._songs.get(id(entry.song)) is entry:
+            del self._songs[id(entry.song)]
+
+    def _index_blocks(self):
+        self._base = 0
+        self._starts = list(accumulate(map(len, self._blocks[:-1]), initial=0))
+
+    def _resize(self, block: int, count: int):
+        # The blocks after `block` move by `count`, which is the same as moving `block` and the ones before
+        # it by `-count` and the whole queue by `count`, so the shorter side is updated.
+        starts = self._starts
+        after = block + 1
+        if after < len(starts) - after:
+            starts[:after] = [start - count for start in starts[:after]]
+            self._base -= count
+        else:
+            starts[after:] = [start + count for start in starts[after:]]
+        self._length += count
+
+    def _split(self, block: int) -> int:
+        # A block that grew past twice BLOCK_SIZE is cut in blocks of BLOCK_SIZE, returns how many blocks it added.
+        entries = self._blocks[block]
+        if len(entries) <= 2 * BLOCK_SIZE:
+            return 0
+        blocks = split_blocks(entries)
+        del self._blocks[block]
+        self._blocks[block:block] = blocks
+        self._index_blocks()
+        return len(blocks) - 1
+
+    def _merge(self, block: int):
+        # A block that shrank under a quarter of BLOCK_SIZE, or that is empty, is merged into its neighbour.
+        entries = self._blocks[block]
+        if (entries and len(entries) >= BLOCK_SIZE // 4) or len(self._blocks) == 1:
+            return
+        if block + 1 < len(self._blocks):
+            neighbour = self._blocks[block + 1]
+            neighbour[:0] = entries
+            merged = block
+        else:
+            neighbour = self._blocks[block - 1]
+            neighbour.extend(entries)
+            merged = block - 1
+        neighbour.add(entries)
+        del self._blocks[block]
+        self._index_blocks()
+        self._split(merged)
+
+    def _position(self, index: int) -> int:
+        """
+        Params:
+            * (Integer) index: A position of the queue, negative values count from the end.
+        Returns:
+            * (Integer) The same position counted from the head.
+        Raises:
+            * IndexError: If the position is out of the queue.
+        """
+        if not -self._length <= index < self._length:
+            raise IndexError("queue index out of range")
+        return index % self._length
+
+    def _locate(self, position: int) -> tuple[int, int]:
+        """
+        Params:
+            * (Integer) position: A position of the queue, from 0 to its length.
+        Returns:
+            * (Tuple) The block holding the position and the offset of the position in it, the length of
+            the queue is the end of the last block.
+        """
+        position += self._base
+        block = bisect_right(self._starts, position) - 1
+        return block, position - self._starts[block]
+
+    def _insert_at(self, position: int, entry: QueueEntry):
+        block, offset = self._locate(position)
+        self._blocks[block].insert(offset, entry)
+        self._blocks[block].add([entry])
+        self._songs[id(entry.song)] = entry
+        self._resize(block, 1)
+        self._split(block)
+
+    def _remove_at(self, position: int) -> QueueEntry:
+        block, offset = self._locate(position)
+        entry = self._blocks[block].pop(offset)
+        self._forget(entry)
+        self._resize(block, -1)
+        self._merge(block)
+        return entry
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def __iter__(self) -> Iterator[QueueEntry]:
+        return chain.from_iterable(self._blocks)
+
+    def __getitem__(self, index: int) -> QueueEntry:
+        block, offset = self._locate(self._position(index))
+        return self._blocks[block][offset]
+
+    @property
+    def head(self) -> Optional[QueueEntry]:
+        return self._blocks[0][0] if self._length else None
+
+    def upcoming(self, count: int) -> list[QueueEntry]:
+        """
+        The first entries of the queue, without walking the rest of it.
+        Params:
+            * (Integer) count: How many entries to return at most.
+        Returns:
+            * (List) The entries, in queue order.
+        """
+        first = self._blocks[0]
+        if len(first) >= count:
+            return first[:count]
+        return self.window(0, count)
+
+    def window(self, start: int, stop: int) -> list[QueueEntry]:
+        """
+        The entries between two positions, ex: a page of the queue command.
+        Params:
+            * (Integer) start: The first position.
+            * (Integer) stop: The position after the last one, it can be past the end of the queue.
+        Returns:
+            * (List) The entries, in queue order.
+        """
+        stop = min(stop, self._length)
+        if start >= stop:
+            return []
+        block, offset = self._locate(start)
+        count = stop - start
+        end = offset + count
+        entries = self._blocks[block][offset:end]
+        while len(entries) < count:
+            block += 1
+            entries += self._blocks[block][: count - len(entries)]
+        return entries
+
+    def append(self, song: Union[SongInfoDTO, LazyPlaylist], channel: Any):
+        entry = QueueEntry(song, channel)
+        last = len(self._blocks) - 1
+        self._blocks[last].append(entry)
+        self._blocks[last].add([entry])
+        self._songs[id(song)] = entry
+        self._length += 1
+        self._split(last)
+        self.version += 1
+
+    def insert(self, index: int, song: Union[SongInfoDTO, LazyPlaylist], channel: Any):
+        # Same positions as list.insert
+        if index < 0:
+            index = max(index + self._length, 0)
+        index = min(index, self._length)
+        if index == 0:
+            # The first block starts one entry earlier, like popleft backwards.
+            entry = QueueEntry(song, channel)
+            self._blocks[0].insert(0, entry)
+            self._blocks[0].add([entry])
+            self._songs[id(song)] = entry
+            self._starts[0] -= 1
+            self._base -= 1
+            self._length += 1
+            self._split(0)
+        else:
+            self._insert_at(index, QueueEntry(song, channel))
+        self.version += 1
+
+    def popleft(self) -> QueueEntry:
+        if not self._length:
+            raise IndexError("pop from an empty queue")
+        entry = self._blocks[0].pop(0)
+        self._forget(entry)
+        # Only the first block starts later, every other block keeps its start and the queue moves forward.
+        self._starts[0] += 1
+        self._base += 1
+        self._length -= 1
+        self._merge(0)
+        self.version += 1
+        return entry
+
+    def pop(self, index: int) -> QueueEntry:
+        """
+        Remove the entry at a position of the queue.
+        Params:
+            * (Integer) index: The position of the entry, negative values count from the end.
+        Returns:
+            * (QueueEntry) The removed entry.
+        Raises:
+            * IndexError: If the position is out of the queue.
+        """
+        position = self._position(index)
+        if position == 0:
+            return self.popleft()
+        entry = self._remove_at(position)
+        self.version += 1
+        return entry
+
+    def move(self, source: int, target: int) -> QueueEntry:
+        """
+        Move an entry to another position of the queue.
+        Params:
+            * (Integer) source: The current position of the entry.
+            * (Integer) target: The position the entry ends at.
+        Returns:
+            * (QueueEntry) The moved entry.
+        Raises:
+            * IndexError: If the source position is out of the queue.
+        """
+        length = self._length
+        if not -length <= source < length:
+            raise IndexError("queue index out of range")
+        base = self._base
+        source = source % length + base
+        # Same positions as list.insert on the queue without the entry
+        length -= 1
+        if target < 0:
+            target = max(target + length, 0)
+        target = min(target, length) + base
+
+        blocks = self._blocks
+        starts = self._starts
+        block = bisect_right(starts, source) - 1
+        entries = blocks[block]
+        entry = entries.pop(source - starts[block])
+        # Without the entry, the blocks after its block start one position earlier.
+        target_block = bisect_right(starts, target + 1) - 1
+        if target_block > block:
+            destination = blocks[target_block]
+            destination.insert(target - starts[target_block] + 1, entry)
+            first, last, shift = block + 1, target_block + 1, -1
+        else:
+            target_block = bisect_right(starts, target) - 1
+            destination = blocks[target_block]
+            destination.insert(target - starts[target_block], entry)
+            first, last, shift = target_block + 1, block + 1, 1
+        # Only the starts of the blocks between both ones change, by the entry that left or arrived.
+        if destination is not entries:
+            for between in range(first, last):
+                starts[between] += shift
+            entries.seconds -= entry.seconds
+            destination.seconds += entry.seconds
+            entry.block = destination
+            if len(destination) > 2 * BLOCK_SIZE:
+                added = self._split(target_block)
+                if target_block < block:
+                    block += added
+            if len(entries) < BLOCK_SIZE // 4 or not entries:
+                self._merge(block)
+        self.version += 1
+        return entry
+
+    def set_song(self, index: int, song: Union[SongInfoDTO, LazyPlaylist]):
+        block, offset = self._locate(self._position(index))
+        entry = self._blocks[block][offset]
+        self._forget(entry)
+        entry.song = song
+        entry.seconds = entry_duration(song)
+        self._blocks[block].add([entry])
+        self._songs[id(song)] = entry
+        self.version += 1
+
+    def replace(self, index: int, entries: Iterable[QueueEntry]):
+        """
+        Replace the entry at a position with any number of entries, ex: a LazyPlaylist with its next songs.
+        Params:
+            * (Integer) index: The position of the entry to replace.
+            * (Iterable) entries: The entries that take its place, in order.
+        """
+        entries = list(entries)
+        block, offset = self._locate(self._position(index))
+        block_entries = self._blocks[block]
+        self._forget(block_entries.pop(offset))
+        block_entries[offset:offset] = entries
+        block_entries.add(entries)
+        self._songs.update((id(entry.song), entry) for entry in entries)
+        self._resize(block, len(entries) - 1)
+        if entries:
+            self._split(block)
+        else:
+            self._merge(block)
+        self.version += 1
+
+    def index_of(self, song: Union[SongInfoDTO, LazyPlaylist]) -> Optional[int]:
+        """
+        Find the position of a song object in the queue.
+        Params:
+            * (SongInfoDTO | LazyPlaylist) song: The song to look for, compared by identity.
+        Returns:
+            * (Integer | None) Its position, or None if it isn't in the queue anymore.
+        """
+        for index, entry in enumerate(self):
+            if entry.song is song:
+                return index
+        return None
+
+    def shuffle(
+        self,
+        rng: Optional[random.Random] = None,
+        fair_by: Optional[Callable[[QueueEntry], Hashable]] = None,
+    ):
+        """
+        Shuffle the queue in place. Only the references to the entries are reordered, the songs aren't copied.
+        Params:
+            * (Random) rng: The random number generator to use, a seeded one gives a repeatable order.
+            * (Callable) fair_by: Returns the group of an entry (ex: its requester), the entries of each
+            group are spread evenly along the queue instead of being fully random.
+        """
+        rng = rng or random.Random()
+        entries = list(self)
+        if fair_by is None:
+            rng.shuffle(entries)
+        else:
+            entries = spread_by_key(entries, fair_by, rng)
+        self._set_entries(entries)
+        self.version += 1
+
+    def remove(self, songs: Iterable[Union[SongInfoDTO, LazyPlaylist]]):
+        """
+        Remove the entries of some songs from the queue in a single pass.
+        Params:
+            * (Iterable) songs: The songs to remove, compared by identity.
+        """
+        removed = {id(song) for song in songs}
+        for key in removed:
+            self._songs.pop(key, None)
+        self._set_entries([entry for entry in self if id(entry.song) not in removed])
+        self.version += 1
+
+    def clear(self):
+        self._songs.clear()
+        self._set_entries([])
+        self.version += 1
+
+    def refresh_songs(self, songs: Iterable[Union[SongInfoDTO, LazyPlaylist]]):
+        """
+        Count the new duration of songs that changed outside of the queue, ex: a song whose title or duration
+        were unknown when it was queued. Only the blocks of those songs are updated.
+        Params:
+            * (Iterable) songs: The songs that changed, the ones that aren't queued anymore are skipped.
+        """
+        for song in songs:
+            entry = self._songs.get(id(song))
+            if entry is None or entry.song is not song:
+                continue
+            seconds = entry_duration(song)
+            entry.block.seconds += seconds - entry.seconds
+            entry.seconds = seconds
+        self.version += 1
+
+    def total_duration(self) -> float:
+        """
+        Returns:
+            * (Float) The seconds it takes to play the whole queue, estimated for the playlists that aren't loaded yet.
+        """
+        return sum(block.seconds for block in self._blocks)
+
+    def duration_before(self, index: int) -> float:
+        """
+        The seconds of queue that play before a position, without the rest of the current song.
+        Params:
+            * (Integer) index: The position in the queue, 0 is the next song.
+        Returns:
+            * (Float) The sum of the durations of the songs before it.
+        Raises:
+            * IndexError: If the position is out of the queue.
+        """
+        if not 0 <= index < self._length:
+            raise IndexError("queue index out of range")
+        block, offset = self._locate(index)
+        before = sum(block.seconds for block in islice(self._blocks, block))
+        return before + self._blocks[block].seconds_before(offset)
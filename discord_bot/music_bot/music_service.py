@@ -1,24 +1,82 @@
 import asyncio
-import json
+import itertools
 import logging
 import re
+import time
+from dataclasses import replace
 from datetime import timedelta
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 logger = logging.getLogger(__name__)
 
 import discord
-import requests
 import validators
 from asgiref.sync import sync_to_async
+from django.db.models import F
+from django.utils import timezone
 
-from .dto import SongInfoDTO
-from .models import SongLog
+from discord_bot.settings import (
+    MUSIC_HYDRATION_CONCURRENCY,
+    MUSIC_PLAYLIST_WINDOW,
+    YT_API_CONCURRENCY,
+    YT_PLAYLIST_BACKEND,
+    YT_PLAYLIST_CACHE_FRESHNESS,
+    YT_SEARCH_CACHE_TTL,
+)
+
+from .dto import LazyPlaylist, SongInfoDTO
+from .extraction_policy import ExtractionUnavailableError
+from .http_client import RETRYABLE_STATUSES, HttpClientError, HttpResponse
+from .models import PlaylistLog, SearchQueryLog, SongLog
+from .music_queue import MusicQueue, QueueEntry
+
+YOUTUBE_PLAYLIST_ITEMS_URL = "https://www.googleapis.com/youtube/v3/playlistItems"
+YOUTUBE_VIDEOS_URL = "https://www.googleapis.com/youtube/v3/videos"
+# videos.list accepts up to 50 ids per request
+YOUTUBE_VIDEOS_BATCH_SIZE = 50
+# Songs looked up or inserted per query by retrieve_songs and save_songs
+SONG_LOOKUP_BATCH_SIZE = 500
+# Playlist pages fetched ahead of the one being processed
+PLAYLIST_PAGES_AHEAD = 2
+
+# Backends to load playlists with, selected with YT_PLAYLIST_BACKEND
+PLAYLIST_BACKEND_API = "api"
+PLAYLIST_BACKEND_YTDLP = "ytdlp"
+PLAYLIST_BACKEND_AUTO = "auto"
+# Data API error reasons meaning the daily quota ran out
+QUOTA_ERROR_REASONS = ("quotaExceeded", "dailyLimitExceeded")
+
+
+class DataApiQuotaError(Exception):
+    """
+    Raised when the Youtube Data API refuses a request because the quota of the API key ran out.
+    """
+
+    def __init__(self, loaded_videos: int = 0):
+        super().__init__("The YouTube Data API quota is exceeded")
+        # Playlist videos already loaded before the quota ran out
+        self.loaded_videos = loaded_videos
+
+
+def is_quota_error(response: HttpResponse) -> bool:
+    """
+    Tell if a Data API response is an error because the quota ran out.
+    Params:
+        * (HttpResponse) response: The response of a Data API request.
+    Returns:
+        * (Boolean)
+    """
+    if response.status != 403:
+        return False
+    errors = response.data.get("error", {}).get("errors") or [{}]
+    return errors[0].get("reason") in QUOTA_ERROR_REASONS
 
 
 class MusicService:
-    def __init__(self, cog):
-        self.cog = cog
+    def __init__(self, player):
+        self.player = player
+        # id(song) of the songs complete_queue_songs is filling
+        self._completing: set[int] = set()
 
     def get_song_id(self, url: str) -> str:
         """
@@ -69,6 +127,88 @@ class MusicService:
             )
         return None
 
+    @sync_to_async
+    def retrieve_songs(self, urls: list) -> dict:
+        """
+        Return the saved data of many songs with as few queries as possible.
+        Params:
+            * (List) urls: The complete urls of Youtube videos
+        Returns:
+            * (Dict) The SongInfoDTO of every saved song keyed by the url it was requested with, songs
+            that aren't saved are missing.
+        """
+        urls_by_id = {}
+        for url in urls:
+            urls_by_id.setdefault(self.get_song_id(url), []).append(url)
+
+        songs = {}
+        unique_ids = list(urls_by_id)
+        # Keeps every query under SQLite's limit of variables per statement.
+        for batch in itertools.batched(unique_ids, SONG_LOOKUP_BATCH_SIZE):
+            for song_log in SongLog.objects.filter(url__in=batch):
+                for url in urls_by_id[song_log.url]:
+                    songs[url] = SongInfoDTO(
+                        author="",
+                        url=url,
+                        title=song_log.title or "",
+                        duration=float(song_log.duration or 0.0),
+                        thumbnail=(
+                            str(song_log.thumbnail) if song_log.thumbnail else None
+                        ),
+                    )
+        return songs
+
+    @sync_to_async
+    def save_songs(self, songs: list):
+        """
+        Save many songs in bulk, songs that are already saved are left as they are.
+        Params:
+            * (List) songs: The SongInfoDTO of each song to save.
+        """
+        SongLog.objects.bulk_create(
+            [
+                SongLog(
+                    url=self.get_song_id(song.url),
+                    title=song.title,
+                    duration=song.duration,
+                    thumbnail=song.thumbnail or "",
+                )
+                for song in songs
+            ],
+            batch_size=SONG_LOOKUP_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    @sync_to_async
+    def save_search_query(self, query: str, video_id: str):
+        """
+        Save which video a text search resolved to, so the next time it is searched we skip Youtube's search.
+        Params:
+            * (String) query: The normalised text search
+            * (String) video_id: The unique identifier of the Youtube video the search resolved to
+        """
+        SearchQueryLog.objects.update_or_create(
+            query=query[:500], defaults={"video_id": video_id}
+        )
+
+    @sync_to_async
+    def retrieve_search_query(self, query: str) -> Optional[str]:
+        """
+        Return the video a text search resolved to the last time, if it hasn't expired.
+        Params:
+            * (String) query: The normalised text search
+        Returns:
+            * (String | None): The unique identifier of the Youtube video, or None if not cached
+        """
+        fresh_since = timezone.now() - timedelta(seconds=YT_SEARCH_CACHE_TTL)
+        queryset = SearchQueryLog.objects.filter(
+            query=query[:500], updated_at__gte=fresh_since
+        )
+        video_id = queryset.values_list("video_id", flat=True).first()
+        if video_id:
+            queryset.update(hit_count=F("hit_count") + 1)
+        return video_id
+
     def find_best_song_format(self, format_list: list) -> str:
         """
         Util Method that selects the best audio quality for a song based on audio_channels available,
@@ -96,7 +236,162 @@ class MusicService:
         Returns:
             * (Dictionary) A dictionary with all the relevant info of a song, such as title, duration, thumbnail and url, this info is used to save the song in the music queue and to display the song info in the now playing embed.
         """
-        return await self.cog.youtube_extractor.search(url=url, author=author)
+        youtube_extractor = self.player.youtube_extractor
+        if validators.url(url):
+            return await youtube_extractor.search(url=url, author=author)
+
+        # Text searches are the slowest extraction, so reuse the video a query resolved to before.
+        query = youtube_extractor.normalize_query(url)
+        video_id = await self.retrieve_search_query(query=query)
+        if video_id:
+            song_info = await youtube_extractor.search(
+                url=f"https://youtu.be/{video_id}", author=author
+            )
+            if song_info:
+                return song_info
+
+        song_info = await youtube_extractor.search(url=url, author=author)
+        if song_info:
+            video_id = youtube_extractor.get_video_id(song_info.url)
+            if video_id:
+                await self.save_search_query(query=query, video_id=video_id)
+        return song_info
+
+    def _needs_info(self, song) -> bool:
+        return (
+            isinstance(song, SongInfoDTO)
+            and not song.info_completed
+            and (not song.title or not song.duration)
+        )
+
+    def queue_needs_info(self, queue: MusicQueue) -> bool:
+        """
+        Tell if any queued song misses its title or duration and wasn't completed already.
+        Params:
+            * (MusicQueue) queue: The queue to check.
+        Returns:
+            * (Boolean)
+        """
+        return any(self._needs_info(entry.song) for entry in queue)
+
+    def _complete_song(self, song: SongInfoDTO, title: str, duration: float, thumbnail):
+        # The queue entry is updated in place so it keeps its position even if it was moved.
+        song.title = song.title or title or ""
+        song.duration = song.duration or duration or 0.0
+        song.thumbnail = song.thumbnail or thumbnail
+        # Live streams have no duration to find, they aren't completed on every queue command.
+        song.info_completed = True
+
+    async def complete_queue_songs(self, queue: MusicQueue) -> AsyncIterator[int]:
+        """
+        Fill the title and duration of the queued songs that miss them, ex: the songs of a playlist that
+        Youtube Data API couldn't describe. The saved songs are looked up with one bulk query, the rest
+        are requested to the Data API in batches and then to yt-dlp, MUSIC_HYDRATION_CONCURRENCY at a time.
+        Songs that can't be found anywhere are removed from the queue.
+        Params:
+            * (MusicQueue) queue: The queue whose songs are completed.
+        Returns:
+            * (AsyncIterator) The number of songs completed so far, after every step, so the caller can
+            refresh what it displays.
+        """
+        songs = [
+            entry.song
+            for entry in queue
+            if self._needs_info(entry.song) and id(entry.song) not in self._completing
+        ]
+        if not songs:
+            return
+        self._completing.update(id(song) for song in songs)
+        fetch_tasks = []
+        completed = 0
+        try:
+            saved_songs = await self.retrieve_songs([song.url for song in songs])
+            pending = []
+            saved = []
+            for song in songs:
+                saved_song = saved_songs.get(song.url)
+                if saved_song and saved_song.title and saved_song.duration:
+                    self._complete_song(
+                        song,
+                        saved_song.title,
+                        saved_song.duration,
+                        saved_song.thumbnail,
+                    )
+                    saved.append(song)
+                else:
+                    pending.append(song)
+            if saved:
+                completed += len(saved)
+                queue.refresh_songs(saved)
+                yield completed
+
+            found = []
+            if pending and self.player.youtube_api_key:
+                try:
+                    videos = await self.fetch_videos_metadata(
+                        [self.get_song_id(song.url) for song in pending]
+                    )
+                except DataApiQuotaError:
+                    logger.warning(
+                        "Data API quota exceeded, completing songs with yt-dlp"
+                    )
+                    videos = {}
+                still_pending = []
+                for song in pending:
+                    video = videos.get(self.get_song_id(song.url))
+                    if video and video["title"] and video["duration"]:
+                        self._complete_song(
+                            song, video["title"], video["duration"], video["thumbnail"]
+                        )
+                        found.append(song)
+                    else:
+                        still_pending.append(song)
+                if found:
+                    completed += len(found)
+                    queue.refresh_songs(found)
+                    yield completed
+                pending = still_pending
+
+            semaphore = asyncio.Semaphore(max(MUSIC_HYDRATION_CONCURRENCY, 1))
+
+            async def fetch_metadata(song: SongInfoDTO) -> tuple:
+                async with semaphore:
+                    try:
+                        return song, await self.player.youtube_extractor.fetch_metadata(
+                            url=song.url, author=song.author
+                        )
+                    except ExtractionUnavailableError:
+                        # Youtube is failing us, the song keeps its place and is completed later.
+                        return song, song
+
+            fetch_tasks = [
+                asyncio.create_task(fetch_metadata(song)) for song in pending
+            ]
+            not_found = []
+            for next_result in asyncio.as_completed(fetch_tasks):
+                song, song_info = await next_result
+                if song_info is song:
+                    continue
+                if song_info and song_info.title:
+                    self._complete_song(
+                        song, song_info.title, song_info.duration, song_info.thumbnail
+                    )
+                    found.append(song)
+                    completed += 1
+                else:
+                    not_found.append(song)
+                queue.refresh_songs([song])
+                yield completed
+
+            if not_found:
+                queue.remove(not_found)
+                yield completed
+            if found:
+                await self.save_songs(found)
+        finally:
+            for task in fetch_tasks:
+                task.cancel()
+            self._completing.difference_update(id(song) for song in songs)
 
     def format_youtube_duration(self, video_duration: str) -> float:
         """
@@ -121,106 +416,615 @@ class MusicService:
 
         return timedelta(hours=hours, minutes=minutes, seconds=seconds).total_seconds()
 
-    async def search_youtube_playlist(self, url: str, context) -> list:
+    async def fetch_videos_metadata(self, video_ids: list) -> dict:
         """
-        Search a Youtube playlist and return a list of dictionaries with the relevant data of each song in the playlist.
+        Get the title, duration and thumbnail of Youtube videos with the Data API, packing up to 50 ids
+        in every videos.list request and running several requests at the same time.
         Params:
-            * (String) url: The complete url of a Youtube playlist
-            * (Object) context: The context of the command that triggered the search, used to send messages to the channel if the playlist is empty or private.
+            * (List) video_ids: The ids of the videos, repeated ids are requested once.
         Returns:
-            * (List) relevant_data: A list of dictionaries with the relevant data of each song in the playlist, such as title, duration, thumbnail and url.
+            * (Dict) The title, duration and thumbnail of each video keyed by its id. Videos the API didn't
+            return (private, deleted or a failed request) are missing.
         """
-        relevant_data = []
-        playlist_id = url.split("list=")[1]
-        URL1 = "https://www.googleapis.com/youtube/v3/playlistItems?part=contentDetails&maxResults=50&fields=items/contentDetails/videoId,nextPageToken&key={}&playlistId={}&pageToken=".format(
-            self.cog.youtube_api_key, playlist_id
+        unique_ids = list(dict.fromkeys(video_ids))
+        batches = itertools.batched(unique_ids, YOUTUBE_VIDEOS_BATCH_SIZE)
+        semaphore = asyncio.Semaphore(YT_API_CONCURRENCY)
+
+        async def fetch_batch(batch: tuple) -> list:
+            params = {
+                "part": "contentDetails,snippet",
+                "id": ",".join(batch),
+                "maxResults": YOUTUBE_VIDEOS_BATCH_SIZE,
+                "fields": "items(id,contentDetails/duration,snippet/title,snippet/thumbnails/default/url)",
+                "key": self.player.youtube_api_key,
+            }
+            async with semaphore:
+                try:
+                    response = await self.player.http_client.get_json(
+                        YOUTUBE_VIDEOS_URL, params=params
+                    )
+                except HttpClientError as e:
+                    logger.error(
+                        "Error fetching video info from YouTube Data API: %s", e
+                    )
+                    return []
+            if is_quota_error(response):
+                raise DataApiQuotaError()
+            if response.status != 200:
+                logger.error(
+                    "YouTube Data API videos.list returned %s: %s",
+                    response.status,
+                    response.data.get("error"),
+                )
+            return response.data.get("items") or []
+
+        videos = {}
+        for items in await asyncio.gather(*(fetch_batch(batch) for batch in batches)):
+            for item in items:
+                thumbnails = item.get("snippet", {}).get("thumbnails") or {}
+                videos[item["id"]] = {
+                    "title": item.get("snippet", {}).get("title"),
+                    "duration": self.format_youtube_duration(
+                        item.get("contentDetails", {}).get("duration") or ""
+                    ),
+                    "thumbnail": thumbnails.get("default", {}).get("url"),
+                }
+        return videos
+
+    @sync_to_async
+    def retrieve_playlist(self, playlist_id: str) -> "Optional[PlaylistLog]":
+        """
+        Return the cached pages of a Youtube playlist.
+        Params:
+            * (String) playlist_id: The id of the Youtube playlist
+        Returns:
+            * (PlaylistLog | None): The cached playlist, or None if it was never loaded
+        """
+        return PlaylistLog.objects.filter(playlist_id=playlist_id).first()
+
+    @sync_to_async
+    def save_playlist(self, playlist_id: str, pages: list):
+        """
+        Save the pages of a Youtube playlist, used to revalidate them with their ETags the next time.
+        Params:
+            * (String) playlist_id: The id of the Youtube playlist
+            * (List) pages: The token, next token, ETag and video ids of every page.
+        """
+        PlaylistLog.objects.update_or_create(
+            playlist_id=playlist_id, defaults={"pages": pages}
         )
-        next_page = ""
-        video_list = []
 
-        while True:
-            videos_in_page = []
-            results = json.loads(requests.get(URL1 + next_page).text)
+    @sync_to_async
+    def count_playlist_hit(self, playlist_id: str):
+        """
+        Count a load of a Youtube playlist that was served by its cached pages, without refreshing it.
+        Params:
+            * (String) playlist_id: The id of the Youtube playlist
+        """
+        PlaylistLog.objects.filter(playlist_id=playlist_id).update(
+            hit_count=F("hit_count") + 1
+        )
 
-            if results.get("items", None):
-                for item in results["items"]:
-                    videos_in_page.append(item["contentDetails"]["videoId"])
+    @sync_to_async
+    def delete_playlist(self, playlist_id: str):
+        """
+        Forget a cached Youtube playlist, used when it stops being available.
+        Params:
+            * (String) playlist_id: The id of the Youtube playlist
+        """
+        PlaylistLog.objects.filter(playlist_id=playlist_id).delete()
 
-                video_list.extend(videos_in_page)
+    async def _paginate_playlist(self, playlist_id: str, context, pages: asyncio.Queue):
+        """
+        Put every page of a Youtube playlist in a queue, followed by None once it's done.
+        A playlist loaded recently is served from the database. Otherwise every cached page is requested
+        with its ETag and reused as is when the Data API answers that it hasn't changed.
+        Params:
+            * (String) playlist_id: The id of the Youtube playlist
+            * (Object) context: The context of the command that triggered the search, used to send messages to the channel if the playlist is empty or private.
+            * (asyncio.Queue) pages: The queue the pages are put in, see _revalidate_playlist.
+        """
+        try:
+            cached_playlist = await self.retrieve_playlist(playlist_id=playlist_id)
+            cached_pages = cached_playlist.pages if cached_playlist else []
+            fresh_since = timezone.now() - timedelta(
+                seconds=YT_PLAYLIST_CACHE_FRESHNESS
+            )
+            if cached_pages and cached_playlist.updated_at >= fresh_since:
+                for page in cached_pages:
+                    await pages.put(page)
+                await self.count_playlist_hit(playlist_id=playlist_id)
+                return
 
-                if "nextPageToken" in results:
-                    next_page = results["nextPageToken"]
-                else:
-                    break
+            loaded_pages = await self._revalidate_playlist(
+                playlist_id, context, pages, cached_pages
+            )
+            if loaded_pages:
+                # Saving also restarts the freshness window of the playlist.
+                await self.save_playlist(playlist_id=playlist_id, pages=loaded_pages)
+                if loaded_pages == cached_pages:
+                    await self.count_playlist_hit(playlist_id=playlist_id)
+        finally:
+            await pages.put(None)
+
+    async def _revalidate_playlist(
+        self, playlist_id: str, context, pages: asyncio.Queue, cached_pages: list
+    ) -> list:
+        """
+        Request every page of a Youtube playlist, conditionally for the pages that are cached.
+        Params:
+            * (String) playlist_id: The id of the Youtube playlist
+            * (Object) context: The context of the command that triggered the search, used to send messages to the channel if the playlist is empty or private.
+            * (asyncio.Queue) pages: The queue the lists of video ids are put in.
+            * (List) cached_pages: The pages saved the last time the playlist was loaded.
+        Returns:
+            * (List) The token, next token, ETag, playlist size and video ids of every page, empty if the playlist couldn't be loaded or is only partially loaded because it's longer than MUSIC_PLAYLIST_WINDOW.
+        """
+        params = {
+            "part": "contentDetails",
+            "maxResults": 50,
+            "fields": "etag,items/contentDetails/videoId,nextPageToken,pageInfo/totalResults",
+            "key": self.player.youtube_api_key,
+            "playlistId": playlist_id,
+        }
+        loaded_pages = []
+        page_token = ""
+        while True:
+            index = len(loaded_pages)
+            cached_page = None
+            headers = {}
+            # Page tokens encode the position in the playlist, so a cached page matches by index and token.
+            if index < len(cached_pages) and cached_pages[index]["token"] == page_token:
+                cached_page = cached_pages[index]
+                if cached_page.get("etag"):
+                    headers["If-None-Match"] = cached_page["etag"]
+            if page_token:
+                params["pageToken"] = page_token
+
+            try:
+                response = await self.player.http_client.get_json(
+                    YOUTUBE_PLAYLIST_ITEMS_URL, params=params, headers=headers
+                )
+            except HttpClientError as e:
+                logger.error(
+                    "Error fetching playlist page from YouTube Data API: %s", e
+                )
+                await context.send(
+                    "Mae no pude cargar la playlist de Youtube, intente de nuevo."
+                )
+                return []
+            results = response.data
+
+            if response.status == 304 and cached_page:
+                page = cached_page
+            elif results.get("items", None):
+                page = {
+                    "token": page_token,
+                    "next_token": results.get("nextPageToken"),
+                    "etag": response.headers.get("ETag") or results.get("etag"),
+                    "total": results.get("pageInfo", {}).get("totalResults"),
+                    "video_ids": [
+                        item["contentDetails"]["videoId"] for item in results["items"]
+                    ],
+                }
+            elif is_quota_error(response):
+                raise DataApiQuotaError()
             elif results.get("error"):
                 error_reason = results["error"].get("errors")[0].get("reason")
                 if error_reason == "playlistNotFound":
+                    await self.delete_playlist(playlist_id=playlist_id)
                     await context.send(
                         "Mae la playlist de Youtube está como privada. Pruebe cambiandola a Unlisted o Public."
                     )
-                    break
+                else:
+                    logger.error("YouTube Data API playlist error: %s", error_reason)
+                return []
             else:
                 await context.send("Mae la playlist de Youtube está vacia.")
-                break
+                return []
 
-        for video_id in video_list:
-            video_url = f"https://youtu.be/{video_id}"
-            song_log_data = await self.retrieve_song(url=video_url)
+            loaded_pages.append(page)
+            await pages.put(page)
+            if not page["next_token"]:
+                return loaded_pages
+            if sum(len(p["video_ids"]) for p in loaded_pages) >= MUSIC_PLAYLIST_WINDOW:
+                # The rest is loaded lazily, and a partial playlist isn't worth caching.
+                return []
+            page_token = page["next_token"]
+
+    async def _hydrate_playlist_page(self, video_ids: list, author: str) -> tuple:
+        """
+        Get the song info of a page of playlist videos, from the database or the Data API.
+        Params:
+            * (List) video_ids: The ids of the videos in the page, in playlist order.
+            * (String) author: The name of the user who requested the playlist.
+        Returns:
+            * (Tuple) The SongInfoDTO of the available videos in playlist order, and the indexes in
+            the page of the unavailable ones.
+        """
+        # Songs already in the database don't cost a Data API request.
+        video_urls = [f"https://youtu.be/{video_id}" for video_id in video_ids]
+        known_songs = await self.retrieve_songs(urls=video_urls)
+        fetched_videos = await self.fetch_videos_metadata(
+            [
+                video_id
+                for video_id, video_url in zip(video_ids, video_urls)
+                if video_url not in known_songs
+            ]
+        )
 
-            if song_log_data:
-                video_info = SongInfoDTO(
-                    author=context.author.nick or "",
+        songs = []
+        # Repeated videos of the page are only saved once.
+        new_songs = {}
+        unavailable_indexes = []
+        for index, (video_id, video_url) in enumerate(zip(video_ids, video_urls)):
+            song_info = known_songs.get(video_url) or new_songs.get(video_url)
+            if song_info is None and video_id in fetched_videos:
+                video_data = fetched_videos[video_id]
+                song_info = SongInfoDTO(
+                    author="",
                     url=video_url,
-                    title=song_log_data.title or "",
-                    duration=float(song_log_data.duration or 0.0),
-                    thumbnail=(
-                        str(song_log_data.thumbnail)
-                        if song_log_data.thumbnail
-                        else None
-                    ),
+                    title=video_data["title"] or "",
+                    duration=float(video_data["duration"] or 0.0),
+                    thumbnail=video_data["thumbnail"],
                 )
-            else:
-                videos_request = self.cog.youtube.videos().list(
-                    part="contentDetails, snippet", id=video_id
+                new_songs[video_url] = song_info
+            elif song_info is None:
+                # Private, deleted or region blocked videos aren't returned by the Data API.
+                unavailable_indexes.append(index)
+                continue
+
+            # Every queue entry gets its own DTO, the prefetcher fills in the source of each one.
+            songs.append(replace(song_info, author=author))
+
+        await self.save_songs(songs=list(new_songs.values()))
+        return songs, unavailable_indexes
+
+    async def _stream_api_playlist(
+        self, playlist_id: str, context, author: str
+    ) -> AsyncIterator[tuple]:
+        """
+        Yield the songs of a Youtube playlist page by page using the Data API. The next pages are fetched
+        while the current one is being processed.
+        Params:
+            * (String) playlist_id: The id of the Youtube playlist
+            * (Object) context: The context of the command that triggered the search, used to send messages to the channel if the playlist is empty or private.
+            * (String) author: The name of the user who requested the playlist.
+        Returns:
+            * (AsyncIterator) Tuples with the SongInfoDTO of each available song of a page, and the
+            playlist positions of the unavailable ones.
+        Raises:
+            * DataApiQuotaError: If the Data API quota ran out, with how many videos were already loaded.
+        """
+        pages = asyncio.Queue(maxsize=PLAYLIST_PAGES_AHEAD)
+        paginator = asyncio.create_task(
+            self._paginate_playlist(playlist_id, context, pages)
+        )
+        page_start = 1
+        playlist_duration = 0.0
+
+        try:
+            while (page := await pages.get()) is not None:
+                video_ids = page["video_ids"]
+                songs, unavailable_indexes = await self._hydrate_playlist_page(
+                    video_ids, author=author
                 )
-                loop = asyncio.get_running_loop()
+                unavailable_positions = [
+                    page_start + index for index in unavailable_indexes
+                ]
+                page_start += len(video_ids)
+                playlist_duration += sum(song.duration for song in songs)
 
-                def fetch_video():
-                    return videos_request.execute()
+                if page["next_token"] and page_start > MUSIC_PLAYLIST_WINDOW:
+                    # The rest of the playlist is loaded when playback gets close to it.
+                    songs.append(
+                        LazyPlaylist(
+                            playlist_id=playlist_id,
+                            author=author,
+                            backend=PLAYLIST_BACKEND_API,
+                            page_token=page["next_token"],
+                            loaded_videos=page_start - 1,
+                            total_videos=page.get("total") or page_start - 1,
+                            loaded_duration=playlist_duration,
+                        )
+                    )
+                    yield songs, unavailable_positions
+                    return
+                yield songs, unavailable_positions
+            # Raises the errors of the paginator, if any.
+            await paginator
+        except DataApiQuotaError:
+            raise DataApiQuotaError(loaded_videos=page_start - 1) from None
+        finally:
+            paginator.cancel()
 
+    async def _hydrate_flat_entries(
+        self, entries: list, page_start: int, author: str
+    ) -> tuple:
+        """
+        Build the song info of a page of yt-dlp flat playlist entries, saving the songs that are new.
+        Params:
+            * (List) entries: The entries of the page, None for the unavailable ones (see slim_playlist).
+            * (Integer) page_start: The playlist position of the first entry.
+            * (String) author: The name of the user who requested the playlist.
+        Returns:
+            * (Tuple) The SongInfoDTO of the available videos in playlist order, and the playlist positions
+            of the unavailable ones.
+        """
+        video_urls = [
+            f"https://youtu.be/{entry['id']}" if entry else None for entry in entries
+        ]
+        known_songs = await self.retrieve_songs(urls=[u for u in video_urls if u])
+
+        songs = []
+        new_songs = {}
+        unavailable_positions = []
+        for index, (entry, video_url) in enumerate(zip(entries, video_urls)):
+            if entry is None:
+                unavailable_positions.append(page_start + index)
+                continue
+            song_info = known_songs.get(video_url) or SongInfoDTO(
+                author="",
+                url=video_url,
+                title=entry["title"] or "",
+                duration=float(entry["duration"] or 0.0),
+                thumbnail=entry["thumbnail"],
+            )
+            # Flat entries of live streams or premieres have no duration yet.
+            if video_url not in known_songs and entry["duration"]:
+                new_songs[video_url] = song_info
+            songs.append(replace(song_info, author=author))
+
+        await self.save_songs(songs=list(new_songs.values()))
+        return songs, unavailable_positions
+
+    async def _stream_ytdlp_playlist(
+        self, url: str, context, author: str, skip: int = 0
+    ) -> AsyncIterator[tuple]:
+        """
+        Yield the songs of a Youtube playlist in pages of 50 using yt-dlp's flat extraction, which doesn't
+        need a Data API key nor quota. Only the first window of the playlist is listed, the rest is
+        left in a LazyPlaylist.
+        Params:
+            * (String) url: The complete url of a Youtube playlist
+            * (Object) context: The context of the command that triggered the search, used to send messages to the channel if the playlist is empty or private.
+            * (String) author: The name of the user who requested the playlist.
+            * (Integer) skip: Videos at the start of the playlist that were already loaded.
+        Returns:
+            * (AsyncIterator) Tuples with the SongInfoDTO of each available song of a page, and the
+            playlist positions of the unavailable ones.
+        """
+        playlist = await self.player.youtube_extractor.extract_playlist(
+            url=url, start=skip + 1, end=skip + MUSIC_PLAYLIST_WINDOW
+        )
+        if not playlist or not playlist["entries"]:
+            if not skip:
+                await context.send("Mae no pude cargar la playlist de Youtube.")
+            return
+
+        entries = playlist["entries"]
+        lazy_playlist = None
+        if len(entries) >= MUSIC_PLAYLIST_WINDOW:
+            # The rest of the playlist is loaded when playback gets close to it.
+            lazy_playlist = LazyPlaylist(
+                playlist_id=playlist["id"] or url.split("list=")[1],
+                author=author,
+                backend=PLAYLIST_BACKEND_YTDLP,
+                loaded_videos=skip + len(entries),
+                # yt-dlp doesn't always know the size, then at least one more video is assumed.
+                total_videos=max(playlist["count"] or 0, skip + len(entries) + 1),
+            )
+
+        for page_index, page in enumerate(
+            itertools.batched(entries, YOUTUBE_VIDEOS_BATCH_SIZE)
+        ):
+            songs, unavailable_positions = await self._hydrate_flat_entries(
+                page,
+                page_start=skip + page_index * YOUTUBE_VIDEOS_BATCH_SIZE + 1,
+                author=author,
+            )
+            if lazy_playlist:
+                lazy_playlist.loaded_duration += sum(song.duration for song in songs)
+            yield songs, unavailable_positions
+
+        if lazy_playlist:
+            yield [lazy_playlist], []
+
+    def _switch_to_ytdlp(self, lazy_playlist: LazyPlaylist):
+        # With the "auto" backend the next expansion lists the rest of the playlist with yt-dlp, from the
+        # videos already loaded.
+        if YT_PLAYLIST_BACKEND != PLAYLIST_BACKEND_AUTO:
+            return
+        logger.warning(
+            "YouTube Data API quota exceeded, expanding playlist %s with yt-dlp",
+            lazy_playlist.playlist_id,
+        )
+        lazy_playlist.backend = PLAYLIST_BACKEND_YTDLP
+
+    async def expand_lazy_playlist(self, lazy_playlist: LazyPlaylist) -> list:
+        """
+        Load the next window of songs of a LazyPlaylist, moving its cursor forward.
+        Params:
+            * (LazyPlaylist) lazy_playlist: The queue entry to expand.
+        Returns:
+            * (List) The SongInfoDTO of the available songs of the window in playlist order. The cursor
+            of the LazyPlaylist is left at the end of the playlist (remaining_videos is 0) once there is
+            nothing else to load.
+        """
+        songs = []
+        if lazy_playlist.backend == PLAYLIST_BACKEND_YTDLP:
+            start = lazy_playlist.loaded_videos + 1
+            playlist = await self.player.youtube_extractor.extract_playlist(
+                url=lazy_playlist.url,
+                start=start,
+                end=start + MUSIC_PLAYLIST_WINDOW - 1,
+            )
+            entries = playlist["entries"] if playlist else []
+            songs, _ = await self._hydrate_flat_entries(
+                entries, page_start=start, author=lazy_playlist.author
+            )
+            lazy_playlist.loaded_videos += len(entries)
+            if len(entries) < MUSIC_PLAYLIST_WINDOW:
+                lazy_playlist.total_videos = lazy_playlist.loaded_videos
+            else:
+                lazy_playlist.total_videos = max(
+                    lazy_playlist.total_videos, lazy_playlist.loaded_videos + 1
+                )
+        else:
+            params = {
+                "part": "contentDetails",
+                "maxResults": 50,
+                "fields": "items/contentDetails/videoId,nextPageToken",
+                "key": self.player.youtube_api_key,
+                "playlistId": lazy_playlist.playlist_id,
+            }
+            loaded_in_window = 0
+            # The Data API couldn't be reached, the cursor is kept so the next expansion tries again.
+            unreachable = False
+            while lazy_playlist.page_token and loaded_in_window < MUSIC_PLAYLIST_WINDOW:
+                params["pageToken"] = lazy_playlist.page_token
                 try:
-                    video_response = await loop.run_in_executor(None, fetch_video)
-                except Exception as e:
+                    response = await self.player.http_client.get_json(
+                        YOUTUBE_PLAYLIST_ITEMS_URL, params=params
+                    )
+                except HttpClientError as e:
                     logger.error(
-                        "Error fetching video info from YouTube Data API: %s", e
+                        "Error fetching playlist page from YouTube Data API: %s", e
                     )
-                    continue
-
-                items = video_response.get("items", None)
-                if not items:
-                    continue
+                    unreachable = True
+                    break
+                if response.status in RETRYABLE_STATUSES:
+                    logger.error(
+                        "YouTube Data API returned %s for a playlist page",
+                        response.status,
+                    )
+                    unreachable = True
+                    break
+                if is_quota_error(response):
+                    self._switch_to_ytdlp(lazy_playlist)
+                    break
 
-                content_details = items[0].get("contentDetails")
-                snippet = items[0].get("snippet")
-                duration = self.format_youtube_duration(content_details.get("duration"))
-                title = snippet.get("title")
-                thumbnail = snippet.get("thumbnails").get("default").get("url")
+                video_ids = [
+                    item["contentDetails"]["videoId"]
+                    for item in response.data.get("items") or []
+                ]
+                if not video_ids:
+                    break
+                try:
+                    page_songs, _ = await self._hydrate_playlist_page(
+                        video_ids, author=lazy_playlist.author
+                    )
+                except DataApiQuotaError:
+                    self._switch_to_ytdlp(lazy_playlist)
+                    break
+                songs.extend(page_songs)
+                loaded_in_window += len(video_ids)
+                lazy_playlist.loaded_videos += len(video_ids)
+                lazy_playlist.page_token = response.data.get("nextPageToken")
 
-                await self.save_song(
-                    url=video_url, title=title, duration=duration, thumbnail=thumbnail
+            if (
+                lazy_playlist.backend == PLAYLIST_BACKEND_API
+                and not unreachable
+                and (
+                    not lazy_playlist.page_token
+                    or loaded_in_window < MUSIC_PLAYLIST_WINDOW
                 )
+            ):
+                # Nothing else to load, or the Data API refused it and the rest is given up.
+                lazy_playlist.total_videos = lazy_playlist.loaded_videos
 
-                video_info = SongInfoDTO(
-                    author=context.author.nick or "",
-                    url=video_url,
-                    title=title or "",
-                    duration=float(duration or 0.0),
-                    thumbnail=thumbnail,
-                )
+        lazy_playlist.loaded_duration += sum(song.duration for song in songs)
+        return songs
 
-            relevant_data.append(video_info)
+    async def expand_upcoming_playlists(self):
+        """
+        Expand the LazyPlaylists of the queue that playback is getting close to, so the head of the queue
+        and the songs the prefetcher resolves are always concrete songs.
+        """
+        queue = self.player.music_queue
+        # The playing song plus the ones the prefetcher looks ahead at
+        distance = max(self.player.prefetcher.lookahead, 1)
+        index = 0
+        while index < min(distance, len(queue)):
+            lazy_playlist = queue[index].song
+            voice_channel = queue[index].channel
+            if not isinstance(lazy_playlist, LazyPlaylist):
+                index += 1
+                continue
 
-        return relevant_data
+            songs = await self.expand_lazy_playlist(lazy_playlist)
+            entries = [QueueEntry(song, voice_channel) for song in songs]
+            if lazy_playlist.remaining_videos:
+                entries.append(QueueEntry(lazy_playlist, voice_channel))
+            # The entry may have moved while the window was loading (ex: skip, move).
+            position = queue.index_of(lazy_playlist)
+            if position is None:
+                return
+            queue.replace(position, entries)
+
+    async def stream_youtube_playlist(
+        self, url: str, context, backend: Optional[str] = None
+    ) -> AsyncIterator[list]:
+        """
+        Search a Youtube playlist and yield the songs of each page as soon as they are ready, so the first
+        songs can be played while the rest of the playlist is still loading.
+        Params:
+            * (String) url: The complete url of a Youtube playlist
+            * (Object) context: The context of the command that triggered the search, used to send messages to the channel if the playlist is empty or private.
+            * (String) backend: "api" for the Data API, "ytdlp" for yt-dlp's flat extraction, or "auto" to use
+            the Data API and switch to yt-dlp when its quota runs out. Defaults to YT_PLAYLIST_BACKEND.
+        Returns:
+            * (AsyncIterator) Lists with the SongInfoDTO of each available song of a page, in playlist order.
+            Playlists longer than MUSIC_PLAYLIST_WINDOW end with a LazyPlaylist standing for the rest of them.
+        """
+        backend = backend or YT_PLAYLIST_BACKEND
+        playlist_id = url.split("list=")[1]
+        author = context.author.nick or ""
+        unavailable_positions = []
+
+        use_ytdlp = backend == PLAYLIST_BACKEND_YTDLP
+        loaded_videos = 0
+        if not use_ytdlp:
+            try:
+                async for songs, unavailable in self._stream_api_playlist(
+                    playlist_id, context, author
+                ):
+                    unavailable_positions.extend(unavailable)
+                    if songs:
+                        yield songs
+            except DataApiQuotaError as e:
+                if backend == PLAYLIST_BACKEND_API:
+                    await context.send(
+                        "Mae se acabó la cuota de la API de Youtube, intente mañana."
+                    )
+                else:
+                    logger.warning(
+                        "YouTube Data API quota exceeded, loading playlist %s with yt-dlp",
+                        playlist_id,
+                    )
+                    use_ytdlp = True
+                    loaded_videos = e.loaded_videos
+
+        if use_ytdlp:
+            async for songs, unavailable in self._stream_ytdlp_playlist(
+                url, context, author, skip=loaded_videos
+            ):
+                unavailable_positions.extend(unavailable)
+                if songs:
+                    yield songs
+
+        if unavailable_positions:
+            logger.info(
+                "Playlist %s has unavailable videos at positions %s",
+                playlist_id,
+                unavailable_positions,
+            )
+            positions = ", ".join(str(p) for p in unavailable_positions[:10])
+            if len(unavailable_positions) > 10:
+                positions += "..."
+            await context.send(
+                f"Mae {len(unavailable_positions)} canciones de la playlist no están disponibles (posiciones {positions})."
+            )
 
     async def try_to_connect(self, voice_channel_to_connect=None):
         """
@@ -229,47 +1033,47 @@ class MusicService:
             * (Class) voice_channel_to_connect: The discord voice channel from which a user issued a join command.
             It is used to determine if the bot is joining the voice channel via the join or play command
         """
-        if voice_channel_to_connect is None and not self.cog.current_voice_channel:
-            if not self.cog.music_queue:
+        if voice_channel_to_connect is None and not self.player.current_voice_channel:
+            if not self.player.music_queue:
                 return
 
             connected = False
             while connected is False:
                 try:
-                    if not self.cog.music_queue:
+                    if not self.player.music_queue:
                         break
-                    self.cog.current_voice_channel = await asyncio.shield(
-                        self.cog.music_queue[0][1].connect()
+                    self.player.current_voice_channel = await asyncio.shield(
+                        self.player.music_queue.head.channel.connect()
                     )
                     if (
-                        self.cog.current_voice_channel.is_connected()
-                        and self.cog.music_queue[0][1]
+                        self.player.current_voice_channel.is_connected()
+                        and self.player.music_queue.head.channel
                     ):
                         if (
-                            self.cog.current_voice_channel.channel.name
-                            != self.cog.music_queue[0][1].name
+                            self.player.current_voice_channel.channel.name
+                            != self.player.music_queue.head.channel.name
                         ):
-                            await self.cog.current_voice_channel.disconnect()
-                            self.cog.current_voice_channel = await self.cog.music_queue[
-                                0
-                            ][1].connect()
+                            await self.player.current_voice_channel.disconnect()
+                            self.player.current_voice_channel = (
+                                await self.player.music_queue.head.channel.connect()
+                            )
                         connected = True
                 except Exception as e:
                     logger.error("Algo salio mal al conectar al bot: %s", e)
                     break
         else:
             try:
-                if not self.cog.current_voice_channel:
-                    self.cog.current_voice_channel = await asyncio.shield(
+                if not self.player.current_voice_channel:
+                    self.player.current_voice_channel = await asyncio.shield(
                         voice_channel_to_connect.connect()
                     )
-                elif self.cog.current_voice_channel.is_connected():
+                elif self.player.current_voice_channel.is_connected():
                     if (
-                        self.cog.current_voice_channel.channel.name
+                        self.player.current_voice_channel.channel.name
                         != voice_channel_to_connect.name
                     ):
-                        await self.cog.current_voice_channel.disconnect()
-                        self.cog.current_voice_channel = (
+                        await self.player.current_voice_channel.disconnect()
+                        self.player.current_voice_channel = (
                             await voice_channel_to_connect.connect()
                         )
             except Exception as e:
@@ -282,57 +1086,106 @@ class MusicService:
         """
         Util method that takes care of recursively playing the music queue until it's empty.
         """
-        if len(self.cog.music_queue) > 0:
-            self.cog.is_playing = True
+        if len(self.player.music_queue) > 0:
+            self.player.is_playing = True
             next_song_info = ""
             try:
-                if self.cog.is_queue_shuffled is True:
-                    self.cog.music_queue = self.cog.shuffled_music_queue
-                    self.cog.is_queue_shuffled = False
+                # Playlists that aren't loaded yet get their next songs before one is picked.
+                await self.expand_upcoming_playlists()
+                if not self.player.music_queue:
+                    # The playlist had nothing else to load.
+                    return await self.reproduce_next_song_in_queue()
 
-                if self.cog.music_queue[0][0].source == "":
+                # The prefetcher may be resolving this song already, so reuse that work.
+                head_song = self.player.music_queue.head.song
+                await self.player.prefetcher.wait_for(head_song)
+                stream_cache = self.player.youtube_extractor.stream_cache
+                if head_song.source and not stream_cache.is_playable(head_song):
+                    # Resolved too long ago (ex: it was moved back out of the lookahead), its url expired.
+                    head_song.source = ""
+
+                if head_song.source == "":
                     next_song_source_player = ""
                     next_song_info = await self.search_youtube_url(
-                        url=self.cog.music_queue[0][0].url,
-                        author=self.cog.music_queue[0][0].author,
+                        url=head_song.url,
+                        author=head_song.author,
                     )
                     if next_song_info:
                         next_song_source_player = next_song_info.source
                 else:
-                    next_song_source_player = self.cog.music_queue[0][0].source
+                    next_song_source_player = head_song.source
 
-                if len(self.cog.now_playing) > 0:
-                    self.cog.now_playing.pop()
+                if len(self.player.now_playing) > 0:
+                    self.player.now_playing.pop()
 
                 if next_song_info:
-                    self.cog.now_playing.append(next_song_info)
-                    self.cog.music_queue.pop(0)[0]
+                    self.player.now_playing.append(next_song_info)
+                    self.player.music_queue.popleft()
                 else:
-                    self.cog.now_playing.append(self.cog.music_queue.pop(0)[0])
+                    self.player.now_playing.append(
+                        self.player.music_queue.popleft().song
+                    )
 
                 if next_song_source_player:
                     try:
                         play_source = discord.FFmpegPCMAudio(
-                            source=next_song_source_player, **self.cog.FFMPEG_OPTIONS
+                            source=next_song_source_player, **self.player.FFMPEG_OPTIONS
                         )
-                        self.cog.current_voice_channel.play(
+                        self.player.current_voice_channel.play(
                             source=play_source,
                             after=lambda e: asyncio.run_coroutine_threadsafe(
-                                self.reproduce_next_song_in_queue(), self.cog.bot.loop
+                                self.reproduce_next_song_in_queue(),
+                                self.player.bot.loop,
                             ),
                         )
-                        self.cog.current_voice_channel.source.volume = 3.0
+                        self.player.current_voice_channel.source.volume = 3.0
+                        self.player.song_started_at = time.monotonic()
+                        self.player.song_paused_at = None
+                        # Resolve the next songs while this one plays.
+                        self.player.prefetcher.schedule()
                     except Exception as e:
                         logger.error("Error with FFmpeg: %s", e)
                         await self.reproduce_next_song_in_queue()
                 else:
                     await self.reproduce_next_song_in_queue()
 
+            except ExtractionUnavailableError as e:
+                # The song stays at the head of the queue, the next play command picks it up again.
+                logger.warning("Playback stopped, extractions are paused: %s", e)
+                self.player.is_playing = False
             except Exception as e:
                 logger.error("Unexpected error in reproduce_next_song_in_queue: %s", e)
-                self.cog.is_playing = False
+                self.player.is_playing = False
         else:
-            self.cog.is_playing = False
+            self.player.is_playing = False
+            self.player.song_started_at = None
+            # The guild is idle from the end of the queue, not from its last command.
+            self.player.touch()
+
+    def current_song_remaining(self) -> float:
+        """
+        Util method that returns how much is left of the song that is playing.
+        Returns:
+            * (Float) The seconds left, 0 if no song is playing.
+        """
+        if not self.player.now_playing or self.player.song_started_at is None:
+            return 0.0
+        now = self.player.song_paused_at or time.monotonic()
+        elapsed = now - self.player.song_started_at
+        return max(self.player.now_playing[0].duration - elapsed, 0.0)
+
+    def count_queue_songs(self, queue: MusicQueue) -> int:
+        """
+        Count the songs of a music queue, including the estimated ones of the playlists that aren't loaded yet.
+        Params:
+            * (MusicQueue) queue: The queue to count.
+        Returns:
+            * (Integer) The number of songs.
+        """
+        return sum(
+            entry.song.remaining_videos if isinstance(entry.song, LazyPlaylist) else 1
+            for entry in queue
+        )
 
     def convert_seconds(self, seconds: int) -> str:
         """
@@ -349,18 +1202,6 @@ class MusicService:
         seconds %= 60
         return "%d:%02d:%02d" % (hour, minutes, seconds)
 
-    def add_embed_in_queue(self, list_of_songs: str):
-        """
-        Util method that adds a list of songs currently in queue to the embed_queue.
-        Params:
-            * (String) list_of_songs: All the songs that will be placed in an individual embed message.
-        """
-        self.cog.embeded_queue.append(
-            discord.Embed(
-                title="Lista de Canciones en cola 🍆", color=discord.Color.blurple()
-            ).add_field(name="Canciones", value=list_of_songs, inline=False)
-        )
-
     def sanitize_youtube_query(self, youtube_query: str) -> str:
         """
         Sanitize the Youtube query to avoid problems, like from timestamps.
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+
+from .dto import SongInfoDTO
+from .extraction_policy import ExtractionUnavailableError
+
+logger = logging.getLogger(__name__)
+
+
+class QueuePrefetcher:
+    """
+    Resolves the audio source of the next songs in the music queue in the background, so when a song
+    ends the next one already has a playable source instead of waiting for a yt-dlp extraction.
+    """
+
+    def __init__(self, player, lookahead: int = 2, concurrency: int = 2):
+        self.player = player
+        # How many songs ahead of the current one are kept resolved
+        self.lookahead = lookahead
+        self._semaphore = asyncio.Semaphore(max(concurrency, 1))
+        self._tasks: dict[int, asyncio.Task] = {}  # id(song) -> resolving task
+
+    def upcoming_songs(self) -> list[SongInfoDTO]:
+        """
+        Util method that returns the songs that will be played next, in order.
+        Returns:
+            * (List) The next songs of the queue that is going to be played.
+        """
+        queue = self.player.music_queue
+        # Playlists that aren't loaded yet have nothing to resolve.
+        return [
+            entry.song
+            for entry in queue.upcoming(self.lookahead)
+            if isinstance(entry.song, SongInfoDTO)
+        ]
+
+    def schedule(self):
+        """
+        Starts resolving the upcoming songs that don't have a source yet and cancels the work of the
+        songs that are no longer upcoming, for example after a move, shuffle or play_next.
+        """
+        if self.lookahead <= 0:
+            return
+
+        wanted = {id(song): song for song in self.upcoming_songs() if not song.source}
+        for key in [key for key in self._tasks if key not in wanted]:
+            self._tasks.pop(key).cancel()
+
+        for key, song in wanted.items():
+            if key not in self._tasks:
+                task = asyncio.create_task(self._resolve(song))
+                task.add_done_callback(lambda done, key=key: self._forget(key, done))
+                self._tasks[key] = task
+
+    async def wait_for(self, song: SongInfoDTO):
+        """
+        Waits for the song to be resolved if it is being prefetched at the moment.
+        Params:
+            * (SongInfoDTO) song: The song about to be played.
+        """
+        task = self._tasks.get(id(song))
+        if task:
+            # asyncio.wait doesn't raise if the prefetch failed, the caller falls back to resolving it.
+            await asyncio.wait({task})
+
+    def cancel_all(self):
+        """
+        Cancels every background resolution, used when the queue is cleared.
+        """
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+    def _forget(self, key: int, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    async def _resolve(self, song: SongInfoDTO):
+        async with self._semaphore:
+            try:
+                resolved_song = await self.player.music_service.search_youtube_url(
+                    url=song.url, author=song.author
+                )
+            except ExtractionUnavailableError:
+                # Youtube is failing us, the song gets resolved when it is its turn to play.
+                return
+
+        if not resolved_song or not resolved_song.source:
+            logger.warning("Could not prefetch the source of %s", song.url)
+            return
+
+        # The queue entry is updated in place so it keeps its position even if it was moved.
+        song.source = resolved_song.source
+        song.format_id = resolved_song.format_id
+        completed = not song.title or not song.duration
+        song.title = song.title or resolved_song.title
+        song.duration = song.duration or resolved_song.duration
+        song.thumbnail = song.thumbnail or resolved_song.thumbnail
+        if completed:
+            self.player.music_queue.refresh_songs([song])
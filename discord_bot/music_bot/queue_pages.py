@@ -0,0 +1,148 @@
+from typing import Optional
+
+import discord
+
+from .dto import LazyPlaylist
+from .music_queue import MusicQueue, entry_title
+
+# Characters an embed field can hold
+EMBED_FIELD_LIMIT = 1024
+# Characters of a song title shown at most, longer ones are cut
+TITLE_LIMIT = 100
+# Characters of a song line at most, the rest of the field is left for its number: "`1234567 -` "
+LINE_LIMIT = EMBED_FIELD_LIMIT - 16
+QUEUE_FOOTER_ICON_URL = "https://cdn-icons-png.flaticon.com/512/1384/1384061.png"
+
+
+class QueuePageRenderer:
+    """
+    Splits the music queue into the embed pages of the queue command and renders them on demand.
+    The page boundaries are computed once per queue version from the cached text of every song, so the
+    first page shown after a queue change walks the whole queue, O(n). A page is only rendered when it is
+    viewed, and rendered pages are reused by later queue commands and by the reaction navigation until the
+    queue changes. Songs without their info yet are shown with placeholders.
+    """
+
+    def __init__(self, music_service):
+        self.music_service = music_service
+        # (id(queue), queue.version) the cached boundaries and pages belong to
+        self._key = None
+        self._starts: list[int] = []  # Queue position where each page starts
+        # id(song) -> (song, the fields shown, its line without the number)
+        self._lines: dict[int, tuple] = {}
+        self._pages: dict[int, discord.Embed] = {}
+        self._summary = ""
+
+    def _song_line(self, song) -> str:
+        if isinstance(song, LazyPlaylist):
+            # The songs of a playlist that aren't loaded yet are shown as one estimated entry.
+            return self._format_line(
+                entry_title(song), song.url, song.estimated_duration, song.author
+            )
+
+        # Songs can be completed in place (ex: by the prefetcher), so the shown fields are compared too.
+        fields = (song.title, song.duration, song.author)
+        cached = self._lines.get(id(song))
+        if cached and cached[0] is song and cached[1] == fields:
+            return cached[2]
+        line = self._format_line(
+            entry_title(song), song.url, song.duration or None, song.author
+        )
+        self._lines[id(song)] = (song, fields, line)
+        return line
+
+    def _format_line(
+        self, title: str, url: str, duration: Optional[float], author: str
+    ) -> str:
+        # Songs whose duration isn't known yet show a placeholder.
+        duration = (
+            "-:--:--"
+            if duration is None
+            else self.music_service.convert_seconds(duration)
+        )
+        if len(title) > TITLE_LIMIT:
+            title = title[: TITLE_LIMIT - 1] + "…"
+        line = f"[{title}]({url})|`{duration} ({author})`\n"
+        if len(line) > LINE_LIMIT:
+            # The url is too long to be linked, the song is shown without it.
+            line = f"{title}|`{duration} ({author})`\n"
+        if len(line) > LINE_LIMIT:
+            line = line[: LINE_LIMIT - 2] + "…\n"
+        return line
+
+    def _sync(self, queue: MusicQueue):
+        key = (id(queue), queue.version)
+        if key == self._key:
+            return
+
+        lines = {}
+        starts = [0]
+        page_length = 0
+        for position, entry in enumerate(queue):
+            line = self._song_line(entry.song)
+            if id(entry.song) in self._lines:
+                lines[id(entry.song)] = self._lines[id(entry.song)]
+            # The number of the song is added when the page is rendered: "`12 -` "
+            line_length = len(str(position + 1)) + 5 + len(line)
+            if page_length and page_length + line_length >= EMBED_FIELD_LIMIT:
+                starts.append(position)
+                page_length = 0
+            page_length += line_length
+
+        queue_length = self.music_service.count_queue_songs(queue)
+        queue_duration = self.music_service.convert_seconds(queue.total_duration())
+        songs = "song" if queue_length == 1 else "songs"
+        self._summary = (
+            f"**{queue_length} {songs} in queue | {queue_duration} queue duration**"
+        )
+        self._lines = lines
+        self._starts = starts
+        self._pages = {}
+        self._key = key
+
+    def page_count(self, queue: MusicQueue) -> int:
+        """
+        Params:
+            * (MusicQueue) queue: The queue to display.
+        Returns:
+            * (Integer) The number of pages of the queue command.
+        """
+        self._sync(queue)
+        return len(self._starts)
+
+    def page(self, queue: MusicQueue, index: int) -> Optional[discord.Embed]:
+        """
+        Get a page of the queue command, rendering it if it isn't cached for the current queue version.
+        Params:
+            * (MusicQueue) queue: The queue to display.
+            * (Integer) index: The page to display, it is clamped to the pages of the queue.
+        Returns:
+            * (discord.Embed | None) The embed of the page, None if the queue is empty.
+        """
+        if not queue:
+            return None
+        self._sync(queue)
+        index = min(max(index, 0), len(self._starts) - 1)
+        if index in self._pages:
+            return self._pages[index]
+
+        start = self._starts[index]
+        end = self._starts[index + 1] if index + 1 < len(self._starts) else len(queue)
+
+        songs = "".join(
+            f"`{position} -` {self._song_line(entry.song)}"
+            for position, entry in enumerate(queue.window(start, end), start + 1)
+        )
+        embed = (
+            discord.Embed(
+                title="Lista de Canciones en cola 🍆", color=discord.Color.blurple()
+            )
+            .add_field(name="Canciones", value=songs, inline=False)
+            .add_field(name="\u200b", value=self._summary, inline=False)
+            .set_footer(
+                text=f"Page {index + 1}/{len(self._starts)}",
+                icon_url=QUEUE_FOOTER_ICON_URL,
+            )
+        )
+        self._pages[index] = embed
+        return embed
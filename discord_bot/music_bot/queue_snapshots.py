@@ -0,0 +1,178 @@
+import logging
+from dataclasses import asdict
+from typing import Any, Optional, Union
+
+from asgiref.sync import sync_to_async
+
+from .dto import LazyPlaylist, SongInfoDTO
+from .guild_player import GuildPlayer, GuildPlayerRegistry
+from .models import QueueSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_entry(song: Union[SongInfoDTO, LazyPlaylist], channel: Any) -> dict:
+    """
+    Params:
+        * (SongInfoDTO | LazyPlaylist) song: The song of a queue entry.
+        * channel: The voice channel it was requested from.
+    Returns:
+        * (Dict) The JSON of the entry in a QueueSnapshot. The audio source isn't kept, it expires anyway.
+    """
+    channel_id = getattr(channel, "id", None)
+    if isinstance(song, LazyPlaylist):
+        return {"playlist": asdict(song), "channel": channel_id}
+    return {
+        "url": song.url,
+        "title": song.title,
+        "duration": song.duration,
+        "thumbnail": song.thumbnail,
+        "author": song.author,
+        "channel": channel_id,
+    }
+
+
+def deserialize_entry(data: dict) -> tuple:
+    """
+    Params:
+        * (Dict) data: The JSON of an entry in a QueueSnapshot.
+    Returns:
+        * (Tuple) The song, without an audio source until it is about to play, and the id of its voice channel.
+    """
+    if "playlist" in data:
+        return LazyPlaylist(**data["playlist"]), data["channel"]
+    song = SongInfoDTO(
+        author=data["author"],
+        url=data["url"],
+        title=data["title"],
+        duration=data["duration"],
+        thumbnail=data["thumbnail"],
+    )
+    return song, data["channel"]
+
+
+class QueueSnapshotWriter:
+    """
+    Write-behind persistence of the music queues, so a restart doesn't lose them. Changing a queue only
+    increments MusicQueue.version. Every flush compares the version of each queue and its current song with
+    the ones last written, and saves the changed queues together in one bulk upsert. A queue is written at
+    most once per flush no matter how many changes it had, and the unchanged ones cost nothing.
+    """
+
+    def __init__(self, players: GuildPlayerRegistry):
+        self.players = players
+        self._written: dict[int, tuple] = {}  # guild id -> state of its last write
+
+    def _current_song(self, player: GuildPlayer) -> Optional[SongInfoDTO]:
+        if (player.is_playing or player.is_paused) and player.now_playing:
+            return player.now_playing[0]
+        return None
+
+    def _state(self, player: GuildPlayer) -> tuple:
+        return (
+            id(player.music_queue),
+            player.music_queue.version,
+            id(self._current_song(player)),
+        )
+
+    def _snapshot(self, player: GuildPlayer) -> QueueSnapshot:
+        entries = []
+        current_song = self._current_song(player)
+        if current_song:
+            voice_client = player.current_voice_channel
+            channel = voice_client.channel if voice_client else None
+            entries.append(serialize_entry(current_song, channel))
+        entries.extend(
+            serialize_entry(entry.song, entry.channel) for entry in player.music_queue
+        )
+        return QueueSnapshot(
+            guild_id=player.guild_id,
+            entries=entries,
+            playing=current_song is not None,
+        )
+
+    @sync_to_async
+    def _write(self, snapshots: list, deleted: list):
+        if snapshots:
+            QueueSnapshot.objects.bulk_create(
+                snapshots,
+                update_conflicts=True,
+                unique_fields=["guild_id"],
+                update_fields=["entries", "playing", "updated_at"],
+            )
+        if deleted:
+            QueueSnapshot.objects.filter(guild_id__in=deleted).delete()
+
+    async def flush(self) -> int:
+        """
+        Save the queues that changed since the last flush and delete the ones that were emptied.
+        Returns:
+            * (Integer) The number of guilds written.
+        """
+        snapshots = []
+        deleted = []
+        states = {}
+        for player in self.players:
+            state = self._state(player)
+            if self._written.get(player.guild_id) == state:
+                continue
+            states[player.guild_id] = state
+            snapshot = self._snapshot(player)
+            if snapshot.entries:
+                snapshots.append(snapshot)
+            else:
+                deleted.append(player.guild_id)
+        # The evicted players don't come back with their queue.
+        evicted = [
+            guild_id for guild_id in self._written if guild_id not in self.players
+        ]
+        deleted.extend(evicted)
+
+        if not snapshots and not deleted:
+            return 0
+        await self._write(snapshots, deleted)
+        for guild_id in evicted:
+            del self._written[guild_id]
+        self._written.update(states)
+        return len(snapshots) + len(deleted)
+
+    @sync_to_async
+    def _load(self, guild_ids: list) -> list:
+        return list(QueueSnapshot.objects.filter(guild_id__in=guild_ids))
+
+    async def restore(self, guilds) -> list:
+        """
+        Put back the saved queues of some guilds. The songs keep their saved info and are only resolved when
+        they are about to play, and playlists continue from their saved cursor.
+        Params:
+            * guilds: The discord guilds the bot can see, a sharded process only restores the ones of its shards.
+        Returns:
+            * (List) (GuildPlayer, voice channel) of the guilds that were playing, to resume them.
+        """
+        guilds_by_id = {guild.id: guild for guild in guilds}
+        resumable = []
+        for snapshot in await self._load(list(guilds_by_id)):
+            guild = guilds_by_id[snapshot.guild_id]
+            player = self.players.get(guild)
+            if player.music_queue or player.now_playing:
+                # The guild used the bot before its queue was restored.
+                continue
+
+            entries = [deserialize_entry(data) for data in snapshot.entries]
+            channels = {
+                channel_id: guild.get_channel(channel_id)
+                for channel_id in {channel_id for _, channel_id in entries}
+                if channel_id is not None
+            }
+            # Entries whose voice channel was deleted go to one that still exists.
+            fallback = next((channel for channel in channels.values() if channel), None)
+            if fallback is None:
+                continue
+            for song, channel_id in entries:
+                player.music_queue.append(song, channels.get(channel_id) or fallback)
+
+            self._written[guild.id] = self._state(player)
+            if snapshot.playing:
+                resumable.append((player, player.music_queue.head.channel))
+            logger.info("Restored %s queued songs of guild %s", len(entries), guild.id)
+        return resumable
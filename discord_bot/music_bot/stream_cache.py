@@ -0,0 +1,139 @@
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from .dto import SongInfoDTO
+
+# googlevideo urls carry their expiry either as a query param (?expire=1700000000)
+# or as a path segment on manifest urls (/expire/1700000000/).
+EXPIRE_PATH_PATTERN = re.compile(r"/expire/(\d+)")
+
+
+def parse_stream_expiry(source_url: str) -> Optional[float]:
+    """
+    Read the unix timestamp in which a resolved googlevideo url stops working.
+    Params:
+        * (String) source_url: The audio source url returned by yt-dlp.
+    Returns:
+        * (Float | None): The expiry timestamp, or None if the url doesn't carry one.
+    """
+    if not source_url:
+        return None
+
+    parsed_url = urlparse(source_url)
+    expire = parse_qs(parsed_url.query).get("expire")
+    if expire and expire[0].isdigit():
+        return float(expire[0])
+
+    match = EXPIRE_PATH_PATTERN.search(parsed_url.path)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+@dataclass
+class StreamCacheEntry:
+    song: SongInfoDTO
+    expires_at: float
+
+
+class StreamUrlCache:
+    """
+    LRU cache of resolved audio sources keyed by (video_id, format_id).
+    Entries are considered stale once their googlevideo url is about to expire, taking into account
+    a safety margin and the duration of the song so FFmpeg can still reconnect near the end of it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        safety_margin: float = 600.0,
+        default_ttl: float = 1800.0,
+    ):
+        self.max_entries = max_entries
+        self.safety_margin = safety_margin
+        self.default_ttl = default_ttl  # Used when a source url doesn't carry expire=
+        self._entries: "OrderedDict[tuple[str, str], StreamCacheEntry]" = OrderedDict()
+        self._latest_format: dict[str, str] = {}  # video_id -> last format_id selected
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _is_fresh(self, entry: StreamCacheEntry, now: float) -> bool:
+        return now + self.safety_margin + entry.song.duration < entry.expires_at
+
+    def is_playable(self, song: SongInfoDTO) -> bool:
+        """
+        Tell if a source resolved earlier (ex: by the prefetcher) can still be played to the end of the song.
+        Params:
+            * (SongInfoDTO) song: The song with its resolved source.
+        Returns:
+            * (Boolean) False if its googlevideo url expires before the safety margin and the song are over.
+        """
+        expires_at = parse_stream_expiry(song.source)
+        if expires_at is None:
+            return True
+        return time.time() + self.safety_margin + (song.duration or 0) < expires_at
+
+    def get(
+        self, video_id: str, format_id: Optional[str] = None
+    ) -> Optional[SongInfoDTO]:
+        """
+        Return the cached song for a video if its source url is still safe to play.
+        Params:
+            * (String) video_id: The unique identifier of a Youtube video.
+            * (String) format_id: The yt-dlp format wanted, defaults to the last one selected for the video.
+        Returns:
+            * (SongInfoDTO | None): The cached song without author, or None on a miss.
+        """
+        if self.max_entries <= 0 or not video_id:
+            return None
+
+        format_id = format_id or self._latest_format.get(video_id)
+        key = (video_id, format_id or "")
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if not self._is_fresh(entry, time.time()):
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return entry.song
+
+    def put(self, video_id: str, song: SongInfoDTO):
+        """
+        Store a resolved song, evicting the least recently used entries when the cache is full.
+        Params:
+            * (String) video_id: The unique identifier of a Youtube video.
+            * (SongInfoDTO) song: The resolved song, its source and format_id are used for the entry.
+        """
+        if self.max_entries <= 0 or not video_id or not song.source:
+            return
+
+        expires_at = parse_stream_expiry(song.source)
+        if expires_at is None:
+            expires_at = time.time() + self.default_ttl
+
+        entry = StreamCacheEntry(song=song, expires_at=expires_at)
+        if not self._is_fresh(entry, time.time()):
+            return
+
+        key = (video_id, song.format_id or "")
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._latest_format[video_id] = song.format_id or ""
+
+        while len(self._entries) > self.max_entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+    def _remove(self, key: tuple[str, str]):
+        self._entries.pop(key, None)
+        video_id, format_id = key
+        if self._latest_format.get(video_id) == format_id:
+            del self._latest_format[video_id]
@@ -1,3 +1,981 @@
-from django.test import TestCase
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import shard_launcher
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from yt_dlp.utils import DownloadError
+
+from . import (
+    extraction_backend,
+    extraction_policy,
+    music_queue,
+    music_service,
+    stream_cache,
+)
+from .dto import LazyPlaylist, SongInfoDTO
+from .extraction_backend import ExtractionBackend
+from .extraction_policy import (
+    CircuitBreaker,
+    ExtractionUnavailableError,
+    LatencyTracker,
+)
+from .http_client import HttpClientError, HttpResponse
+from .models import PlaylistLog, SongLog
+from .music_queue import MusicQueue, QueueEntry
+from .music_service import DataApiQuotaError, MusicService
+from .queue_pages import EMBED_FIELD_LIMIT, QueuePageRenderer
+from .stream_cache import StreamUrlCache, parse_stream_expiry
+from .youtube_extractor import YouTubeExtractorService
+
+VIDEO_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def video_info(title: str) -> dict:
+    return {
+        "id": "dQw4w9WgXcQ",
+        "title": title,
+        "duration": 212,
+        "thumbnail": None,
+        "webpage_url": VIDEO_URL,
+        "formats": [
+            {"format_id": "251", "url": "https://audio", "acodec": "opus", "abr": 128}
+        ],
+    }
+
+
+class FakeBackend(ExtractionBackend):
+    """
+    Backend answering every extraction with the next scripted (seconds, info or error) reply, the last
+    reply is repeated once the script runs out.
+    """
+
+    def __init__(self, replies: list, workers: int = 0):
+        super().__init__(workers=workers)
+        self.replies = replies
+        self.started = 0
+        self.cancelled = 0
+
+    async def run(self, func, *args):
+        seconds, reply = self.replies[min(self.started, len(self.replies) - 1)]
+        self.started += 1
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+class FakeProcessPool(ThreadPoolExecutor):
+    """
+    Stands for the ProcessPoolExecutor of the backend, terminating it only records which jobs were over.
+    """
+
+    def __init__(self, max_workers: int, finished: list):
+        super().__init__(max_workers=max_workers)
+        self.finished = finished
+        self.finished_when_terminated = None
+
+    def terminate_workers(self):
+        self.finished_when_terminated = list(self.finished)
+        self.shutdown(wait=False)
+
+
+class ExtractionBackendTests(SimpleTestCase):
+    async def test_timeout_waits_for_the_other_jobs_before_terminating_the_pool(self):
+        finished = []
+        pools = []
+
+        def new_pool(max_workers):
+            pools.append(FakeProcessPool(max_workers, finished))
+            return pools[-1]
+
+        def extraction(seconds: float, name: str) -> str:
+            time.sleep(seconds)
+            finished.append(name)
+            return name
+
+        async def run_later(delay: float, seconds: float, name: str) -> str:
+            await asyncio.sleep(delay)
+            return await backend.run(extraction, seconds, name)
+
+        backend = ExtractionBackend(workers=2, timeout=0.5)
+        with mock.patch.object(extraction_backend, "ProcessPoolExecutor", new_pool):
+            # "hung" times out at 0.5s while "other" runs from 0.3s to 0.65s in the same pool.
+            results = await asyncio.gather(
+                backend.run(extraction, 1.0, "hung"),
+                run_later(0.3, 0.35, "other"),
+                return_exceptions=True,
+            )
+            self.assertIsInstance(results[0], asyncio.TimeoutError)
+            self.assertEqual(results[1], "other")
+            # The pool was retired by the timeout and only terminated once the other job was over.
+            self.assertEqual(pools[0].finished_when_terminated, ["other"])
+            self.assertEqual(await backend.run(extraction, 0, "next"), "next")
+        self.assertEqual(len(pools), 2)
+
+
+class LatencyTrackerTests(SimpleTestCase):
+    def test_no_hedging_without_enough_samples(self):
+        tracker = LatencyTracker(min_samples=3)
+        tracker.record(1.0)
+        tracker.record(2.0)
+        self.assertIsNone(tracker.hedge_delay())
+
+    def test_no_hedging_when_disabled(self):
+        tracker = LatencyTracker(percentile=0, min_samples=1)
+        tracker.record(1.0)
+        self.assertIsNone(tracker.hedge_delay())
+
+    def test_delay_is_the_percentile(self):
+        tracker = LatencyTracker(percentile=95.0, min_samples=1, min_delay=0.0)
+        for tenths in range(100, 0, -1):
+            tracker.record(tenths / 10)
+        self.assertEqual(tracker.hedge_delay(), 9.6)
+
+    def test_delay_is_at_least_the_minimum(self):
+        tracker = LatencyTracker(min_samples=1, min_delay=1.0)
+        for _ in range(10):
+            tracker.record(0.1)
+        self.assertEqual(tracker.hedge_delay(), 1.0)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = SimpleNamespace(monotonic=lambda: self.now)
+        patcher = mock.patch.object(extraction_policy, "time", clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(
+            error_rate=0.5, min_calls=4, window=120.0, cooldown=60.0
+        )
+
+    def open_breaker(self):
+        for succeeded in (True, True, False, False):
+            self.breaker.record(succeeded=succeeded)
+
+    def test_opens_at_the_error_rate(self):
+        self.breaker.record(succeeded=True)
+        self.breaker.record(succeeded=True)
+        self.breaker.record(succeeded=False)
+        self.assertFalse(self.breaker.is_open)
+        self.breaker.record(succeeded=False)
+        self.assertTrue(self.breaker.is_open)
+        with self.assertRaises(ExtractionUnavailableError) as raised:
+            self.breaker.check()
+        self.assertEqual(raised.exception.retry_after, 60.0)
+
+    def test_needs_the_minimum_calls(self):
+        for _ in range(3):
+            self.breaker.record(succeeded=False)
+        self.assertFalse(self.breaker.is_open)
+        self.breaker.check()
+
+    def test_old_failures_leave_the_window(self):
+        for _ in range(3):
+            self.breaker.record(succeeded=False)
+        self.now += 121.0
+        self.breaker.record(succeeded=False)
+        self.assertFalse(self.breaker.is_open)
+
+    def test_half_open_trial_success_closes_it(self):
+        self.open_breaker()
+        self.now += 61.0
+        self.breaker.check()
+        # Only one trial at a time
+        with self.assertRaises(ExtractionUnavailableError):
+            self.breaker.check()
+        self.breaker.record(succeeded=True)
+        self.assertFalse(self.breaker.is_open)
+        self.breaker.check()
+
+    def test_half_open_trial_failure_opens_it_again(self):
+        self.open_breaker()
+        self.now += 61.0
+        self.breaker.check()
+        self.breaker.record(succeeded=False)
+        self.assertTrue(self.breaker.is_open)
+        with self.assertRaises(ExtractionUnavailableError):
+            self.breaker.check()
+        self.now += 61.0
+        self.breaker.check()
+
+    def test_outcomes_outside_the_trial_are_ignored(self):
+        self.open_breaker()
+        self.breaker.record(succeeded=True)
+        self.assertTrue(self.breaker.is_open)
+
+    def test_released_trial_lets_another_one_start(self):
+        self.open_breaker()
+        self.now += 61.0
+        self.breaker.check()
+        self.breaker.release_trial()
+        self.assertTrue(self.breaker.is_open)
+        self.breaker.check()
+
+
+class YouTubeExtractorServiceTests(SimpleTestCase):
+    def create_extractor(self, backend, deadline=5.0, hedge_after=None, breaker=None):
+        tracker = LatencyTracker(percentile=50.0, min_samples=1, min_delay=0.0)
+        if hedge_after is not None:
+            tracker.record(hedge_after)
+        return YouTubeExtractorService(
+            backend=backend,
+            deadline=deadline,
+            latency_tracker=tracker,
+            # Opens on the first failure
+            circuit_breaker=breaker or CircuitBreaker(error_rate=1.0, min_calls=1),
+        )
+
+    async def test_returns_the_extracted_song(self):
+        backend = FakeBackend([(0.0, video_info("Song"))])
+        extractor = self.create_extractor(backend)
+        song = await extractor.search(VIDEO_URL, author="user")
+        self.assertEqual(song.title, "Song")
+        self.assertEqual(song.author, "user")
+        self.assertEqual(song.source, "https://audio")
+        self.assertEqual(backend.started, 1)
+
+    async def test_deadline_cancels_the_extraction(self):
+        backend = FakeBackend([(10.0, video_info("Song"))])
+        extractor = self.create_extractor(backend, deadline=0.05)
+        self.assertIsNone(await extractor.search(VIDEO_URL, author="user"))
+        self.assertEqual(backend.cancelled, 1)
+        self.assertTrue(extractor.circuit_breaker.is_open)
+
+    async def test_deadline_cancels_the_attempt_waiting_to_be_hedged(self):
+        backend = FakeBackend([(10.0, video_info("Song"))], workers=1)
+        extractor = self.create_extractor(backend, deadline=0.05, hedge_after=5.0)
+        self.assertIsNone(await extractor.search(VIDEO_URL, author="user"))
+        await asyncio.sleep(0.01)
+        self.assertEqual(backend.started, 1)
+        self.assertEqual(backend.cancelled, 1)
+
+    async def test_hedged_attempt_wins_and_the_slow_one_is_cancelled(self):
+        backend = FakeBackend(
+            [(10.0, video_info("First")), (0.0, video_info("Hedged"))], workers=1
+        )
+        extractor = self.create_extractor(backend, hedge_after=0.05)
+        song = await extractor.search(VIDEO_URL, author="user")
+        await asyncio.sleep(0.01)
+        self.assertEqual(song.title, "Hedged")
+        self.assertEqual(backend.started, 2)
+        self.assertEqual(backend.cancelled, 1)
+
+    async def test_hedged_attempt_loses_to_the_first_one(self):
+        backend = FakeBackend(
+            [(0.1, video_info("First")), (10.0, video_info("Hedged"))], workers=1
+        )
+        extractor = self.create_extractor(backend, hedge_after=0.05)
+        song = await extractor.search(VIDEO_URL, author="user")
+        await asyncio.sleep(0.01)
+        self.assertEqual(song.title, "First")
+        self.assertEqual(backend.started, 2)
+        self.assertEqual(backend.cancelled, 1)
+
+    async def test_hedged_attempt_covers_a_failed_first_one(self):
+        backend = FakeBackend(
+            [(0.1, Exception("HTTP Error 503")), (0.1, video_info("Hedged"))],
+            workers=1,
+        )
+        extractor = self.create_extractor(backend, hedge_after=0.05)
+        song = await extractor.search(VIDEO_URL, author="user")
+        self.assertEqual(song.title, "Hedged")
+        self.assertFalse(extractor.circuit_breaker.is_open)
+
+    async def test_no_hedging_on_the_thread_backend(self):
+        backend = FakeBackend(
+            [(0.1, video_info("First")), (0.0, video_info("Hedged"))], workers=0
+        )
+        extractor = self.create_extractor(backend, hedge_after=0.01)
+        song = await extractor.search(VIDEO_URL, author="user")
+        self.assertEqual(song.title, "First")
+        self.assertEqual(backend.started, 1)
+
+    async def test_concurrent_searches_share_one_extraction(self):
+        backend = FakeBackend([(0.05, video_info("Song"))])
+        extractor = self.create_extractor(backend)
+        first, second = await asyncio.gather(
+            extractor.search(VIDEO_URL, author="first"),
+            extractor.search("https://youtu.be/dQw4w9WgXcQ", author="second"),
+        )
+        self.assertEqual(backend.started, 1)
+        self.assertEqual((first.title, first.author), ("Song", "first"))
+        self.assertEqual((second.title, second.author), ("Song", "second"))
+        self.assertEqual(extractor._inflight, {})
+
+    async def test_equivalent_queries_share_one_extraction(self):
+        backend = FakeBackend([(0.05, video_info("Song"))])
+        extractor = self.create_extractor(backend)
+        await asyncio.gather(
+            extractor.search("  Bad Bunny   Titi Me Pregunto", author="first"),
+            extractor.search("bad bunny titi me pregunto", author="second"),
+        )
+        self.assertEqual(backend.started, 1)
+
+    async def test_cancelled_caller_does_not_cancel_the_shared_extraction(self):
+        backend = FakeBackend([(0.05, video_info("Song"))])
+        extractor = self.create_extractor(backend)
+        prefetch = asyncio.create_task(extractor.search(VIDEO_URL, author="prefetch"))
+        play = asyncio.create_task(extractor.search(VIDEO_URL, author="user"))
+        await asyncio.sleep(0.01)
+        prefetch.cancel()
+
+        song = await play
+        self.assertTrue(prefetch.cancelled())
+        self.assertEqual(song.title, "Song")
+        self.assertEqual(backend.started, 1)
+        self.assertEqual(backend.cancelled, 0)
+
+    async def test_extraction_finishes_when_its_only_caller_is_cancelled(self):
+        backend = FakeBackend([(0.05, video_info("Song"))])
+        extractor = self.create_extractor(backend)
+        prefetch = asyncio.create_task(extractor.search(VIDEO_URL, author="prefetch"))
+        await asyncio.sleep(0.01)
+        prefetch.cancel()
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(backend.cancelled, 0)
+        self.assertEqual(extractor._inflight, {})
+        # The finished extraction is served from the stream cache afterwards
+        song = await extractor.search(VIDEO_URL, author="user")
+        self.assertEqual(song.title, "Song")
+        self.assertEqual(backend.started, 1)
+
+    async def test_unavailable_video_does_not_count_as_a_failure(self):
+        error = DownloadError("ERROR: [youtube] dQw4w9WgXcQ: Private video")
+        backend = FakeBackend([(0.0, error)])
+        extractor = self.create_extractor(backend)
+        self.assertIsNone(await extractor.search(VIDEO_URL, author="user"))
+        # The attempt without js_runtimes isn't tried either
+        self.assertEqual(backend.started, 1)
+        self.assertFalse(extractor.circuit_breaker.is_open)
+
+    async def test_extractor_errors_open_the_breaker(self):
+        backend = FakeBackend([(0.0, DownloadError("ERROR: HTTP Error 429"))])
+        extractor = self.create_extractor(backend)
+        self.assertIsNone(await extractor.search(VIDEO_URL, author="user"))
+        self.assertEqual(backend.started, 2)
+        self.assertTrue(extractor.circuit_breaker.is_open)
+
+        with self.assertRaises(ExtractionUnavailableError):
+            await extractor.search(VIDEO_URL, author="user")
+        self.assertEqual(backend.started, 2)
+
+    async def test_half_open_trial_closes_the_breaker(self):
+        backend = FakeBackend(
+            [(0.0, Exception("HTTP Error 429")), (0.0, video_info("Song"))]
+        )
+        breaker = CircuitBreaker(error_rate=1.0, min_calls=1, cooldown=0.0)
+        extractor = self.create_extractor(backend, breaker=breaker)
+        self.assertIsNone(await extractor.fetch_metadata(VIDEO_URL, author="user"))
+        self.assertTrue(breaker.is_open)
+
+        song = await extractor.fetch_metadata(VIDEO_URL, author="user")
+        self.assertEqual(song.title, "Song")
+        self.assertFalse(breaker.is_open)
+
+    async def test_cancelled_trial_lets_another_one_start(self):
+        backend = FakeBackend(
+            [(0.0, Exception("HTTP Error 429")), (10.0, video_info("Song"))]
+        )
+        breaker = CircuitBreaker(error_rate=1.0, min_calls=1, cooldown=0.0)
+        extractor = self.create_extractor(backend, breaker=breaker)
+        await extractor.fetch_metadata(VIDEO_URL, author="user")
+
+        trial = asyncio.create_task(extractor.fetch_metadata(VIDEO_URL, author="user"))
+        await asyncio.sleep(0.01)
+        for task in list(extractor._inflight.values()):
+            task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await trial
+        self.assertTrue(breaker.is_open)
+        breaker.check()
+
+
+class StreamUrlCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1_700_000_000.0
+        clock = SimpleNamespace(time=lambda: self.now)
+        patcher = mock.patch.object(stream_cache, "time", clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = StreamUrlCache(max_entries=2, safety_margin=600)
+
+    def song(self, format_id: str, expires_in: float) -> SongInfoDTO:
+        expire = int(self.now + expires_in)
+        return SongInfoDTO(
+            author="",
+            url=VIDEO_URL,
+            duration=212,
+            source=f"https://rr1.googlevideo.com/videoplayback?expire={expire}",
+            format_id=format_id,
+        )
+
+    def test_reads_the_expiry_of_the_source(self):
+        self.assertEqual(
+            parse_stream_expiry("https://a/b?expire=1700000100"), 1.7e9 + 100
+        )
+        self.assertEqual(
+            parse_stream_expiry("https://a/api/manifest/expire/1700000200/ei/x"),
+            1.7e9 + 200,
+        )
+        self.assertIsNone(parse_stream_expiry("https://a/b"))
+
+    def test_entry_expires_with_the_margin_and_the_song_duration(self):
+        song = self.song("251", expires_in=3600)
+        self.cache.put("dQw4w9WgXcQ", song)
+        self.assertIs(self.cache.get("dQw4w9WgXcQ"), song)
+
+        # The url still works, but not for the margin plus the whole song.
+        self.now += 3600 - 600 - 212
+        self.assertIsNone(self.cache.get("dQw4w9WgXcQ"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_source_about_to_expire_is_not_stored(self):
+        self.cache.put("dQw4w9WgXcQ", self.song("251", expires_in=700))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_entries_are_keyed_by_format(self):
+        opus = self.song("251", expires_in=3600)
+        m4a = self.song("140", expires_in=3600)
+        self.cache.put("dQw4w9WgXcQ", opus)
+        self.cache.put("dQw4w9WgXcQ", m4a)
+        self.assertIs(self.cache.get("dQw4w9WgXcQ", "251"), opus)
+        self.assertIs(self.cache.get("dQw4w9WgXcQ", "140"), m4a)
+        # Without a format, the last one selected for the video is used.
+        self.assertIs(self.cache.get("dQw4w9WgXcQ"), m4a)
+        self.assertIsNone(self.cache.get("dQw4w9WgXcQ", "18"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.put("a", self.song("251", expires_in=3600))
+        self.cache.put("b", self.song("251", expires_in=3600))
+        self.cache.get("a")
+        self.cache.put("c", self.song("251", expires_in=3600))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("c"))
+
+
+class MusicQueueBlockTests(SimpleTestCase):
+    def setUp(self):
+        # Tiny blocks, so a few hundred songs are split and merged all the time.
+        patcher = mock.patch.object(music_queue, "BLOCK_SIZE", 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_moves_shuffles_and_pops_match_the_linear_sums(self):
+        rng = random.Random(5)
+        songs = [
+            SongInfoDTO(author="user", url="url", duration=float(rng.randint(0, 600)))
+            for _ in range(200)
+        ]
+        queue = MusicQueue(QueueEntry(song, None) for song in songs)
+        for _ in range(2000):
+            operation = rng.choice(["move", "move", "pop", "popleft", "shuffle"])
+            if operation == "move":
+                source = rng.randrange(len(songs))
+                target = rng.randrange(len(songs))
+                queue.move(source, target)
+                songs.insert(target, songs.pop(source))
+            elif operation == "pop":
+                position = rng.randrange(len(songs))
+                self.assertIs(queue.pop(position).song, songs.pop(position))
+            elif operation == "popleft":
+                self.assertIs(queue.popleft().song, songs.pop(0))
+            elif rng.random() < 0.05:
+                queue.shuffle(rng)
+                songs = [entry.song for entry in queue]
+            if len(songs) < 20:
+                new_songs = [
+                    SongInfoDTO(author="user", url="url", duration=float(i))
+                    for i in range(100)
+                ]
+                for song in new_songs:
+                    queue.append(song, None)
+                songs += new_songs
+
+            self.assertEqual(queue.total_duration(), sum(s.duration for s in songs))
+            for position in rng.sample(range(len(songs)), 3):
+                self.assertEqual(
+                    queue.duration_before(position),
+                    sum(song.duration for song in songs[:position]),
+                )
+        self.assertEqual([entry.song for entry in queue], songs)
+        self.assertEqual(queue.window(7, 15), [queue[i] for i in range(7, 15)])
+
+    def test_refresh_songs_only_counts_the_queued_songs(self):
+        songs = [SongInfoDTO(author="user", url="url") for _ in range(10)]
+        queue = MusicQueue(QueueEntry(song, None) for song in songs)
+        removed = queue.pop(3).song
+        songs[8].duration = 100.0
+        removed.duration = 50.0
+        queue.refresh_songs([songs[8], removed])
+        self.assertEqual(queue.total_duration(), 100.0)
+        # It is 8th once the 4th song left
+        self.assertEqual(queue.duration_before(7), 0.0)
+        self.assertEqual(queue.duration_before(8), 100.0)
+
+
+class MusicQueueDurationTests(SimpleTestCase):
+    def test_random_operations_match_the_sums(self):
+        rng = random.Random(20)
+        queue = MusicQueue()
+        songs = []
+
+        def new_song() -> SongInfoDTO:
+            return SongInfoDTO(
+                author="user", url="url", duration=float(rng.randint(0, 600))
+            )
+
+        operations = ["append"] * 4 + ["insert_front", "popleft"] * 2
+        operations += ["insert", "pop", "move", "set_song", "replace", "shuffle"]
+        operations += ["remove", "refresh_songs", "clear"]
+        for _ in range(3000):
+            operation = rng.choice(operations)
+            if operation == "append":
+                song = new_song()
+                queue.append(song, None)
+                songs.append(song)
+            elif operation == "insert_front":
+                song = new_song()
+                queue.insert(0, song, None)
+                songs.insert(0, song)
+            elif operation == "insert":
+                song = new_song()
+                position = rng.randint(0, len(songs))
+                queue.insert(position, song, None)
+                songs.insert(position, song)
+            elif operation == "clear":
+                # Rare, so the queue has time to grow
+                if rng.random() < 0.1:
+                    queue.clear()
+                    songs.clear()
+            elif not songs:
+                continue
+            elif operation == "popleft":
+                self.assertIs(queue.popleft().song, songs.pop(0))
+            elif operation == "pop":
+                position = rng.randrange(len(songs))
+                self.assertIs(queue.pop(position).song, songs.pop(position))
+            elif operation == "move":
+                source = rng.randrange(len(songs))
+                target = rng.randrange(len(songs))
+                queue.move(source, target)
+                songs.insert(target, songs.pop(source))
+            elif operation == "set_song":
+                song = new_song()
+                position = rng.randrange(len(songs))
+                queue.set_song(position, song)
+                songs[position] = song
+            elif operation == "replace":
+                position = rng.randrange(len(songs))
+                new_songs = [new_song() for _ in range(rng.randint(0, 3))]
+                queue.replace(position, [QueueEntry(song, None) for song in new_songs])
+                del songs[position]
+                songs[position:position] = new_songs
+            elif operation == "shuffle":
+                queue.shuffle(rng)
+                songs = [entry.song for entry in queue]
+            elif operation == "remove":
+                removed = rng.sample(songs, min(len(songs), 2))
+                queue.remove(removed)
+                songs = [song for song in songs if all(song is not r for r in removed)]
+            elif operation == "refresh_songs":
+                song = rng.choice(songs)
+                song.duration = float(rng.randint(0, 600))
+                queue.refresh_songs([song])
+
+            self.assertEqual([entry.song for entry in queue], songs)
+            self.assertEqual(queue.total_duration(), sum(s.duration for s in songs))
+            if songs:
+                position = rng.randrange(len(songs))
+                self.assertEqual(
+                    queue.duration_before(position),
+                    sum(song.duration for song in songs[:position]),
+                )
+
+        with self.assertRaises(IndexError):
+            queue.duration_before(len(songs))
+
+
+class QueuePageRendererTests(SimpleTestCase):
+    def test_long_titles_fit_in_the_embed_field(self):
+        queue = MusicQueue()
+        for title in ["x" * 2000, "short", "y" * 300]:
+            queue.append(
+                SongInfoDTO(author="user", url=VIDEO_URL, title=title, duration=60),
+                None,
+            )
+        renderer = QueuePageRenderer(MusicService(player=None))
+        for index in range(renderer.page_count(queue)):
+            field = renderer.page(queue, index).fields[0]
+            self.assertLessEqual(len(field.value), EMBED_FIELD_LIMIT)
+        self.assertIn("[short]", renderer.page(queue, 0).fields[0].value)
+
+
+class MusicServiceTests(SimpleTestCase):
+    def test_completed_live_stream_does_not_need_info_again(self):
+        service = MusicService(player=None)
+        queue = MusicQueue()
+        live_stream = SongInfoDTO(author="user", url=VIDEO_URL)
+        queue.append(live_stream, None)
+        self.assertTrue(service.queue_needs_info(queue))
+
+        # Live streams are found with their title but a duration of 0.
+        service._complete_song(live_stream, "Live", 0.0, None)
+        self.assertEqual(live_stream.duration, 0.0)
+        self.assertFalse(service.queue_needs_info(queue))
+
+
+class FetchVideosMetadataTests(SimpleTestCase):
+    def setUp(self):
+        self.requests = []
+        self.replies = {}
+        self.player = SimpleNamespace(
+            http_client=SimpleNamespace(get_json=self.get_json), youtube_api_key="key"
+        )
+        self.service = MusicService(player=self.player)
+
+    async def get_json(self, url, params=None):
+        ids = params["id"].split(",")
+        self.requests.append(ids)
+        reply = self.replies.get(ids[0])
+        if isinstance(reply, Exception):
+            raise reply
+        if reply is not None:
+            return HttpResponse(status=403, data=reply, headers={})
+        items = [
+            {
+                "id": video_id,
+                "snippet": {"title": f"Song {video_id}"},
+                "contentDetails": {"duration": "PT3M5S"},
+            }
+            for video_id in ids
+        ]
+        return HttpResponse(status=200, data={"items": items}, headers={})
+
+    async def test_packs_up_to_50_unique_ids_per_request(self):
+        video_ids = [f"v{number}" for number in range(120)]
+        videos = await self.service.fetch_videos_metadata(video_ids + video_ids[:10])
+
+        self.assertEqual([len(ids) for ids in self.requests], [50, 50, 20])
+        self.assertEqual(sum(self.requests, []), video_ids)
+        self.assertEqual(list(videos), video_ids)
+        self.assertEqual(
+            videos["v7"], {"title": "Song v7", "duration": 185.0, "thumbnail": None}
+        )
+
+    async def test_failed_request_only_loses_its_batch(self):
+        self.replies["v50"] = HttpClientError("timeout")
+        videos = await self.service.fetch_videos_metadata(
+            [f"v{number}" for number in range(120)]
+        )
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(len(videos), 70)
+        self.assertNotIn("v50", videos)
+        self.assertIn("v100", videos)
+
+    async def test_quota_error_is_raised(self):
+        self.replies["v0"] = {"error": {"errors": [{"reason": "quotaExceeded"}]}}
+        with self.assertRaises(DataApiQuotaError):
+            await self.service.fetch_videos_metadata(["v0", "v1"])
+
+
+class SaveSongsTests(TestCase):
+    def song(self, video_id: str, title: str) -> SongInfoDTO:
+        return SongInfoDTO(
+            author="user",
+            url=f"https://www.youtube.com/watch?v={video_id}",
+            title=title,
+            duration=60,
+        )
+
+    def test_saves_every_song_in_batches(self):
+        songs = [self.song(f"v{number}", "Song") for number in range(1200)]
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(MusicService(player=None).save_songs)(songs)
+        # A statement per batch of songs, SQLite splits the batches further to fit its variable limit.
+        self.assertLessEqual(len(queries), 5)
+        self.assertEqual(SongLog.objects.count(), 1200)
+
+    def test_saved_songs_are_left_as_they_are(self):
+        SongLog.objects.create(url="dQw4w9WgXcQ", title="Saved", duration=60)
+        songs = [self.song("dQw4w9WgXcQ", "Renamed"), self.song("v2", "New")]
+        async_to_sync(MusicService(player=None).save_songs)(songs + songs)
+
+        titles = dict(SongLog.objects.values_list("url", "title"))
+        self.assertEqual(titles, {"dQw4w9WgXcQ": "Saved", "v2": "New"})
+
+
+class PlaylistRevalidationTests(TestCase):
+    def setUp(self):
+        self.requests = []
+        # Reply of the Data API to each page token, None for 304 Not Modified
+        self.replies = {}
+        self.player = SimpleNamespace(
+            http_client=SimpleNamespace(get_json=self.get_json), youtube_api_key="key"
+        )
+        self.service = MusicService(player=self.player)
+        self.context = SimpleNamespace(send=mock.AsyncMock())
+        self.cached_pages = [
+            self.page("", "page2", '"etag1"', ["a", "b"]),
+            self.page("page2", None, '"etag2"', ["c"]),
+        ]
+        PlaylistLog.objects.create(playlist_id="PL", pages=self.cached_pages)
+        stale_since = timezone.now() - timedelta(days=30)
+        PlaylistLog.objects.update(updated_at=stale_since)
+
+    def page(self, token, next_token, etag, video_ids) -> dict:
+        return {
+            "token": token,
+            "next_token": next_token,
+            "etag": etag,
+            "total": 3,
+            "video_ids": video_ids,
+        }
+
+    async def get_json(self, url, params=None, headers=None):
+        token = params.get("pageToken", "")
+        self.requests.append((token, headers.get("If-None-Match")))
+        reply = self.replies.get(token)
+        if reply is None:
+            return HttpResponse(status=304, data={}, headers={})
+        return HttpResponse(status=200, data=reply, headers={"ETag": reply["etag"]})
+
+    def paginate(self) -> list:
+        pages = asyncio.Queue()
+        async_to_sync(self.service._paginate_playlist)("PL", self.context, pages)
+        loaded = []
+        while (page := pages.get_nowait()) is not None:
+            loaded.append(page)
+        return loaded
+
+    def test_unchanged_pages_are_revalidated_with_their_etag(self):
+        self.assertEqual(self.paginate(), self.cached_pages)
+        self.assertEqual(self.requests, [("", '"etag1"'), ("page2", '"etag2"')])
+
+        playlist = PlaylistLog.objects.get(playlist_id="PL")
+        self.assertEqual(playlist.hit_count, 1)
+        # Revalidating restarts the freshness window
+        self.assertGreater(playlist.updated_at, timezone.now() - timedelta(minutes=1))
+
+    def test_changed_page_replaces_the_cached_one(self):
+        self.replies["page2"] = {
+            "etag": '"etag3"',
+            "items": [{"contentDetails": {"videoId": "d"}}],
+            "pageInfo": {"totalResults": 3},
+        }
+        loaded = self.paginate()
+
+        self.assertEqual(loaded[0], self.cached_pages[0])
+        self.assertEqual(loaded[1], self.page("page2", None, '"etag3"', ["d"]))
+        playlist = PlaylistLog.objects.get(playlist_id="PL")
+        self.assertEqual(playlist.pages, loaded)
+        self.assertEqual(playlist.hit_count, 0)
+
+    def test_page_after_a_changed_token_is_requested_without_etag(self):
+        self.replies[""] = {
+            "etag": '"etag4"',
+            "items": [{"contentDetails": {"videoId": "a"}}],
+            "nextPageToken": "other",
+            "pageInfo": {"totalResults": 2},
+        }
+        self.replies["other"] = {
+            "etag": '"etag5"',
+            "items": [{"contentDetails": {"videoId": "e"}}],
+            "pageInfo": {"totalResults": 2},
+        }
+        self.paginate()
+        self.assertEqual(self.requests, [("", '"etag1"'), ("other", None)])
+
+    def test_fresh_playlist_is_served_without_requests(self):
+        PlaylistLog.objects.update(updated_at=timezone.now())
+        self.assertEqual(self.paginate(), self.cached_pages)
+        self.assertEqual(self.requests, [])
+        self.assertEqual(PlaylistLog.objects.get(playlist_id="PL").hit_count, 1)
+
+
+class ReproduceNextSongTests(SimpleTestCase):
+    async def test_expired_prefetched_source_is_resolved_again(self):
+        expired_source = (
+            f"https://rr1.googlevideo.com/videoplayback?expire={int(time.time()) + 60}"
+        )
+        head_song = SongInfoDTO(
+            author="user", url=VIDEO_URL, duration=212, source=expired_source
+        )
+        queue = MusicQueue()
+        queue.append(head_song, None)
+        player = SimpleNamespace(
+            music_queue=queue,
+            is_playing=False,
+            now_playing=[],
+            FFMPEG_OPTIONS={},
+            current_voice_channel=mock.Mock(),
+            bot=SimpleNamespace(loop=None),
+            prefetcher=mock.Mock(lookahead=2, wait_for=mock.AsyncMock()),
+            youtube_extractor=SimpleNamespace(
+                stream_cache=StreamUrlCache(safety_margin=600)
+            ),
+        )
+        service = MusicService(player=player)
+        fresh_song = replace(head_song, source="https://fresh")
+        search = mock.AsyncMock(return_value=fresh_song)
+        with (
+            mock.patch.object(service, "search_youtube_url", search),
+            mock.patch("discord.FFmpegPCMAudio") as ffmpeg_audio,
+        ):
+            await service.reproduce_next_song_in_queue()
+
+        search.assert_awaited_once_with(url=VIDEO_URL, author="user")
+        self.assertEqual(ffmpeg_audio.call_args.kwargs["source"], "https://fresh")
+        self.assertEqual(player.now_playing, [fresh_song])
+
+
+class ExpandLazyPlaylistTests(SimpleTestCase):
+    def setUp(self):
+        self.pages = []
+        self.player = SimpleNamespace(
+            http_client=SimpleNamespace(get_json=self.get_json), youtube_api_key="key"
+        )
+        self.service = MusicService(player=self.player)
+        self.lazy_playlist = LazyPlaylist(
+            playlist_id="PL",
+            author="user",
+            backend="api",
+            page_token="page2",
+            loaded_videos=200,
+            total_videos=500,
+        )
+        patcher = mock.patch.object(music_service, "YT_PLAYLIST_BACKEND", "auto")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def get_json(self, url, params=None):
+        reply = self.pages.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return HttpResponse(status=200, data=reply, headers={})
+
+    async def test_quota_error_switches_to_ytdlp_and_keeps_the_cursor(self):
+        self.pages = [{"items": [{"contentDetails": {"videoId": "a"}}]}]
+        hydrate = mock.AsyncMock(side_effect=DataApiQuotaError())
+        with mock.patch.object(self.service, "_hydrate_playlist_page", hydrate):
+            songs = await self.service.expand_lazy_playlist(self.lazy_playlist)
+
+        self.assertEqual(songs, [])
+        self.assertEqual(self.lazy_playlist.backend, "ytdlp")
+        self.assertEqual(self.lazy_playlist.loaded_videos, 200)
+        self.assertEqual(self.lazy_playlist.remaining_videos, 300)
+
+    async def test_unreachable_api_leaves_the_cursor_for_the_next_expansion(self):
+        song = SongInfoDTO(author="user", url=VIDEO_URL, duration=60)
+        self.pages = [
+            {"items": [{"contentDetails": {"videoId": "a"}}], "nextPageToken": "page3"},
+            HttpClientError("timeout"),
+        ]
+        hydrate = mock.AsyncMock(return_value=([song], []))
+        with mock.patch.object(self.service, "_hydrate_playlist_page", hydrate):
+            songs = await self.service.expand_lazy_playlist(self.lazy_playlist)
+
+        self.assertEqual(songs, [song])
+        self.assertEqual(self.lazy_playlist.backend, "api")
+        self.assertEqual(self.lazy_playlist.page_token, "page3")
+        self.assertEqual(self.lazy_playlist.loaded_videos, 201)
+        self.assertEqual(self.lazy_playlist.total_videos, 500)
+
+
+class SplitShardsTests(SimpleTestCase):
+    def test_spreads_contiguous_ranges_of_about_the_same_size(self):
+        self.assertEqual(
+            shard_launcher.split_shards(10, 3),
+            [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]],
+        )
+
+    def test_processes_are_capped_to_the_shards(self):
+        self.assertEqual(shard_launcher.split_shards(2, 8), [[0], [1]])
+        self.assertEqual(shard_launcher.split_shards(3, 0), [[0, 1, 2]])
+
+
+class FakeShardWorker:
+    """
+    Stands for the worker process of a shard, waiting on it runs it for the next scripted
+    (seconds, returncode) of the clock.
+    """
+
+    def __init__(self, clock: SimpleNamespace, seconds: float, returncode: int):
+        self.clock = clock
+        self.seconds = seconds
+        self.pid = 1
+        self.returncode = None
+        self._returncode = returncode
+
+    async def wait(self) -> int:
+        await asyncio.sleep(0)
+        self.clock.now += self.seconds
+        self.returncode = self._returncode
+        return self.returncode
+
+
+class ShardProcessTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = SimpleNamespace(now=0.0)
+        self.clock.monotonic = lambda: self.clock.now
+        self.runs = []
+        self.delays = []
+        wait_for = asyncio.wait_for
+
+        async def record_delay(awaitable, timeout):
+            self.delays.append(timeout)
+            # The backoff is only recorded, the restarts happen right away.
+            return await wait_for(awaitable, timeout=min(timeout, 0.001))
+
+        async def start(shard_process):
+            seconds, returncode = self.runs.pop(0)
+            shard_process.process = FakeShardWorker(self.clock, seconds, returncode)
+
+        patchers = [
+            mock.patch.object(shard_launcher, "time", self.clock),
+            mock.patch.object(shard_launcher.asyncio, "wait_for", record_delay),
+            mock.patch.object(shard_launcher.ShardProcess, "_start", start),
+            mock.patch.object(shard_launcher, "RESTART_BACKOFF", 1.0),
+            mock.patch.object(shard_launcher, "MAX_RESTART_BACKOFF", 4.0),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.shard_process = shard_launcher.ShardProcess([0, 1], shard_count=4)
+
+    async def test_crashes_in_a_row_double_the_restart_delay(self):
+        self.runs = [(10.0, 1), (10.0, 1), (10.0, 1), (10.0, 1), (10.0, 0)]
+        await self.shard_process.supervise(asyncio.Event(), start_delay=5.0)
+
+        self.assertEqual(self.delays, [5.0, 1.0, 2.0, 4.0, 4.0])
+        self.assertEqual(self.shard_process.restarts, 4)
+
+    async def test_healthy_run_starts_the_delay_over(self):
+        healthy = shard_launcher.HEALTHY_RUN_SECONDS
+        self.runs = [(10.0, 1), (10.0, 1), (healthy, 1), (10.0, 0)]
+        await self.shard_process.supervise(asyncio.Event())
+
+        self.assertEqual(self.delays, [0.0, 1.0, 2.0, 1.0])
+        self.assertEqual(self.shard_process.restarts, 3)
+
+    async def test_stopping_launcher_does_not_restart(self):
+        stopping = asyncio.Event()
+        stopping.set()
+        await self.shard_process.supervise(stopping, start_delay=5.0)
+        self.assertIsNone(self.shard_process.process)
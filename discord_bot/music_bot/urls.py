@@ -13,6 +13,7 @@ from .views import (
     resume_view,
     shuffle_view,
     skip_view,
+    when_view,
 )
 
 urlpatterns = [
@@ -28,4 +29,5 @@ urlpatterns = [
     path("commands_help/resume", resume_view, name="commands-resume"),
     path("commands_help/shuffle", shuffle_view, name="commands-shuffle"),
     path("commands_help/play_next", play_next_view, name="commands-play-next"),
+    path("commands_help/when", when_view, name="commands-when"),
 ]
@@ -13,6 +13,7 @@ from .music_commands import (
     RESUME_COMMAND_ALIASES,
     SHUFFLE_COMMAND_ALIASES,
     SKIP_COMMAND_ALIASES,
+    WHEN_COMMAND_ALIASES,
 )
 
 
@@ -83,3 +84,8 @@ def play_next_view(request):
         "base_command": "play_next",
     }
     return render(request, "music_bot/play_next.html", context=context)
+
+
+def when_view(request):
+    context = {"command_aliases": WHEN_COMMAND_ALIASES, "base_command": "when"}
+    return render(request, "music_bot/when.html", context=context)
@@ -0,0 +1,120 @@
+import copy
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+
+from yt_dlp import YoutubeDL
+
+logger = logging.getLogger(__name__)
+
+
+class PooledYoutubeDL:
+    """
+    A YoutubeDL instance plus the bookkeeping needed to recycle it.
+    """
+
+    __slots__ = ("ydl", "created_at", "uses")
+
+    def __init__(self, ydl: YoutubeDL):
+        self.ydl = ydl
+        self.created_at = time.monotonic()
+        self.uses = 0
+
+
+class YoutubeDLPool:
+    """
+    Pool of warm YoutubeDL instances grouped by option set. Building a YoutubeDL registers every
+    extractor, sets up the cookie jar and parses the options, so reusing them saves that work on every song.
+    YoutubeDL is not thread safe, an instance is checked out by a single thread at a time and is
+    only returned to the pool once that thread is done with it.
+    """
+
+    def __init__(
+        self,
+        max_idle_per_options: int = 4,
+        max_uses: int = 100,
+        max_age: float = 3600.0,
+        factory: Callable[[Dict[str, Any]], YoutubeDL] = YoutubeDL,
+    ):
+        self.max_idle_per_options = max_idle_per_options
+        self.max_uses = max_uses  # Instances are recycled after this many extractions
+        self.max_age = max_age  # or after this many seconds, so cookies don't go stale
+        self.factory = factory
+        self.created = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+        self._idle: dict[str, list[PooledYoutubeDL]] = {}
+
+    def _options_key(self, opts: Dict[str, Any]) -> str:
+        return json.dumps(opts, sort_keys=True, default=repr)
+
+    def _is_worn_out(self, pooled: PooledYoutubeDL) -> bool:
+        return (
+            pooled.uses >= self.max_uses
+            or time.monotonic() - pooled.created_at >= self.max_age
+        )
+
+    def _close(self, pooled: PooledYoutubeDL):
+        try:
+            pooled.ydl.close()
+        except Exception as e:
+            logger.warning("Error closing a pooled YoutubeDL instance: %s", e)
+
+    @contextmanager
+    def acquire(self, opts: Dict[str, Any]) -> Iterator[YoutubeDL]:
+        """
+        Check out a YoutubeDL instance built with the given options, creating one if none is idle.
+        Params:
+            * (Dict) opts: The options to pass to yt-dlp.
+        Returns:
+            * (YoutubeDL) An instance only the current thread can use until the context exits.
+        """
+        key = self._options_key(opts)
+        pooled = None
+        worn_out = []
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle and pooled is None:
+                candidate = idle.pop()
+                if self._is_worn_out(candidate):
+                    worn_out.append(candidate)
+                else:
+                    pooled = candidate
+                    self.reused += 1
+
+        for candidate in worn_out:
+            self._close(candidate)
+
+        if pooled is None:
+            # YoutubeDL keeps a reference to its params, so every instance gets its own copy.
+            pooled = PooledYoutubeDL(self.factory(copy.deepcopy(opts)))
+            with self._lock:
+                self.created += 1
+
+        try:
+            yield pooled.ydl
+        finally:
+            pooled.uses += 1
+            self._release(key, pooled)
+
+    def _release(self, key: str, pooled: PooledYoutubeDL):
+        if not self._is_worn_out(pooled):
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle_per_options:
+                    idle.append(pooled)
+                    return
+        self._close(pooled)
+
+    def clear(self):
+        """
+        Close every idle instance, used on shutdown.
+        """
+        with self._lock:
+            idle_instances = [pooled for idle in self._idle.values() for pooled in idle]
+            self._idle.clear()
+        for pooled in idle_instances:
+            self._close(pooled)
@@ -1,21 +1,259 @@
 import asyncio
 import logging
+import time
+from dataclasses import replace
 from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
 
 import validators
-from yt_dlp import YoutubeDL
 
 logger = logging.getLogger(__name__)
 
 from .dto import SongInfoDTO
+from .extraction_backend import ExtractionBackend
+from .extraction_policy import CircuitBreaker, JsRuntimePolicy, LatencyTracker
+from .stream_cache import StreamUrlCache
+from .ydl_pool import YoutubeDLPool
+
+# Only the keys the bot uses are kept from an extraction, yt-dlp info dicts are hundreds
+# of KB once every format, subtitle and thumbnail is included.
+SLIM_INFO_KEYS = ("id", "title", "duration", "thumbnail", "webpage_url")
+SLIM_FORMAT_KEYS = ("format_id", "url", "ext", "acodec", "vcodec", "abr", "tbr")
+
+# Extraction profiles, the ydl_options of the service are applied on top of them.
+AUDIO_PROFILE = "audio"
+METADATA_PROFILE = "metadata"
+PLAYLIST_PROFILE = "playlist"
+PROFILE_OPTIONS = {
+    # We only ever play one audio url, so skip the DASH/HLS manifests and subtitles and
+    # let yt-dlp pick an audio format instead of processing every video one.
+    AUDIO_PROFILE: {
+        "format": "bestaudio[acodec=opus]/bestaudio/best",
+        "noplaylist": True,
+        "quiet": True,
+        "no_warnings": True,
+        "check_formats": False,
+        "extractor_args": {"youtube": {"skip": ["dash", "hls", "translated_subs"]}},
+    },
+    # Title, duration and thumbnail only, the player JS needed to unlock the format
+    # urls isn't downloaded at all.
+    METADATA_PROFILE: {
+        "noplaylist": True,
+        "quiet": True,
+        "no_warnings": True,
+        "check_formats": False,
+        "ignore_no_formats_error": True,
+        "extractor_args": {
+            "youtube": {
+                "skip": ["dash", "hls", "translated_subs"],
+                "player_skip": ["js"],
+            }
+        },
+    },
+    # Lists the entries of a playlist with their title and duration without extracting each video.
+    PLAYLIST_PROFILE: {
+        "extract_flat": "in_playlist",
+        # Stop listing once the requested playlist_items are reached
+        "lazy_playlist": True,
+        "quiet": True,
+        "no_warnings": True,
+        "ignoreerrors": True,
+    },
+}
+
+# Options that change on every call with the same option set, they are applied to the pooled YoutubeDL
+# only for the call so they don't split the pool into single use instances.
+PER_CALL_OPTIONS = ("playlist_items",)
+
+# Titles yt-dlp gives to the entries of a flat playlist that can't be played
+UNAVAILABLE_PLAYLIST_TITLES = ("[Private video]", "[Deleted video]")
+# Parts of the yt-dlp errors of videos that can't be played by anyone, they don't mean yt-dlp is failing
+UNAVAILABLE_VIDEO_ERRORS = (
+    "video unavailable",
+    "private video",
+    "video has been removed",
+    "video is not available",
+    "video is unavailable",
+    "members-only",
+    "confirm your age",
+)
+
+
+class ExtractorFailedError(Exception):
+    """
+    yt-dlp couldn't extract a video for a reason other than the video being unavailable, ex: Youtube
+    throttling or blocking us. Only these failures and the deadline timeouts count for the circuit breaker.
+    """
+
+
+def is_video_unavailable(error: Exception) -> bool:
+    """
+    Params:
+        * (Exception) error: An error raised by an extraction.
+    Returns:
+        * (Boolean) True if the video is private, deleted, restricted or doesn't exist.
+    """
+    # yt-dlp marks the errors it expects, but the mark is lost when the error comes from a worker process.
+    cause = (getattr(error, "exc_info", None) or (None, None))[1]
+    if getattr(error, "expected", False) or getattr(cause, "expected", False):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in UNAVAILABLE_VIDEO_ERRORS)
+
+
+def slim_info(info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduce a yt-dlp info dict to the fields needed to build a SongInfoDTO.
+    Params:
+        * (Dict) info: The info dict returned by yt-dlp's extract_info.
+    Returns:
+        * (Dict) A copy of the info dict with only the relevant keys and formats.
+    """
+    if not isinstance(info, dict):
+        return info
+
+    formats = info.get("formats") or []
+    audio_formats = [f for f in formats if f.get("acodec") not in (None, "none")]
+    slimmed = {key: info.get(key) for key in SLIM_INFO_KEYS}
+    # Video only formats are dropped unless there is nothing else to fall back to.
+    slimmed["formats"] = [
+        {key: f.get(key) for key in SLIM_FORMAT_KEYS} for f in audio_formats or formats
+    ]
+    return slimmed
+
+
+def slim_playlist(info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduce a yt-dlp flat playlist info dict to the fields needed to build a SongInfoDTO of each entry.
+    Params:
+        * (Dict) info: The info dict returned by yt-dlp's extract_info with extract_flat.
+    Returns:
+        * (Dict) The id, title, size (if yt-dlp knows it) and entries of the playlist. Unavailable entries
+        are None so the position of every other entry is kept.
+    """
+    if not isinstance(info, dict):
+        return info
+
+    entries = []
+    for entry in info.get("entries") or []:
+        if not entry or entry.get("title") in UNAVAILABLE_PLAYLIST_TITLES:
+            entries.append(None)
+            continue
+        # Flat entries list their thumbnails from the smallest to the biggest one.
+        thumbnails = entry.get("thumbnails") or []
+        entries.append(
+            {
+                "id": entry.get("id"),
+                "title": entry.get("title"),
+                "duration": entry.get("duration"),
+                "thumbnail": thumbnails[0].get("url") if thumbnails else None,
+            }
+        )
+    return {
+        "id": info.get("id"),
+        "title": info.get("title"),
+        "count": info.get("playlist_count"),
+        "entries": entries,
+    }
+
+
+# Extractor of a worker process, keeps its own warm YoutubeDL pool
+_worker_extractor = None
+
+
+def extract_in_worker(url: str, opts: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Entry point of the extraction worker processes.
+    Params:
+        * (String) url: The complete url of a Youtube video or a search query.
+        * (Dict) opts: The options to pass to yt-dlp.
+    Returns:
+        * (Dict) The slimmed down info dict of the video or playlist.
+    """
+    global _worker_extractor
+    if _worker_extractor is None:
+        _worker_extractor = YouTubeExtractorService()
+    return _worker_extractor._extract_sync(url, opts)
 
 
 class YouTubeExtractorService:
     def __init__(
-        self, ydl_options: Optional[Dict[str, Any]] = None, test_mode: bool = False
+        self,
+        ydl_options: Optional[Dict[str, Any]] = None,
+        test_mode: bool = False,
+        stream_cache_size: int = 256,
+        stream_cache_margin: float = 600.0,
+        ydl_pool: Optional[YoutubeDLPool] = None,
+        backend: Optional[ExtractionBackend] = None,
+        deadline: float = 90.0,
+        latency_tracker: Optional[LatencyTracker] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
     ):
         self.ydl_options = ydl_options or {}
         self.test_mode = test_mode
+        self.stream_cache = StreamUrlCache(
+            max_entries=stream_cache_size, safety_margin=stream_cache_margin
+        )
+        self.ydl_pool = ydl_pool or YoutubeDLPool()
+        self.backend = backend or ExtractionBackend()
+        self.js_policy = JsRuntimePolicy()
+        # Seconds a song may take to resolve across every attempt
+        self.deadline = deadline
+        self.latency_tracker = latency_tracker or LatencyTracker()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        # Extractions in progress keyed by video id or normalised query, so identical concurrent
+        # requests share a single yt-dlp call.
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def close(self):
+        """
+        Release the warm YoutubeDL instances and worker processes, used when the music cog is unloaded.
+        """
+        self.ydl_pool.clear()
+        self.backend.shutdown()
+
+    def get_video_id(self, url: str) -> Optional[str]:
+        """
+        Get the unique id of a Youtube video from its url.
+        Params:
+            * (String) url: The complete url of a Youtube video or a search query.
+        Returns:
+            * (String | None): The video id, or None if the url isn't a Youtube video url.
+        """
+        if not validators.url(url):
+            return None
+
+        parsed_url = urlparse(url)
+        host = parsed_url.netloc.lower()
+        if host.endswith("youtu.be"):
+            return parsed_url.path.strip("/").split("/")[0] or None
+
+        if "youtube" in host:
+            video_id = parse_qs(parsed_url.query).get("v")
+            if video_id:
+                return video_id[0]
+            path_parts = parsed_url.path.strip("/").split("/")
+            if len(path_parts) == 2 and path_parts[0] in ("shorts", "embed", "live"):
+                return path_parts[1]
+        return None
+
+    def normalize_query(self, query: str) -> str:
+        """
+        Normalise a free text search so equivalent queries are treated as the same one.
+        Params:
+            * (String) query: The text a user searched, ex: "  Bad Bunny   Titi Me Pregunto"
+        Returns:
+            * (String): The normalised query, ex: "bad bunny titi me pregunto"
+        """
+        return " ".join(query.lower().split())
+
+    def _request_key(self, url: str) -> str:
+        video_id = self.get_video_id(url)
+        if video_id:
+            return f"id:{video_id}"
+        if validators.url(url):
+            return f"url:{url}"
+        return f"query:{self.normalize_query(url)}"
 
     def _extract_sync(self, url: str, opts: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -24,16 +262,85 @@ class YouTubeExtractorService:
             * (String) url: The complete url of a Youtube video or a search query.
             * (Dict) opts: The options to pass to yt-dlp.
         Returns:
-            * (Dict) A dictionary with the extracted video information.
+            * (Dict) A slimmed down dictionary with the extracted video information, or with the
+            entries of the playlist for flat extractions.
         """
-        with YoutubeDL(opts) as ydl:
+        pool_opts = {k: v for k, v in opts.items() if k not in PER_CALL_OPTIONS}
+        call_opts = {k: opts[k] for k in PER_CALL_OPTIONS if k in opts}
+        with self.ydl_pool.acquire(pool_opts) as ydl:
+            if opts.get("extract_flat"):
+                ydl.params.update(call_opts)
+                try:
+                    return slim_playlist(ydl.extract_info(url, download=False))
+                finally:
+                    for key in call_opts:
+                        ydl.params.pop(key, None)
             if validators.url(url):
-                return ydl.extract_info(url, download=False)
+                return slim_info(ydl.extract_info(url, download=False))
 
             result = ydl.extract_info(f"ytsearch:{url}", download=False)
             if isinstance(result, dict) and result.get("entries"):
-                return result["entries"][0]
-            return result
+                return slim_info(result["entries"][0])
+            return slim_info(result)
+
+    async def _extract_once(self, url: str, opts: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run _extract_sync in the configured extraction backend.
+        Params:
+            * (String) url: The complete url of a Youtube video or a search query.
+            * (Dict) opts: The options to pass to yt-dlp.
+        Returns:
+            * (Dict) A dictionary with the extracted video information.
+        """
+        start = time.monotonic()
+        if self.backend.uses_processes:
+            info = await self.backend.run(extract_in_worker, url, opts)
+        else:
+            info = await self.backend.run(self._extract_sync, url, opts)
+        self.latency_tracker.record(time.monotonic() - start)
+        return info
+
+    async def _extract(self, url: str, opts: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Extract a video, starting a hedged second attempt if the first one is slower than the
+        configured latency percentile. The first attempt to succeed wins and the other one is cancelled.
+        Only the process backend hedges, cancelling an attempt in the thread backend doesn't stop its
+        thread so every hedge would leave one more yt-dlp call running.
+        Params:
+            * (String) url: The complete url of a Youtube video or a search query.
+            * (Dict) opts: The options to pass to yt-dlp.
+        Returns:
+            * (Dict) A dictionary with the extracted video information.
+        """
+        hedge_delay = self.latency_tracker.hedge_delay()
+        if hedge_delay is None or not self.backend.uses_processes:
+            return await self._extract_once(url, opts)
+
+        pending = {asyncio.create_task(self._extract_once(url, opts))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+            if not done:
+                logger.info(
+                    "Extraction of %s is slower than %.1fs, starting a hedged attempt",
+                    url,
+                    hedge_delay,
+                )
+                pending.add(asyncio.create_task(self._extract_once(url, opts)))
+            error = None
+            while True:
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return attempt.result()
+                    error = attempt.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+        finally:
+            # Also the attempts left when the deadline of _resolve cancels the extraction.
+            for attempt in pending:
+                attempt.cancel()
 
     def _has_audio_formats(self, formats: list[dict]) -> bool:
         return any(
@@ -78,50 +385,204 @@ class YouTubeExtractorService:
         best = max(candidates, key=score)
         return best.get("url"), best.get("format_id")
 
-    async def search(self, url: str, author: str) -> Optional[SongInfoDTO]:
+    async def extract_playlist(
+        self, url: str, start: Optional[int] = None, end: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        List the entries of a Youtube playlist with yt-dlp's flat extraction, it doesn't need a Data API key.
+        Params:
+            * (String) url: The complete url of a Youtube playlist.
+            * (Integer) start: The position of the first entry to list, starting at 1.
+            * (Integer) end: The position of the last entry to list, the whole playlist if None.
+        Returns:
+            * (Dict | None): The id, title and entries of the playlist (see slim_playlist), or None if the
+            extraction failed.
+        """
+        options = {**PROFILE_OPTIONS[PLAYLIST_PROFILE], **self.ydl_options}
+        if start or end:
+            options["playlist_items"] = f"{start or 1}-{end or ''}"
+        try:
+            # Not timed by the latency tracker, a playlist takes far longer than the videos it hedges.
+            if self.backend.uses_processes:
+                return await self.backend.run(extract_in_worker, url, options)
+            return await self.backend.run(self._extract_sync, url, options)
+        except Exception as e:
+            logger.error("yt-dlp playlist extraction failed: %s", e)
+            return None
+
+    async def fetch_metadata(self, url: str, author: str) -> Optional[SongInfoDTO]:
+        """
+        Get only the title, duration and thumbnail of a Youtube video, its source stays empty.
+        Used to display songs that don't need to be played yet.
+        Params:
+            * (String) url: The complete url of a Youtube video or a search query.
+            * (String) author: The name of the user who requested the song.
+        Returns:
+            * (SongInfoDTO | None): The song info, or None if the extraction failed.
+        Raises:
+            * ExtractionUnavailableError: If the circuit breaker is open because too many extractions failed.
+        """
+        return await self.search(url=url, author=author, profile=METADATA_PROFILE)
+
+    async def search(
+        self, url: str, author: str, profile: str = AUDIO_PROFILE
+    ) -> Optional[SongInfoDTO]:
         """
         Search for a YouTube video and extract its info and best audio source URL.
         Params:
             * (String) url: The complete url of a Youtube video or a search query.
             * (String) author: The name of the user who requested the song, used for logging and display purposes.
+            * (String) profile: The extraction profile, AUDIO_PROFILE or METADATA_PROFILE.
         Returns:
             * (Dict) A dictionary with all the relevant info of a song, such as title, duration, thumbnail and url, this info is used to save the song in the music queue and
+        Raises:
+            * ExtractionUnavailableError: If the circuit breaker is open because too many extractions failed.
         """
-        loop = asyncio.get_running_loop()
-        options = self.ydl_options.copy()
+        cached_song = self.stream_cache.get(self.get_video_id(url))
+        if cached_song:
+            # Repeated songs don't need another extraction while their source url is alive.
+            return replace(cached_song, author=author)
+
+        key = f"{profile}:{self._request_key(url)}"
+        task = self._inflight.get(key)
+        if task is None:
+            # Fails fast with ExtractionUnavailableError while Youtube keeps failing us.
+            self.circuit_breaker.check()
+            task = asyncio.create_task(self._resolve(url, profile))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget_inflight(key, done))
+
+        # Shielded so a caller giving up (ex: a cancelled prefetch) doesn't cancel it for the rest.
+        song = await asyncio.shield(task)
+        if song is None:
+            return None
+        return replace(song, author=author)
 
+    def _forget_inflight(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def _resolve(self, url: str, profile: str) -> Optional[SongInfoDTO]:
+        """
+        Extract the info and best audio source of a video, shared by every caller of search waiting on it.
+        Params:
+            * (String) url: The complete url of a Youtube video or a search query.
+            * (String) profile: The extraction profile, AUDIO_PROFILE or METADATA_PROFILE.
+        Returns:
+            * (SongInfoDTO | None): The song without author, or None if the extraction failed.
+        """
+        song = None
+        # Stays True if the extraction raised, None if it was cancelled before it finished
+        failed = True
         try:
-            info = await loop.run_in_executor(
-                None, lambda: self._extract_sync(url, options)
+            async with asyncio.timeout(self.deadline or None):
+                if profile == METADATA_PROFILE:
+                    song = await self._resolve_metadata(url)
+                else:
+                    song = await self._resolve_attempts(url)
+            failed = False
+        except TimeoutError:
+            logger.error(
+                "Resolving %s took longer than the %ss deadline", url, self.deadline
             )
-        except Exception:
+        except ExtractorFailedError as e:
+            logger.error("yt-dlp failed to extract %s: %s", url, e)
+        except asyncio.CancelledError:
+            failed = None
+            raise
+        finally:
+            if failed is None:
+                # A cancelled extraction says nothing about Youtube, but a trial must let the next one start.
+                self.circuit_breaker.release_trial()
+            else:
+                # A video that isn't available is a normal answer, only the failures open the breaker.
+                self.circuit_breaker.record(succeeded=not failed)
+        return song
+
+    async def _resolve_metadata(self, url: str) -> Optional[SongInfoDTO]:
+        """
+        Extract only the metadata of a video with the metadata profile.
+        Params:
+            * (String) url: The complete url of a Youtube video or a search query.
+        Returns:
+            * (SongInfoDTO | None): The song without author nor source, or None if the extraction failed.
+        """
+        options = {**PROFILE_OPTIONS[METADATA_PROFILE], **self.ydl_options}
+        try:
+            info = await self._extract(url, options)
+        except Exception as e:
+            if not is_video_unavailable(e):
+                raise ExtractorFailedError(e) from e
+            logger.info("Video %s is not available: %s", url, e)
+            return None
+
+        if not info or not info.get("title"):
+            return None
+        return SongInfoDTO(
+            author="",
+            url=info.get("webpage_url") or url,
+            title=info.get("title") or "",
+            duration=float(info.get("duration") or 0.0),
+            thumbnail=info.get("thumbnail"),
+        )
+
+    async def _resolve_attempts(self, url: str) -> Optional[SongInfoDTO]:
+        """
+        Run the extraction attempts of a video, starting with the js_runtimes option set the policy learned.
+        Params:
+            * (String) url: The complete url of a Youtube video or a search query.
+        Returns:
+            * (SongInfoDTO | None): The song without author, or None if the extraction failed.
+        """
+        video_id = self.get_video_id(url)
+        start_with_js = self.js_policy.needs_js(video_id)
+        info = None
+        # If the attempt that returned audio formats used js_runtimes, None if none did
+        working_attempt = None
+        last_error = None
+
+        # Try the option set the policy learned first, then fall back to the other one.
+        for with_js in (start_with_js, not start_with_js):
+            options = {**PROFILE_OPTIONS[AUDIO_PROFILE], **self.ydl_options}
+            if with_js:
+                options["js_runtimes"] = {"node": {}}
             try:
-                retry_opts = options.copy()
-                retry_opts["js_runtimes"] = {"node": {}}
-                info = await loop.run_in_executor(
-                    None, lambda: self._extract_sync(url, retry_opts)
-                )
+                attempt_info = await self._extract(url, options)
             except Exception as e:
-                logger.error("yt-dlp extract_info failed: %s", e)
-                return None
+                if is_video_unavailable(e):
+                    # The other option set won't make it available.
+                    logger.info("Video %s is not available: %s", url, e)
+                    return None
+                last_error = e
+                logger.warning(
+                    "yt-dlp extraction failed (js_runtimes=%s): %s", with_js, e
+                )
+                continue
+
+            # Without audio formats the info is still kept as a last resort.
+            info = info or attempt_info
+            if self._has_audio_formats(attempt_info.get("formats") or []):
+                info = attempt_info
+                working_attempt = with_js
+                break
 
+        if info is None:
+            raise ExtractorFailedError(last_error) from last_error
+
+        if working_attempt is not None:
+            self.js_policy.record(
+                video_id=info.get("id") or video_id,
+                started_with_js=start_with_js,
+                needed_js=working_attempt,
+            )
         formats = info.get("formats") or []
-        if not self._has_audio_formats(formats):
-            try:
-                retry_opts = options.copy()
-                retry_opts["js_runtimes"] = {"node": {}}
-                info = await loop.run_in_executor(
-                    None, lambda: self._extract_sync(url, retry_opts)
-                )
-                formats = info.get("formats") or []
-            except Exception as e:
-                logger.warning("yt-dlp retry with js_runtimes failed: %s", e)
 
         if self.test_mode:
             try:
                 logger.debug(
                     "[yt-dlp] formats for %s: %d entries", info.get("id"), len(formats)
                 )
+                logger.debug("[yt-dlp] js_runtimes policy: %s", self.js_policy.stats())
                 for f in formats:
                     logger.debug(
                         "  %s\t%s\tacodec=%s\tabr=%s\ttbr=%s\t%s",
@@ -137,8 +598,8 @@ class YouTubeExtractorService:
 
         source_url, selected_format_id = self._select_best_audio_source(formats)
 
-        return SongInfoDTO(
-            author=author,
+        song = SongInfoDTO(
+            author="",
             url=info.get("webpage_url") or "",
             title=info.get("title") or "",
             duration=float(info.get("duration") or 0.0),
@@ -146,3 +607,5 @@ class YouTubeExtractorService:
             thumbnail=info.get("thumbnail"),
             format_id=selected_format_id,
         )
+        self.stream_cache.put(info.get("id"), song)
+        return song
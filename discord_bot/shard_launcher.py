@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import logging
+import math
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+
+import django
+
+logger = logging.getLogger(__name__)
+
+from discord_bot.settings import BOT_SHARD_COUNT, BOT_SHARD_PROCESSES, DISCORD_TOKEN
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "discord_bot.settings")
+django.setup()
+
+from music_bot.http_client import HttpClient
+
+DISCORD_GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
+# Seconds between two shard identifies of the same rate limit bucket
+SHARD_IDENTIFY_INTERVAL = 5.0
+# A shard process that ran this long is considered healthy and its restart delay starts over
+HEALTHY_RUN_SECONDS = 300.0
+# Seconds before the first restart, doubled on every crash in a row
+RESTART_BACKOFF = 1.0
+MAX_RESTART_BACKOFF = 60.0
+# Seconds a shard process has to close its connections before it is killed
+STOP_TIMEOUT = 15.0
+
+MARMOBOT_PATH = Path(__file__).resolve().parent / "marmoBot.py"
+
+
+def split_shards(shard_count: int, processes: int) -> list[list[int]]:
+    """
+    Spread the shards in contiguous ranges of about the same size, one per process.
+    Params:
+        * (Integer) shard_count: The total number of shards.
+        * (Integer) processes: The number of worker processes, capped to the number of shards.
+    Returns:
+        * (List) The shard ids of each process.
+    """
+    processes = max(min(processes, shard_count), 1)
+    size, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for index in range(processes):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def fetch_gateway_limits() -> tuple[int, int]:
+    """
+    Ask Discord for the recommended shard count of the bot.
+    Returns:
+        * (Tuple) The recommended shard count and how many shards can identify at the same time.
+    Raises:
+        * RuntimeError: If Discord didn't answer with the recommendation, ex: the token is invalid.
+    """
+    http_client = HttpClient()
+    try:
+        response = await http_client.get_json(
+            DISCORD_GATEWAY_BOT_URL, headers={"Authorization": f"Bot {DISCORD_TOKEN}"}
+        )
+    finally:
+        await http_client.close()
+    if response.status != 200 or "shards" not in response.data:
+        raise RuntimeError(
+            f"Discord didn't recommend a shard count (status {response.status})"
+        )
+    max_concurrency = response.data.get("session_start_limit", {}).get(
+        "max_concurrency", 1
+    )
+    return response.data["shards"], max_concurrency
+
+
+class ShardProcess:
+    """
+    A worker process running marmoBot.py with a range of shards, restarted with an exponential backoff
+    when it exits with an error.
+    """
+
+    def __init__(self, shard_ids: list[int], shard_count: int):
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.process = None
+        self.restarts = 0
+
+    @property
+    def name(self) -> str:
+        return f"shards {self.shard_ids[0]}-{self.shard_ids[-1]}/{self.shard_count}"
+
+    async def _start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            str(MARMOBOT_PATH),
+            "--shard-count",
+            str(self.shard_count),
+            "--shard-ids",
+            *[str(shard_id) for shard_id in self.shard_ids],
+        )
+        logger.info("Started %s (pid %s)", self.name, self.process.pid)
+
+    async def stop(self):
+        """
+        Terminate the worker process, killing it if it doesn't exit in STOP_TIMEOUT seconds.
+        """
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout=STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("%s didn't stop in time, killing it", self.name)
+            self.process.kill()
+            await self.process.wait()
+
+    async def supervise(self, stopping: asyncio.Event, start_delay: float = 0.0):
+        """
+        Run the worker process until the launcher stops, restarting it every time it crashes.
+        Params:
+            * (asyncio.Event) stopping: Set when the launcher is stopping.
+            * (Float) start_delay: Seconds to wait before the first start, so the shards identify in turns.
+        """
+        backoff = RESTART_BACKOFF
+        delay = start_delay
+        while True:
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+            started_at = time.monotonic()
+            await self._start()
+            waiting = asyncio.create_task(self.process.wait())
+            stopped = asyncio.create_task(stopping.wait())
+            await asyncio.wait({waiting, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            stopped.cancel()
+            if stopping.is_set():
+                waiting.cancel()
+                await self.stop()
+                return
+
+            returncode = self.process.returncode
+            if returncode == 0:
+                logger.info("%s exited", self.name)
+                return
+            if time.monotonic() - started_at >= HEALTHY_RUN_SECONDS:
+                backoff = RESTART_BACKOFF
+            self.restarts += 1
+            logger.error(
+                "%s crashed with code %s, restarting in %.0f seconds",
+                self.name,
+                returncode,
+                backoff,
+            )
+            delay = backoff
+            backoff = min(backoff * 2, MAX_RESTART_BACKOFF)
+
+
+async def launch(shard_count=None, processes=None):
+    """
+    Start the worker processes of the shards and supervise them until the launcher gets SIGINT or SIGTERM.
+    Params:
+        * (Integer) shard_count: The total number of shards, Discord's recommendation if None.
+        * (Integer) processes: The number of worker processes, one per CPU if None.
+    """
+    max_concurrency = 1
+    if shard_count is None:
+        shard_count, max_concurrency = await fetch_gateway_limits()
+    processes = processes or os.cpu_count() or 1
+
+    shard_processes = [
+        ShardProcess(shard_ids, shard_count)
+        for shard_ids in split_shards(shard_count, processes)
+    ]
+    logger.info(
+        "Launching %s shards in %s processes", shard_count, len(shard_processes)
+    )
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(stop_signal, stopping.set)
+
+    # Every process identifies its shards one bucket at a time, so the next one starts after them.
+    start_delay = 0.0
+    supervisors = []
+    for shard_process in shard_processes:
+        supervisors.append(shard_process.supervise(stopping, start_delay))
+        start_delay += (
+            math.ceil(len(shard_process.shard_ids) / max_concurrency)
+            * SHARD_IDENTIFY_INTERVAL
+        )
+    await asyncio.gather(*supervisors)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the bot sharded across worker processes and restart the ones that crash."
+    )
+    parser.add_argument("--shard-count", type=int, default=BOT_SHARD_COUNT)
+    parser.add_argument("--processes", type=int, default=BOT_SHARD_PROCESSES)
+    args = parser.parse_args()
+
+    asyncio.run(launch(shard_count=args.shard_count, processes=args.processes))